@@ -0,0 +1,455 @@
+"""
+Nyílt hurkú terhelésgenerátor és mérőkeret a három ingress protokollhoz (REST, SOAP, WebSocket).
+
+A color_producer_* szkriptek zárt hurkúak (küldés, válasz, alvás), ezért kapacitást nem mérnek:
+ha a szolgáltatás lassul, a producer is lassabban küld, és a késleltetés szépnek látszik
+(coordinated omission). Ez az eszköz két módban hajt:
+
+- open: a kérések előre ütemezett időpontokban indulnak (egyenletes vagy Poisson érkezés, opcionális
+  löketekkel); ha minden worker foglalt, a kérés sorban áll, és a várakozás is a késleltetés része.
+  A "corrected" hisztogram a tervezett indulástól méri a választ (coordinated omission korrekció),
+  a "service" hisztogram csak a tényleges kérés idejét.
+- max: BENCH_CONCURRENCY worker folyamatosan, szünet nélkül küld (a maximális áteresztőképesség).
+
+Használat:
+    python benchmark/load_generator.py rest soap websocket
+
+Beállítások (környezeti változók):
+    BENCH_MODE         open | max (alapértelmezés: open)
+    BENCH_RATE         célráta open módban, kérés/s (200)
+    BENCH_DURATION     a mérés hossza másodpercben, a bemelegítéssel együtt (30)
+    BENCH_WARMUP       az első ennyi másodperc nem kerül a statisztikába (2)
+    BENCH_CONCURRENCY  worker szálak (kapcsolatok) száma (16)
+    BENCH_ARRIVALS     uniform | poisson (uniform)
+    BENCH_COLOR_MIX    színarányok, pl. "RED=2,GREEN=1,BLUE=1" (egyenletes)
+    BENCH_BURST        löket: "szorzó:hossz:periódus" másodpercben, pl. "5:1:10" (nincs)
+    BENCH_DRAIN        a mérés vége után ennyi ideig dolgozzuk még fel a sorban állókat (10)
+    BENCH_TIMEOUT      kérésenkénti időkorlát másodpercben (5)
+    BENCH_SEED         a színek és a Poisson érkezések véletlenmagja (1)
+    BENCH_OUTPUT       az eredményfájl (benchmark_results.json)
+
+Az eredmény protokollonként: küldött / sikeres / hibás kérések (hibatípusonként), áteresztőképesség,
+p50 / p90 / p99 / p999 / max késleltetés, és a vödrös hisztogramok (common.tracing.LatencyHistogram),
+amelyek több futás között összevonhatók.
+"""
+import os
+import sys
+import json
+import time
+import queue
+import random
+import socket
+import logging
+import threading
+from contextlib import ExitStack
+from datetime import datetime, timezone
+
+import requests
+
+# A közös modulok (common/) a projekt gyökeréből érhetők el
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.log_config import configure_logging
+from common.tracing import LatencyHistogram
+
+# Beállítjuk a naplózást
+configure_logging()
+logger = logging.getLogger("load_generator")
+
+# Az ingress szolgáltatások elérhetősége (a producerekkel azonos alapértékek)
+REST_API_URL = os.environ.get('REST_API_URL', 'http://localhost:5000/api/colors')
+SOAP_HOST = os.environ.get('SOAP_SERVICE_HOST', 'localhost')
+SOAP_PORT = os.environ.get('SOAP_SERVICE_PORT', '8000')
+SOAP_URL = os.environ.get('SOAP_URL', f'http://{SOAP_HOST}:{SOAP_PORT}/')
+SOAP_NAMESPACE = 'http://color.service.example'
+WEBSOCKET_URL = os.environ.get('WEBSOCKET_URL', 'ws://localhost:8765')
+
+MODE_OPEN = 'open'
+MODE_MAX = 'max'
+
+BENCH_MODE = os.environ.get('BENCH_MODE', MODE_OPEN)
+BENCH_RATE = float(os.environ.get('BENCH_RATE', 200))
+BENCH_DURATION = float(os.environ.get('BENCH_DURATION', 30))
+BENCH_WARMUP = float(os.environ.get('BENCH_WARMUP', 2))
+BENCH_CONCURRENCY = int(os.environ.get('BENCH_CONCURRENCY', 16))
+BENCH_ARRIVALS = os.environ.get('BENCH_ARRIVALS', 'uniform')
+BENCH_COLOR_MIX = os.environ.get('BENCH_COLOR_MIX', 'RED=1,GREEN=1,BLUE=1')
+BENCH_BURST = os.environ.get('BENCH_BURST', '')
+BENCH_DRAIN = float(os.environ.get('BENCH_DRAIN', 10))
+BENCH_TIMEOUT = float(os.environ.get('BENCH_TIMEOUT', 5))
+BENCH_SEED = int(os.environ.get('BENCH_SEED', 1))
+BENCH_OUTPUT = os.environ.get('BENCH_OUTPUT', 'benchmark_results.json')
+
+PERCENTILES = (("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("p999", 0.999), ("max", 1.0))
+
+# A worker ezzel jelzi, hogy a kérés el sem indult (a drain időkorlát lejárt)
+NOT_SENT = "not_sent"
+
+
+def parse_color_mix(spec):
+    """
+    "RED=2,GREEN=1,BLUE=1" -> (["RED", "GREEN", "BLUE"], [2.0, 1.0, 1.0])
+    """
+    colors, weights = [], []
+    for item in spec.split(','):
+        if not item.strip():
+            continue
+        color, _, weight = item.partition('=')
+        colors.append(color.strip().upper())
+        weights.append(float(weight) if weight else 1.0)
+    if not colors or sum(weights) <= 0:
+        raise ValueError(f"Invalid color mix: {spec!r}")
+    return colors, weights
+
+
+def parse_burst(spec):
+    """
+    "szorzó:hossz:periódus" -> (szorzó, hossz, periódus); üres spec esetén None
+    """
+    if not spec:
+        return None
+    factor, length, period = (float(part) for part in spec.split(':'))
+    if factor <= 0 or length < 0 or period <= 0:
+        raise ValueError(f"Invalid burst profile: {spec!r}")
+    return factor, length, period
+
+
+def rate_at(offset, rate, burst):
+    """
+    A pillanatnyi célráta: löket alatt a periódus elején hossz másodpercig rate * szorzó.
+    """
+    if burst is not None:
+        factor, length, period = burst
+        if offset % period < length:
+            return rate * factor
+    return rate
+
+
+def schedule(rate, duration, arrivals, burst, rng):
+    """
+    A tervezett indulási időpontok (másodperc a mérés kezdetétől) a célráta és a löketprofil szerint.
+    """
+    offset = 0.0
+    while offset < duration:
+        yield offset
+        current = rate_at(offset, rate, burst)
+        offset += rng.expovariate(current) if arrivals == 'poisson' else 1.0 / current
+
+
+# ---- célpontok: workerenként egy példány, saját kapcsolattal ----
+
+class RestTarget:
+    """
+    POST /api/colors {"color": ...}, keep-alive sessionnel.
+    """
+
+    def __init__(self):
+        self.session = requests.Session()
+
+    def send(self, color):
+        """
+        :return: None siker esetén, különben a hiba rövid típusa
+        """
+        response = self.session.post(REST_API_URL, json={"color": color}, timeout=BENCH_TIMEOUT)
+        if response.status_code != 200:
+            return f"http_{response.status_code}"
+        return None
+
+    def close(self):
+        self.session.close()
+
+
+class SoapTarget:
+    """
+    send_color_to_queue hívás kézzel összeállított SOAP 1.1 borítékkal: a zeep kliensoldali
+    költsége nem torzítja a szolgáltatás mérését.
+    """
+
+    ENVELOPE = (
+        '<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/" '
+        f'xmlns:tns="{SOAP_NAMESPACE}">'
+        '<soapenv:Body><tns:send_color_to_queue><tns:color>{color}</tns:color>'
+        '</tns:send_color_to_queue></soapenv:Body></soapenv:Envelope>'
+    )
+    HEADERS = {"Content-Type": "text/xml; charset=utf-8", "SOAPAction": "send_color_to_queue"}
+
+    def __init__(self):
+        self.session = requests.Session()
+        self.envelopes = {}
+
+    def send(self, color):
+        body = self.envelopes.get(color)
+        if body is None:
+            body = self.envelopes[color] = self.ENVELOPE.replace('{color}', color).encode('utf-8')
+        response = self.session.post(SOAP_URL, data=body, headers=self.HEADERS, timeout=BENCH_TIMEOUT)
+        if response.status_code != 200:
+            return f"http_{response.status_code}"
+        # A szolgáltatás a hibát is 200-as válasz szövegében adja vissza
+        if b"successfully sent" not in response.content:
+            return "rejected"
+        return None
+
+    def close(self):
+        self.session.close()
+
+
+class WebSocketTarget:
+    """
+    Egyszerű mód: {"color": ...} -> success / error válasz, kapcsolatonként egy kérés van úton.
+    """
+
+    def __init__(self):
+        from websockets.sync.client import connect
+        self.stack = ExitStack()
+        self.websocket = self.stack.enter_context(connect(WEBSOCKET_URL, open_timeout=BENCH_TIMEOUT))
+        self.websocket.recv(timeout=BENCH_TIMEOUT)  # üdvözlő üzenet
+
+    def send(self, color):
+        self.websocket.send(json.dumps({"color": color}))
+        response = json.loads(self.websocket.recv(timeout=BENCH_TIMEOUT))
+        if response.get("type") != "success":
+            return "rejected"
+        return None
+
+    def close(self):
+        self.stack.close()
+
+
+TARGETS = {
+    "rest": RestTarget,
+    "soap": SoapTarget,
+    "websocket": WebSocketTarget,
+}
+
+
+class Recorder:
+    """
+    Egy worker mérései; zár nélkül írja a saját szála, a végén összevonjuk őket.
+    """
+
+    def __init__(self):
+        self.corrected = LatencyHistogram()
+        self.service = LatencyHistogram()
+        self.sent = 0
+        self.ok = 0
+        self.errors = {}
+        self.last_completion = None
+
+    def record(self, intended, started, finished, error):
+        self.sent += error != NOT_SENT
+        self.corrected.record(finished - intended)
+        if error is None:
+            self.ok += 1
+            self.service.record(finished - started)
+        else:
+            self.errors[error] = self.errors.get(error, 0) + 1
+        self.last_completion = finished
+
+    def merge(self, other):
+        self.corrected.merge(other.corrected)
+        self.service.merge(other.service)
+        self.sent += other.sent
+        self.ok += other.ok
+        for error, count in other.errors.items():
+            self.errors[error] = self.errors.get(error, 0) + count
+        if other.last_completion is not None:
+            self.last_completion = max(self.last_completion or 0, other.last_completion)
+
+
+def connect(target_class):
+    try:
+        return target_class()
+    except Exception as e:
+        logger.warning(f"Cannot connect: {e}")
+        return None
+
+
+def call(target_class, target, color):
+    """
+    Egy kérés; kivétel esetén a kapcsolatot eldobjuk, és a következő kérés újat nyit.
+
+    :return: (None vagy a hiba rövid típusa, a továbbiakban használható célpont vagy None)
+    """
+    try:
+        if target is None:
+            target = target_class()
+        return target.send(color), target
+    except Exception as e:
+        if target is not None:
+            try:
+                target.close()
+            except Exception:
+                pass
+        return type(e).__name__, None
+
+
+def run_open_worker(target_class, jobs, recorder, measure_from, drain_deadline):
+    target = connect(target_class)
+    try:
+        while True:
+            job = jobs.get()
+            if job is None:
+                return
+            intended, color = job
+            now = time.perf_counter()
+            if now > drain_deadline:
+                # A drain ideje lejárt: a kérés el sem indul, a várakozása így is beszámít
+                if intended >= measure_from:
+                    recorder.record(intended, now, now, NOT_SENT)
+                continue
+            error, target = call(target_class, target, color)
+            if intended >= measure_from:
+                recorder.record(intended, now, time.perf_counter(), error)
+    finally:
+        if target is not None:
+            target.close()
+
+
+def run_max_worker(target_class, colors, weights, seed, recorder, start, measure_from, stop_at):
+    rng = random.Random(seed)
+    target = connect(target_class)
+    # Egyszerre indulunk, a kapcsolódás ideje nem számít bele
+    time.sleep(max(0.0, start - time.perf_counter()))
+    try:
+        while True:
+            started = time.perf_counter()
+            if started >= stop_at:
+                return
+            error, target = call(target_class, target, rng.choices(colors, weights)[0])
+            if started >= measure_from:
+                recorder.record(started, started, time.perf_counter(), error)
+    finally:
+        if target is not None:
+            target.close()
+
+
+def run_protocol(protocol):
+    """
+    Egy protokoll mérése a beállított módban; az eredményt dict-ként adja vissza.
+    """
+    target_class = TARGETS[protocol]
+    colors, weights = parse_color_mix(BENCH_COLOR_MIX)
+    burst = parse_burst(BENCH_BURST)
+    recorders = [Recorder() for _ in range(BENCH_CONCURRENCY)]
+    start = time.perf_counter() + 0.1  # a szálak elindulására hagyunk egy kis időt
+    measure_from = start + BENCH_WARMUP
+    stop_at = start + BENCH_DURATION
+
+    logger.info(f"Benchmarking {protocol}: mode={BENCH_MODE}, rate={BENCH_RATE}/s, duration={BENCH_DURATION}s, "
+                f"concurrency={BENCH_CONCURRENCY}, burst={BENCH_BURST or 'none'}")
+
+    if BENCH_MODE == MODE_MAX:
+        workers = [
+            threading.Thread(target=run_max_worker, daemon=True,
+                             args=(target_class, colors, weights, BENCH_SEED + index, recorder, start, measure_from,
+                                   stop_at))
+            for index, recorder in enumerate(recorders)
+        ]
+        for worker in workers:
+            worker.start()
+    else:
+        jobs = queue.Queue()
+        drain_deadline = stop_at + BENCH_DRAIN
+        workers = [
+            threading.Thread(target=run_open_worker, daemon=True,
+                             args=(target_class, jobs, recorder, measure_from, drain_deadline))
+            for recorder in recorders
+        ]
+        for worker in workers:
+            worker.start()
+
+        # Az ütemező nem vár a válaszokra: a tervezett időpontban akkor is beteszi a kérést, ha minden worker foglalt
+        rng = random.Random(BENCH_SEED)
+        for offset in schedule(BENCH_RATE, BENCH_DURATION, BENCH_ARRIVALS, burst, rng):
+            intended = start + offset
+            delay = intended - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            jobs.put((intended, rng.choices(colors, weights)[0]))
+        backlog = jobs.qsize()
+        if backlog:
+            logger.warning(f"{protocol}: {backlog} requests still queued at the end of the schedule")
+        for _ in workers:
+            jobs.put(None)
+
+    for worker in workers:
+        worker.join()
+
+    total = Recorder()
+    for recorder in recorders:
+        total.merge(recorder)
+    return summarize(protocol, total, measure_from, colors, weights)
+
+
+def latency_summary(histogram):
+    """
+    A hisztogram percentilisei ms-ban (a vödör felső határa, így sosem becsül alá).
+    """
+    return {
+        name: (round(histogram.percentile(fraction) / 1000, 3) if histogram.total else None)
+        for name, fraction in PERCENTILES
+    }
+
+
+def summarize(protocol, total, measure_from, colors, weights):
+    elapsed = max(1e-9, (total.last_completion or measure_from) - measure_from)
+    attempted = total.sent + total.errors.get(NOT_SENT, 0)
+    failed = sum(total.errors.values())
+    return {
+        "protocol": protocol,
+        "mode": BENCH_MODE,
+        "target_rate": BENCH_RATE if BENCH_MODE == MODE_OPEN else None,
+        "arrivals": BENCH_ARRIVALS if BENCH_MODE == MODE_OPEN else None,
+        "burst": BENCH_BURST or None,
+        "concurrency": BENCH_CONCURRENCY,
+        "duration_s": BENCH_DURATION,
+        "warmup_s": BENCH_WARMUP,
+        "color_mix": dict(zip(colors, weights)),
+        "requests": attempted,
+        "sent": total.sent,
+        "ok": total.ok,
+        "errors": total.errors,
+        "error_rate": round(failed / attempted, 6) if attempted else 0.0,
+        "throughput_rps": round(total.ok / elapsed, 2),
+        "latency_ms": {
+            "corrected": latency_summary(total.corrected),
+            "service": latency_summary(total.service)
+        },
+        # µs vödrök (common.tracing), több futás eredménye vödrönként összeadható
+        "histograms": {
+            "corrected": total.corrected.counts,
+            "service": total.service.counts
+        }
+    }
+
+
+def main(protocols):
+    unknown = [protocol for protocol in protocols if protocol not in TARGETS]
+    if unknown or not protocols:
+        logger.error(f"Usage: load_generator.py {' | '.join(TARGETS)} [...]; unknown: {unknown}")
+        return 2
+    if BENCH_MODE not in (MODE_OPEN, MODE_MAX):
+        logger.error(f"Unknown BENCH_MODE: {BENCH_MODE}")
+        return 2
+
+    started = datetime.now(timezone.utc).isoformat()
+    results = []
+    for protocol in protocols:
+        result = run_protocol(protocol)
+        results.append(result)
+        latency = result["latency_ms"]["corrected"]
+        logger.info(f"{protocol}: {result['ok']}/{result['requests']} ok, {result['throughput_rps']} req/s, "
+                    f"error rate {result['error_rate']:.2%}, p50={latency['p50']}ms p99={latency['p99']}ms "
+                    f"p999={latency['p999']}ms")
+
+    with open(BENCH_OUTPUT, 'w') as output:
+        json.dump({
+            "started": started,
+            "host": socket.gethostname(),
+            "results": results
+        }, output, indent=2)
+    logger.info(f"Results written to {BENCH_OUTPUT}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
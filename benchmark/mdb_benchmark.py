@@ -0,0 +1,486 @@
+"""
+Az mdb/ fogyasztási stratégiáinak összehasonlító mérése ugyanazon a (rögzített) terhelésen.
+
+Minden stratégia a folyamaton belüli brokeren (common.transport, TRANSPORT=memory) fut, így a mérés
+hermetikus és megismételhető, és csak a fogyasztók saját költségét és a stratégia okozta fölösleges
+kézbesítéseket látjuk, a hálózatot és a RabbitMQ-t nem. A stratégiák a valódi ColorMessageProcessor /
+AsyncColorProcessor / ColorDispatcher osztályokat használják, változtatás nélkül.
+
+Mérési módok (BENCH_MODE):
+- backlog: a teljes terhelést a fogyasztók indítása előtt a sorokba tesszük, és a kiürülésig mérünk
+  (tiszta fogyasztói áteresztőképesség; a késleltetés itt a backlog kiürítésének ideje)
+- rate: a fogyasztók indítása után BENCH_RATE üzenet/s ütemben publikálunk (a késleltetés a
+  publikálástól a hasznos feldolgozásig eltelt idő, ez a farok-késleltetés mérésére való)
+
+Stratégiánként mért értékek:
+- useful: a megfelelő színű feldolgozóhoz eljutott és feldolgozott üzenetek, lost: amelyek nem
+  (ack-all esetén a "nem az én színem" üzenetek, dead-letter esetén a DLQ-ba kerültek)
+- throughput_per_s: hasznos üzenet / s
+- wasted_per_useful: (összes kézbesítés - hasznos) / hasznos
+- redelivered, requeued, dead_lettered: a broker számlálói
+- cpu_us_per_message: a folyamat CPU-ideje hasznos üzenetenként (rate módban a publikálóé is)
+- latency_ms: p50 / p90 / p99 / p999 / max (publikálás -> hasznos feldolgozás)
+
+Használat:
+    python benchmark/mdb_benchmark.py                       # minden stratégia
+    python benchmark/mdb_benchmark.py requeue routing_keys  # csak a megadottak
+
+Beállítások (környezeti változók):
+    BENCH_MODE         backlog | rate (backlog)
+    BENCH_MESSAGES     a terhelés üzeneteinek száma (30000)
+    BENCH_RATE         rate módban üzenet/s (2000)
+    BENCH_COLOR_MIX    színarányok, pl. "RED=2,GREEN=1,BLUE=1" (egyenletes)
+    BENCH_SEED         a terhelés véletlenmagja (1)
+    BENCH_WORKLOAD     JSON fájl a rögzített színsorozattal: ha létezik, ezt használjuk, különben ide mentjük
+    BENCH_WORKERS      a multiprocessing stratégia workereinek száma (3)
+    BENCH_TIMEOUT      stratégiánkénti időkorlát másodpercben (120)
+    BENCH_OUTPUT       az eredményfájl (mdb_benchmark_results.json)
+    BENCH_REDELIVER_ELSEWHERE
+                       1 = a visszarakott üzenetet a broker nem adja vissza azonnal ugyanannak a
+                       fogyasztónak (1). A memory broker szinkron kézbesítése miatt prefetch=1 mellett
+                       a requeue-s stratégiák (requeue, single_queue_reject) enélkül beragadnak: a
+                       saját üzenetüket kapják vissza, és időkorlátig szinte semmi hasznosat nem
+                       dolgoznak fel. A RabbitMQ a visszarakott üzenetet aszinkron kézbesíti, így ott
+                       a többi fogyasztó is hozzájut; a redelivery- és wasted-számok ezért a RabbitMQ
+                       alsó becslései. 0 = a MemoryBroker alapértelmezése; az eredményfájl rögzíti.
+
+Az időkorlátig ki nem ürült stratégiák "completed": false jelölést kapnak, mérőszámok nélkül
+(csak a hátralévő üzenetek száma és a broker számlálói kerülnek be), mert a részeredmény félrevezető.
+
+A fogyasztók a szokásos beállításaikat használják (CONSUMER_MODE, HANDLER_THREADS, ADAPTIVE_PREFETCH,
+PREFETCH_MIN / PREFETCH_MAX, HANDLER_CONCURRENCY, ...); ezek értéke az eredményfájlba is bekerül.
+A fogyasztók loggereit (QUIET_LOGGERS) WARNING szintre állítjuk, hogy az üzenetenkénti INFO sorok ne
+torzítsák a mérést; az eredmények INFO szinten jelennek meg.
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import logging
+import importlib
+import threading
+from datetime import datetime, timezone
+
+# A mérés mindig a folyamaton belüli brokeren fut; ezt a közös modulok importja előtt kell beállítani
+os.environ['TRANSPORT'] = 'memory'
+os.environ.setdefault('METRICS_PORT', '0')
+# A késleltetést az üzenetek bélyegeiből mérjük (common.tracing), ezért a követés itt nem kapcsolható ki
+os.environ['TRACE_MESSAGES'] = '1'
+
+# A közös modulok (common/) a projekt gyökeréből, a stratégiák az mdb/ könyvtárból érhetők el
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'mdb'))
+from common.log_config import configure_logging
+from common.color_codec import ColorCodec, CODEC_BINARY
+from common.color_routing import COLORS, COLOR_QUEUE, COLOR_HEADERS_EXCHANGE, ROUTING_HEADERS, ROUTING_QUEUE, \
+    declare_headers_routing
+from common.stats_aggregator import OUTCOME_ACKED
+from common.tracing import KIND_QUEUE_DWELL, LatencyHistogram, now_us
+from common.transport import BROKER, MemoryConnection, embed
+from load_generator import parse_color_mix, latency_summary
+
+# Beállítjuk a naplózást
+configure_logging()
+logger = logging.getLogger("mdb_benchmark")
+
+# A fogyasztók üzenetenként naplóznak; ezeket a loggereket csendesítjük, a sajátunkat nem
+QUIET_LOGGERS = ("color_processor", "handler_offload", "prefetch_controller", "worker_runtime")
+for _name in QUIET_LOGGERS:
+    logging.getLogger(_name).setLevel(logging.WARNING)
+
+MODE_BACKLOG = 'backlog'
+MODE_RATE = 'rate'
+
+BENCH_MODE = os.environ.get('BENCH_MODE', MODE_BACKLOG)
+BENCH_MESSAGES = int(os.environ.get('BENCH_MESSAGES', 30000))
+BENCH_RATE = float(os.environ.get('BENCH_RATE', 2000))
+BENCH_COLOR_MIX = os.environ.get('BENCH_COLOR_MIX', 'RED=1,GREEN=1,BLUE=1')
+BENCH_SEED = int(os.environ.get('BENCH_SEED', 1))
+BENCH_WORKLOAD = os.environ.get('BENCH_WORKLOAD', '')
+BENCH_WORKERS = int(os.environ.get('BENCH_WORKERS', 3))
+BENCH_TIMEOUT = float(os.environ.get('BENCH_TIMEOUT', 120))
+BENCH_OUTPUT = os.environ.get('BENCH_OUTPUT', 'mdb_benchmark_results.json')
+BENCH_REDELIVER_ELSEWHERE = os.environ.get('BENCH_REDELIVER_ELSEWHERE', '1') == '1'
+
+# A fogyasztók viselkedését befolyásoló beállítások (az eredményfájlba kerülnek)
+CONSUMER_SETTINGS = ('CONSUMER_MODE', 'HANDLER_THREADS', 'ADAPTIVE_PREFETCH', 'PREFETCH_MIN', 'PREFETCH_MAX',
+                     'HANDLER_CONCURRENCY', 'HANDLER_EXECUTOR', 'SIMULATED_WORK_MS', 'COLOR_CODEC')
+
+STATISTICS_QUEUE = 'colorStatistics'
+DLX_NAME = 'dlx'
+DLQ_NAME = COLOR_QUEUE + '.dlq'
+ROUTING_EXCHANGE = 'color_exchange'
+
+
+class BenchmarkStats:
+    """
+    A StatsAggregator helyett a fogyasztóknak adjuk: csak számol, nem küld semmit.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.outcomes = {}
+        self.latency = LatencyHistogram()
+
+    def record(self, color, outcome, count=1, latency=None):
+        with self._lock:
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + count
+
+    def record_latency(self, color, kind, seconds):
+        if kind == KIND_QUEUE_DWELL:
+            with self._lock:
+                self.latency.record(seconds)
+
+    def useful(self):
+        with self._lock:
+            return self.outcomes.get(OUTCOME_ACKED, 0)
+
+    def start(self):
+        return self
+
+    def close(self):
+        pass
+
+
+# ---- topológiák és routing: ugyanaz, amit a stratégia deklarál / az ingress használ ----
+
+def declare_color_queue(channel):
+    channel.queue_declare(queue=COLOR_QUEUE)
+
+
+def declare_routing_keys(channel):
+    channel.exchange_declare(exchange=ROUTING_EXCHANGE, exchange_type='direct')
+    for color in COLORS:
+        channel.queue_declare(queue=f"queue_{color.lower()}")
+        channel.queue_bind(exchange=ROUTING_EXCHANGE, queue=f"queue_{color.lower()}",
+                           routing_key=f"color.{color.lower()}")
+
+
+def declare_dead_letter(channel):
+    channel.exchange_declare(exchange=DLX_NAME, exchange_type='fanout')
+    channel.queue_declare(queue=COLOR_QUEUE, arguments={'x-dead-letter-exchange': DLX_NAME})
+    channel.queue_declare(queue=DLQ_NAME)
+    channel.queue_bind(exchange=DLX_NAME, queue=DLQ_NAME)
+
+
+def route_color_queue(color):
+    return '', COLOR_QUEUE
+
+
+def route_routing_keys(color):
+    return ROUTING_EXCHANGE, f"color.{color.lower()}"
+
+
+def route_headers(color):
+    return COLOR_HEADERS_EXCHANGE, ''
+
+
+# ---- futtatók ----
+
+class ThreadedRunner:
+    """
+    A pika-szerű (BlockingConnection) feldolgozók, mindegyik a saját szálán, ahogy a processor_thread().
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.processors = []
+        self.threads = []
+
+    def start(self, stats):
+        self.processors = self.factory(stats)
+        for processor in self.processors:
+            thread = threading.Thread(target=self._consume, args=(processor,), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    @staticmethod
+    def _consume(processor):
+        try:
+            processor.start()
+        except Exception as e:
+            logger.error(f"Processor failed: {e}")
+        finally:
+            processor.stop()
+
+    def stop(self):
+        for processor in self.processors:
+            if processor.connection.is_open:
+                processor.connection.add_callback_threadsafe(processor.channel.stop_consuming)
+        for thread in self.threads:
+            thread.join(timeout=10)
+
+
+class AsyncRunner:
+    """
+    Az aio_pika-szerű feldolgozók egy saját event loopon, külön szálon.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.thread = None
+        self._loop = None
+        self._stop = None
+
+    def start(self, stats):
+        ready = threading.Event()
+        self.thread = threading.Thread(target=asyncio.run, args=(self._main(stats, ready),), daemon=True)
+        self.thread.start()
+        if not ready.wait(10):
+            raise RuntimeError("Async processors did not start")
+
+    async def _main(self, stats, ready):
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        processors = await self.factory(stats)
+        ready.set()
+        await self._stop.wait()
+        for processor in processors:
+            await processor.close()
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._stop.set)
+        self.thread.join(timeout=10)
+
+
+def color_processors(module_name, **module_settings):
+    """
+    Színenként egy ColorMessageProcessor a megadott mdb modulból (a modulszintű beállítások felülírásával).
+    """
+    def factory(stats):
+        module = importlib.import_module(module_name)
+        for name, value in module_settings.items():
+            setattr(module, name, value)
+        return [module.ColorMessageProcessor(color, stats) for color in COLORS]
+    return factory
+
+
+def any_color_processors(stats):
+    module = importlib.import_module('multiprocessing_mdbs')
+    module.COLOR_ROUTING = ROUTING_QUEUE
+    return [module.ColorMessageProcessor(None, stats, queue_name=COLOR_QUEUE, slot=slot)
+            for slot in range(BENCH_WORKERS)]
+
+
+async def async_competing(stats):
+    module = importlib.import_module('async_mdbs')
+    processors = [module.AsyncColorProcessor(color, stats) for color in COLORS]
+    for processor in processors:
+        await processor.connect()
+    return processors
+
+
+async def async_dispatcher(stats):
+    module = importlib.import_module('async_mdbs')
+    dispatcher = module.ColorDispatcher(stats=stats)
+    await dispatcher.connect()
+    return [dispatcher]
+
+
+class Strategy:
+    def __init__(self, name, description, topology, route, runner):
+        self.name = name
+        self.description = description
+        self.topology = topology
+        self.route = route
+        self.runner = runner
+
+
+STRATEGIES = [
+    Strategy("ack_all", "multuthread_mdbs: body compare, every delivery acked (wrong colors are lost)",
+             declare_color_queue, route_color_queue, lambda: ThreadedRunner(color_processors('multuthread_mdbs'))),
+    Strategy("requeue", "multithread_mdbs_requeue: body compare, wrong colors nacked with requeue",
+             declare_color_queue, route_color_queue,
+             lambda: ThreadedRunner(color_processors('multithread_mdbs_requeue'))),
+    Strategy("routing_keys", "multithread_mdbs_routing_keys: direct exchange, one queue per color",
+             declare_routing_keys, route_routing_keys,
+             lambda: ThreadedRunner(color_processors('multithread_mdbs_routing_keys'))),
+    Strategy("single_queue_reject", "multithr_sinlge_queue_mdbs_routing_key (queue): shared queue, reject+requeue",
+             declare_color_queue, route_color_queue,
+             lambda: ThreadedRunner(color_processors('multithr_sinlge_queue_mdbs_routing_key',
+                                                     COLOR_ROUTING=ROUTING_QUEUE))),
+    Strategy("headers_exchange", "multithr_sinlge_queue_mdbs_routing_key (headers): COLOR header routing",
+             declare_headers_routing, route_headers,
+             lambda: ThreadedRunner(color_processors('multithr_sinlge_queue_mdbs_routing_key',
+                                                     COLOR_ROUTING=ROUTING_HEADERS))),
+    Strategy("dead_letter", "dl_sq_mdbs: shared queue, wrong colors rejected to the DLQ",
+             declare_dead_letter, route_color_queue, lambda: ThreadedRunner(color_processors('dl_sq_mdbs'))),
+    Strategy("any_color_workers", "multiprocessing_mdbs (queue): workers accept any color (run as threads here)",
+             declare_color_queue, route_color_queue, lambda: ThreadedRunner(any_color_processors)),
+    Strategy("async_competing", "async_mdbs (competing): one asyncio consumer per color on the shared queue",
+             declare_color_queue, route_color_queue, lambda: AsyncRunner(async_competing)),
+    Strategy("async_dispatcher", "async_mdbs (dispatcher): single consumer, in-process fan-out by color",
+             declare_color_queue, route_color_queue, lambda: AsyncRunner(async_dispatcher)),
+]
+
+
+# ---- terhelés ----
+
+def load_workload():
+    """
+    A rögzített színsorozat (BENCH_WORKLOAD), vagy a BENCH_SEED szerint generált, amelyet el is mentünk.
+    """
+    if BENCH_WORKLOAD and os.path.exists(BENCH_WORKLOAD):
+        with open(BENCH_WORKLOAD) as workload_file:
+            colors = json.load(workload_file)
+        logger.info(f"Loaded {len(colors)} messages from {BENCH_WORKLOAD}")
+        return colors
+    palette, weights = parse_color_mix(BENCH_COLOR_MIX)
+    colors = random.Random(BENCH_SEED).choices(palette, weights, k=BENCH_MESSAGES)
+    if BENCH_WORKLOAD:
+        with open(BENCH_WORKLOAD, 'w') as workload_file:
+            json.dump(colors, workload_file)
+        logger.info(f"Recorded {len(colors)} messages to {BENCH_WORKLOAD}")
+    return colors
+
+
+def publish(channel, codec, route, color):
+    exchange, routing_key = route(color)
+    channel.basic_publish(exchange=exchange, routing_key=routing_key, body=codec.body(color),
+                          properties=codec.message_properties(color, now_us()))
+
+
+def publish_at_rate(channel, codec, route, colors, rate, done):
+    started = time.perf_counter()
+    for index, color in enumerate(colors):
+        delay = started + index / rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        publish(channel, codec, route, color)
+    done.set()
+
+
+def work_remaining():
+    """
+    A munkasorokban (a statisztika- és a dead-letter sor kivételével) várakozó és nyugtázatlan üzenetek.
+    """
+    with BROKER.lock:
+        remaining = 0
+        for name, q in BROKER.queues.items():
+            if name == STATISTICS_QUEUE or name.endswith('.dlq'):
+                continue
+            remaining += len(q.messages) + sum(consumer.unacked for consumer in q.consumers)
+        return remaining
+
+
+def run_strategy(strategy, colors):
+    BROKER.reset()
+    BROKER.redeliver_elsewhere = BENCH_REDELIVER_ELSEWHERE
+    stats = BenchmarkStats()
+    # Minden szín a megfelelő sorban legyen (COLOR fejléccel, hogy a headers routing is működjön)
+    codec = ColorCodec(os.environ.get('COLOR_CODEC', CODEC_BINARY), color_header=True)
+    connection = MemoryConnection(BROKER)
+    channel = connection.channel()
+    strategy.topology(channel)
+    channel.queue_declare(queue=STATISTICS_QUEUE)
+
+    published = threading.Event()
+    if BENCH_MODE == MODE_BACKLOG:
+        for color in colors:
+            publish(channel, codec, strategy.route, color)
+        published.set()
+
+    runner = strategy.runner()
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+    runner.start(stats)
+    if BENCH_MODE == MODE_RATE:
+        threading.Thread(target=publish_at_rate, daemon=True,
+                         args=(channel, codec, strategy.route, colors, BENCH_RATE, published)).start()
+
+    deadline = started + BENCH_TIMEOUT
+    completed = False
+    while time.perf_counter() < deadline:
+        if published.is_set() and not work_remaining():
+            completed = True
+            break
+        time.sleep(0.002)
+    elapsed = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+    runner.stop()
+    connection.close()
+
+    counters = BROKER.snapshot()["counters"]
+    useful = stats.useful()
+    if not completed:
+        remaining = work_remaining()
+        logger.warning(f"{strategy.name}: not finished within {BENCH_TIMEOUT}s ({remaining} messages left), "
+                       f"marked incomplete")
+        return {
+            "strategy": strategy.name,
+            "description": strategy.description,
+            "completed": False,
+            "messages": len(colors),
+            "remaining": remaining,
+            "elapsed_s": round(elapsed, 3),
+            "counters": counters
+        }
+    return {
+        "strategy": strategy.name,
+        "description": strategy.description,
+        "completed": True,
+        "messages": len(colors),
+        "useful": useful,
+        "lost": len(colors) - useful,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_per_s": round(useful / elapsed, 1) if elapsed else None,
+        "delivered": counters["delivered"],
+        "wasted_per_useful": round((counters["delivered"] - useful) / useful, 3) if useful else None,
+        "redelivered": counters["redelivered"],
+        "requeued": counters["requeued"],
+        "dead_lettered": counters["dead_lettered"],
+        "cpu_us_per_message": round(cpu / useful * 1_000_000, 1) if useful else None,
+        "outcomes": stats.outcomes,
+        "latency_ms": latency_summary(stats.latency),
+        "histogram": stats.latency.counts
+    }
+
+
+def main(names):
+    selected = [strategy for strategy in STRATEGIES if not names or strategy.name in names]
+    unknown = set(names) - {strategy.name for strategy in STRATEGIES}
+    if unknown or not selected:
+        logger.error(f"Unknown strategies: {sorted(unknown)}; available: {[s.name for s in STRATEGIES]}")
+        return 2
+    if BENCH_MODE not in (MODE_BACKLOG, MODE_RATE):
+        logger.error(f"Unknown BENCH_MODE: {BENCH_MODE}")
+        return 2
+
+    # Minden publikáló és fogyasztó ebben a folyamatban fut
+    embed()
+    colors = load_workload()
+    started = datetime.now(timezone.utc).isoformat()
+    results = []
+    for strategy in selected:
+        result = run_strategy(strategy, colors)
+        results.append(result)
+        if not result["completed"]:
+            continue
+        latency = result["latency_ms"]
+        logger.info(f"{strategy.name}: {result['useful']}/{result['messages']} useful, "
+                    f"{result['throughput_per_s']} msg/s, {result['wasted_per_useful']} wasted/useful, "
+                    f"{result['redelivered']} redelivered, {result['cpu_us_per_message']} µs CPU/msg, "
+                    f"p99={latency['p99']}ms p999={latency['p999']}ms")
+
+    with open(BENCH_OUTPUT, 'w') as output:
+        json.dump({
+            "started": started,
+            "host": socket.gethostname(),
+            "mode": BENCH_MODE,
+            "rate": BENCH_RATE if BENCH_MODE == MODE_RATE else None,
+            "messages": len(colors),
+            "color_mix": BENCH_COLOR_MIX,
+            "redeliver_elsewhere": BENCH_REDELIVER_ELSEWHERE,
+            "settings": {name: os.environ[name] for name in CONSUMER_SETTINGS if name in os.environ},
+            "results": results
+        }, output, indent=2)
+    logger.info(f"Results written to {BENCH_OUTPUT}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
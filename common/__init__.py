@@ -0,0 +1,6 @@
+"""
+A szolgáltatások (REST, SOAP, WebSocket) és az MDB-k által közösen használt modulok.
+
+A szkripteket közvetlenül futtatjuk (pl. python rest/rest_service.py), ezért ezek a
+projekt gyökerét felveszik a sys.path-ra, és innen importálnak.
+"""
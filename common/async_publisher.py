@@ -0,0 +1,153 @@
+import asyncio
+import itertools
+import logging
+import time
+
+import aio_pika
+
+from common.metrics import MESSAGES_PUBLISHED, PUBLISH_ERRORS, PUBLISH_LATENCY, MESSAGES_IN_FLIGHT
+from common.transport import connect_robust
+
+logger = logging.getLogger("async_publisher")
+
+
+class AsyncPublisher:
+    """
+    asyncio-natív publisher egyetlen, hosszú életű (robust) aio-pika kapcsolaton, több csatornával.
+
+    A csatornákat körbeforgó (round-robin) módon használja, így sok egyidejű kliens publikálhat
+    szálváltás és üzenetenkénti kapcsolatfelépítés nélkül. A connect_robust megszakadás után
+    magától újrakapcsolódik, és a csatornákat is visszaállítja.
+
+    - channels: a megnyitott csatornák száma
+    - setup: async függvény, amely a kapcsolódás után egyszer fut le (pl. queue deklarálása)
+    - confirms: publisher confirm mód; a visszaigazolásokat az aio-pika aszinkron követi (a broker
+      "multiple" nyugtái egyszerre egy egész köteget oldanak fel)
+    - wait_by_default: confirm módban a publish() alapértelmezésben megvárja-e a visszaigazolást
+    - max_in_flight: confirm módban legfeljebb ennyi visszaigazolatlan üzenet lehet úton
+    """
+
+    def __init__(self, host, port, user, password, channels=4, setup=None, confirms=False,
+                 wait_by_default=False, max_in_flight=1000, confirm_timeout=30.0):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.channel_count = channels
+        self.setup = setup
+        self.confirms = confirms
+        self.wait_by_default = wait_by_default
+        self.confirm_timeout = confirm_timeout
+        self.connection = None
+        self.channels = []
+        self._next_channel = None
+        self._exchanges = {}  # (csatorna, exchange név) -> Exchange, hogy ne kelljen üzenetenként lekérni
+        self._window = asyncio.Semaphore(max_in_flight)
+        self._unconfirmed = set()  # a várakozás nélkül elküldött, visszaigazolásra váró publikálások
+        self._published = MESSAGES_PUBLISHED.labels("async")
+        self._errors = PUBLISH_ERRORS.labels("async")
+        self._latency = PUBLISH_LATENCY.labels("async")
+        MESSAGES_IN_FLIGHT.labels("async_publisher").set_function(self.in_flight)
+
+    async def connect(self):
+        self.connection = await connect_robust(
+            host=self.host,
+            port=self.port,
+            login=self.user,
+            password=self.password
+        )
+        self.channels = [
+            await self.connection.channel(publisher_confirms=self.confirms)
+            for _ in range(self.channel_count)
+        ]
+        self._next_channel = itertools.cycle(self.channels)
+
+        if self.setup:
+            await self.setup(self.channels[0])
+
+        logger.info(f"Async publisher connected with {self.channel_count} channels")
+        return self
+
+    def channel(self):
+        """
+        A következő csatorna a körforgásból.
+        """
+        return next(self._next_channel)
+
+    def in_flight(self):
+        """
+        A visszaigazolásra váró, várakozás nélkül elküldött üzenetek száma.
+        """
+        return len(self._unconfirmed)
+
+    async def publish(self, routing_key, body, exchange='', headers=None, wait=None, content_type=None,
+                      message_id=None):
+        """
+        Üzenet küldése. A body lehet str vagy bytes.
+
+        :param wait: confirm módban megvárja-e a broker visszaigazolását (None = wait_by_default);
+                     várakozás nélkül a visszaigazolást a háttérben követjük, a hibákat naplózzuk
+        """
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        channel = self.channel()
+        target = await self._exchange(channel, exchange)
+        message = aio_pika.Message(body=body, headers=headers, content_type=content_type, message_id=message_id)
+
+        if not self.confirms:
+            started = time.perf_counter()
+            try:
+                await target.publish(message, routing_key=routing_key)
+            except Exception:
+                self._errors.inc()
+                raise
+            self._published.inc()
+            self._latency.observe(time.perf_counter() - started)
+            return
+
+        # Ha túl sok a visszaigazolatlan üzenet, itt várunk (backpressure)
+        await self._window.acquire()
+        confirmation = asyncio.ensure_future(self._publish_confirmed(target, message, routing_key))
+
+        if self.wait_by_default if wait is None else wait:
+            await asyncio.wait_for(confirmation, self.confirm_timeout)
+        else:
+            self._unconfirmed.add(confirmation)
+            confirmation.add_done_callback(self._on_background_confirm)
+
+    async def _publish_confirmed(self, target, message, routing_key):
+        started = time.perf_counter()
+        try:
+            confirmation = await target.publish(message, routing_key=routing_key, timeout=self.confirm_timeout)
+        except Exception:
+            self._errors.inc()
+            raise
+        finally:
+            self._window.release()
+        self._published.inc()
+        self._latency.observe(time.perf_counter() - started)
+        return confirmation
+
+    def _on_background_confirm(self, confirmation):
+        self._unconfirmed.discard(confirmation)
+        if not confirmation.cancelled() and confirmation.exception() is not None:
+            logger.error(f"Message not confirmed by the broker: {confirmation.exception()}")
+
+    async def _exchange(self, channel, name):
+        if not name:
+            return channel.default_exchange
+        key = (id(channel), name)
+        exchange = self._exchanges.get(key)
+        if exchange is None:
+            exchange = await channel.get_exchange(name, ensure=False)
+            self._exchanges[key] = exchange
+        return exchange
+
+    async def close(self):
+        # A háttérben futó visszaigazolásokat még megvárjuk
+        if self._unconfirmed:
+            await asyncio.gather(*self._unconfirmed, return_exceptions=True)
+        if self.connection and not self.connection.is_closed:
+            await asyncio.gather(*(channel.close() for channel in self.channels), return_exceptions=True)
+            await self.connection.close()
+            logger.info("Async publisher connection closed")
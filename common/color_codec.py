@@ -0,0 +1,136 @@
+"""
+Tömör színüzenet-kódolás, közösen az ingress szolgáltatásoknak és az MDB-knek.
+
+Bináris forma (content_type = application/x-color):
+    1 bájt színkód (RED=1, GREEN=2, BLUE=3), opcionálisan utána egy csomagolt metaadat-boríték:
+    verzió u8 | ingress időbélyeg u64 (epoch µs)
+
+Szöveges (régi) forma: a szín neve UTF-8-ban ("RED"), content_type nélkül vagy text/plain-nel.
+
+A fogyasztó a content_type alapján dönt, így a régi és az új kliensek együtt élhetnek: a dekódoló
+mindkét formát érti, a producerek pedig a COLOR_CODEC beállítással (text | binary) választanak.
+Az alapértelmezés a text, mert a még nem frissített fogyasztók (body.decode('utf-8')) a bináris
+törzsből '\x01'-et kapnának "RED" helyett. A binary bekapcsolása külön bevezetési lépés: előbb
+minden fogyasztó a decode_color()-t használja, csak utána válthatnak a producerek.
+Az állandó törzsek és a pika.BasicProperties objektumok előre elkészülnek, üzenetenként nem kell
+semmit kódolni.
+"""
+import struct
+
+import pika
+
+from common.tracing import TRACE_MESSAGES, next_message_id, trace_headers
+
+COLOR_CONTENT_TYPE = 'application/x-color'
+TEXT_CONTENT_TYPE = 'text/plain'
+
+# A COLOR_CODEC környezeti változó értékei
+CODEC_BINARY = 'binary'
+CODEC_TEXT = 'text'
+
+# A kódokat csak bővíteni szabad, átszámozni nem
+COLOR_CODES = {"RED": 1, "GREEN": 2, "BLUE": 3}
+COLOR_BY_CODE = [None] * 256
+for _name, _code in COLOR_CODES.items():
+    COLOR_BY_CODE[_code] = _name
+
+ENVELOPE = struct.Struct('<BQ')
+ENVELOPE_VERSION = 1
+
+# Előre kódolt állandó törzsek
+BINARY_BODIES = {color: bytes([code]) for color, code in COLOR_CODES.items()}
+TEXT_BODIES = {color: color.encode('utf-8') for color in COLOR_CODES}
+
+
+class ColorCodec:
+    """
+    Producer oldali kódoló: előre elkészített törzsek és üzenettulajdonságok színenként.
+
+    - codec: CODEC_BINARY vagy CODEC_TEXT (a régi fogyasztókkal kompatibilis forma)
+    - color_header: tegyen-e COLOR fejlécet az üzenetre. A headers exchange routingjához kell;
+      None esetén csak szöveges módban kerül rá (a régi fogyasztók a fejlécet is nézhetik)
+    """
+
+    def __init__(self, codec=CODEC_TEXT, color_header=None):
+        if codec not in (CODEC_BINARY, CODEC_TEXT):
+            raise ValueError(f"Invalid COLOR_CODEC value: {codec} (expected binary or text)")
+        self.codec = codec
+        self.content_type = COLOR_CONTENT_TYPE if codec == CODEC_BINARY else TEXT_CONTENT_TYPE
+        self.color_header = codec == CODEC_TEXT if color_header is None else color_header
+        self._bodies = BINARY_BODIES if codec == CODEC_BINARY else TEXT_BODIES
+        self._properties = {
+            color: pika.BasicProperties(
+                content_type=self.content_type,
+                headers={'COLOR': color} if self.color_header else None
+            )
+            for color in COLOR_CODES
+        }
+
+    def body(self, color):
+        """
+        A szín előre kódolt törzse (bytes).
+        """
+        return self._bodies[color]
+
+    def properties(self, color):
+        """
+        A színhez előre elkészített pika.BasicProperties (megosztott példány, nem szabad módosítani).
+        """
+        return self._properties[color]
+
+    def headers(self, color):
+        """
+        A fejléc-tábla (aio_pika producereknek), vagy None, ha nem kell fejléc.
+        """
+        return {'COLOR': color} if self.color_header else None
+
+    def message_properties(self, color, ingress_us=None):
+        """
+        Üzenetenkénti pika.BasicProperties message_id-vel és ingress / publish bélyeggel (common.tracing).
+        Ha nincs ingress idő, vagy a követés ki van kapcsolva (TRACE_MESSAGES=0), a megosztott példány.
+        """
+        if ingress_us is None or not TRACE_MESSAGES:
+            return self._properties[color]
+        return pika.BasicProperties(
+            content_type=self.content_type,
+            headers=trace_headers(ingress_us, self.headers(color)),
+            message_id=next_message_id()
+        )
+
+    def message_headers(self, color, ingress_us=None):
+        """
+        A message_properties() aio_pika megfelelője: (fejlécek, message_id); követés nélkül (headers(), None).
+        """
+        if ingress_us is None or not TRACE_MESSAGES:
+            return self.headers(color), None
+        return trace_headers(ingress_us, self.headers(color)), next_message_id()
+
+    def body_with_metadata(self, color, timestamp_us):
+        """
+        Bináris módban a színkód után csomagolt metaadat-borítékot is tesz (ingress időbélyeg, µs).
+        Szöveges módban a régi fogyasztók miatt nincs boríték.
+        """
+        if self.codec != CODEC_BINARY:
+            return self._bodies[color]
+        return self._bodies[color] + ENVELOPE.pack(ENVELOPE_VERSION, timestamp_us)
+
+
+def decode_color(body, content_type=None):
+    """
+    Gyors dekódolás a fogyasztó oldalon: bináris formánál egy táblaindexelés, különben UTF-8 dekódolás.
+
+    :return: a szín neve (ismeretlen bináris kódnál None)
+    """
+    if content_type == COLOR_CONTENT_TYPE:
+        return COLOR_BY_CODE[body[0]] if body else None
+    return body.decode('utf-8')
+
+
+def decode_metadata(body, content_type=None):
+    """
+    A bináris üzenet metaadat-borítékából az ingress időbélyeg (µs), ha van; különben None.
+    """
+    if content_type != COLOR_CONTENT_TYPE or len(body) < 1 + ENVELOPE.size:
+        return None
+    version, timestamp_us = ENVELOPE.unpack_from(body, 1)
+    return timestamp_us if version == ENVELOPE_VERSION else None
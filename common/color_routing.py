@@ -0,0 +1,38 @@
+"""
+Headers exchange alapú színszerinti routing.
+
+Az ingress a már meglévő COLOR fejléc alapján egy headers exchange-re publikál, és minden színnek saját,
+a fejlécre kötött sora van. Így minden üzenet elsőre a megfelelő feldolgozóhoz kerül, nincs szükség
+a közös colorQueue-n a "nem az én színem" üzenetek requeue-olására.
+"""
+
+COLORS = ["RED", "GREEN", "BLUE"]
+COLOR_QUEUE = 'colorQueue'
+COLOR_HEADERS_EXCHANGE = 'color_headers'
+
+# A COLOR_ROUTING környezeti változó értékei
+ROUTING_QUEUE = 'queue'      # a régi viselkedés: minden a közös colorQueue-ra megy
+ROUTING_HEADERS = 'headers'  # headers exchange, színenkénti sorokkal
+
+
+def color_queue_name(color):
+    """
+    A színhez tartozó sor neve headers módban, pl. colorQueue.RED
+    """
+    return f"{COLOR_QUEUE}.{color}"
+
+
+def declare_headers_routing(channel, colors=COLORS):
+    """
+    Létrehozza a headers exchange-et és a színenkénti sorokat, a COLOR fejlécre kötve.
+    Idempotens, így az ingress és az MDB-k is nyugodtan meghívhatják.
+    """
+    channel.exchange_declare(exchange=COLOR_HEADERS_EXCHANGE, exchange_type='headers')
+    for color in colors:
+        queue_name = color_queue_name(color)
+        channel.queue_declare(queue=queue_name)
+        channel.queue_bind(
+            exchange=COLOR_HEADERS_EXCHANGE,
+            queue=queue_name,
+            arguments={'x-match': 'all', 'COLOR': color}
+        )
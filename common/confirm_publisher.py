@@ -0,0 +1,352 @@
+import functools
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+import pika
+from pika.exceptions import AMQPConnectionError, NackError
+
+from common.metrics import MESSAGES_PUBLISHED, PUBLISH_ERRORS, PUBLISH_LATENCY, MESSAGES_IN_FLIGHT
+from common.publisher_pool import ChannelPool
+from common.transport import blocking_connection, uses_memory
+
+logger = logging.getLogger("confirm_publisher")
+
+# A PUBLISHER_CONFIRMS környezeti változó értékei
+CONFIRMS_OFF = 'off'      # nincs broker-visszaigazolás (a régi viselkedés)
+CONFIRMS_ASYNC = 'async'  # confirm módban publikálunk, de a kérés nem vár a visszaigazolásra
+CONFIRMS_WAIT = 'wait'    # a kérés megvárja a broker visszaigazolását
+
+
+class ConfirmPublisher:
+    """
+    Publisher confirm módban, aszinkron visszaigazolás-követéssel.
+
+    Egy háttérszálban futó pika SelectConnection-t használ. A publish() a küldést átadja az I/O szálnak,
+    és azonnal egy concurrent.futures.Future-t ad vissza, amely a broker ack/nack válaszakor teljesül.
+    A kintlévő delivery tag-eket sorrendben tartjuk nyilván, így a broker "multiple" nyugtái egyszerre
+    egy egész köteget oldanak fel. A tx_select tranzakciókkal ellentétben a küldő nem vár üzenetenként.
+
+    - max_in_flight: legfeljebb ennyi visszaigazolatlan üzenet lehet úton (efölött a publish() vár)
+    - wait_by_default: a publish() alapértelmezésben megvárja-e a visszaigazolást
+    - confirm_timeout: ennyi másodpercig várunk a visszaigazolásra (wait=True esetén)
+    - topology: exchange-eket és queue-kat deklaráló függvény a pika.BlockingChannel-re, kapcsolódáskor fut le
+    """
+
+    def __init__(self, parameters, max_in_flight=1000, wait_by_default=False, confirm_timeout=30.0,
+                 topology=None, reconnect_delay=2.0):
+        self.parameters = parameters
+        self.wait_by_default = wait_by_default
+        self.confirm_timeout = confirm_timeout
+        self.topology = topology
+        self.reconnect_delay = reconnect_delay
+
+        self._window = threading.BoundedSemaphore(max_in_flight)
+        self._pending = OrderedDict()  # delivery tag -> Future, növekvő sorrendben
+        self._delivery_tag = 0
+        # Az I/O szálnak már átadott, de még el nem küldött üzenetek Future-jei. Ha a kapcsolat közben
+        # bezárul, az ioloop ezeket a callbackeket már nem futtatja, ezért a lezáráskor mi hiúsítjuk meg őket.
+        self._queued = {}
+        self._queued_lock = threading.Lock()
+        self._connection = None
+        self._channel = None
+        self._ready = threading.Event()
+        self._stopping = False
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._published = MESSAGES_PUBLISHED.labels("confirm")
+        self._errors = PUBLISH_ERRORS.labels("confirm")
+        self._latency = PUBLISH_LATENCY.labels("confirm")
+        MESSAGES_IN_FLIGHT.labels("confirm_publisher").set_function(self.in_flight)
+
+    # ---- életciklus ----
+
+    def start(self, timeout=10.0):
+        """
+        Elindítja az I/O szálat, és megvárja, amíg a csatorna confirm módba kerül.
+        """
+        with self._start_lock:
+            if self._thread is None:
+                if self.topology:
+                    self._declare_topology()
+                self._thread = threading.Thread(target=self._run, name="confirm-publisher", daemon=True)
+                self._thread.start()
+        if not self._ready.wait(timeout):
+            raise TimeoutError(f"Confirm publisher not ready within {timeout} seconds")
+        return self
+
+    def close(self, timeout=5.0):
+        self._stopping = True
+        connection = self._connection
+        if connection is not None:
+            try:
+                connection.ioloop.add_callback_threadsafe(self._close_connection)
+            except Exception:
+                pass
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def in_flight(self):
+        """
+        A visszaigazolásra váró üzenetek száma (metrikákhoz, diagnosztikához).
+        """
+        return len(self._pending)
+
+    # ---- publikálás ----
+
+    def publish(self, exchange, routing_key, body, properties=None, wait=None):
+        """
+        Üzenet küldése confirm módban.
+
+        :param wait: megvárja-e a broker visszaigazolását (None = wait_by_default)
+        :return: Future, amely ack esetén True-val teljesül, nack esetén NackError-t dob
+        :raises NackError / TimeoutError / AMQPConnectionError: csak wait=True esetén
+        """
+        future = self.submit(exchange, routing_key, body, properties)
+        if self.wait_by_default if wait is None else wait:
+            wait_for_confirms([future], self.confirm_timeout)
+        return future
+
+    def submit(self, exchange, routing_key, body, properties=None):
+        """
+        Várakozás nélküli küldés: a visszaigazolást a visszaadott Future jelzi.
+        """
+        if not self._ready.is_set():
+            self.start()
+        if not self._window.acquire(timeout=self.confirm_timeout):
+            raise TimeoutError(f"Too many unconfirmed messages in flight for {self.confirm_timeout} seconds")
+
+        future = Future()
+        future.add_done_callback(functools.partial(self._on_settled, time.perf_counter()))
+        # A kapcsolatot és a nyilvántartást egy zár alatt kezeljük a lezárással: amit itt a régi
+        # kapcsolatra ütemezünk, azt a _on_connection_closed() biztosan meghiúsítja
+        with self._queued_lock:
+            connection = self._connection
+            if connection is not None:
+                self._queued[future] = None
+        if connection is None:
+            self._window.release()
+            raise AMQPConnectionError("Confirm publisher is reconnecting")
+        try:
+            connection.ioloop.add_callback_threadsafe(
+                lambda: self._publish(exchange, routing_key, body, properties, future)
+            )
+        except Exception:
+            if self._take_queued(future):
+                self._window.release()
+            raise
+        return future
+
+    def publish_many(self, messages, wait=None):
+        """
+        Több üzenet küldése egy sorozatban.
+
+        :param messages: (exchange, routing_key, body, properties) négyesek listája
+        :return: elemenkénti hibák listája (None = sikeres); várakozás nélkül csak a küldési hibák látszanak
+        """
+        futures = []
+        errors = [None] * len(messages)
+        for index, (exchange, routing_key, body, properties) in enumerate(messages):
+            try:
+                futures.append((index, self.submit(exchange, routing_key, body, properties)))
+            except Exception as e:
+                errors[index] = e
+
+        if self.wait_by_default if wait is None else wait:
+            for index, future in futures:
+                try:
+                    future.result(timeout=self.confirm_timeout)
+                except FutureTimeoutError:
+                    errors[index] = TimeoutError(f"No broker confirm within {self.confirm_timeout} seconds")
+                except Exception as e:
+                    errors[index] = e
+        return errors
+
+    def _on_settled(self, started, future):
+        # A publikálás késleltetése a broker visszaigazolásáig (ack vagy nack)
+        if future.exception() is None:
+            self._published.inc()
+            self._latency.observe(time.perf_counter() - started)
+        else:
+            self._errors.inc()
+
+    # ---- az I/O szálon futó részek ----
+
+    def _take_queued(self, future):
+        """
+        Kiveszi a Future-t a még el nem küldöttek közül; False, ha a lezárás már meghiúsította.
+        """
+        with self._queued_lock:
+            return self._queued.pop(future, False) is None
+
+    def _publish(self, exchange, routing_key, body, properties, future):
+        if not self._take_queued(future):
+            return
+        if self._channel is None or not self._channel.is_open:
+            self._window.release()
+            future.set_exception(AMQPConnectionError("Confirm publisher channel is not open"))
+            return
+        try:
+            self._channel.basic_publish(exchange, routing_key, body, properties)
+        except Exception as e:
+            # A broker ezt az üzenetet nem kapta meg, így delivery tag-et sem foglal
+            self._window.release()
+            future.set_exception(e)
+            return
+        self._delivery_tag += 1
+        self._pending[self._delivery_tag] = future
+
+    def _on_confirm(self, frame):
+        method = frame.method
+        error = None if isinstance(method, pika.spec.Basic.Ack) else NackError([])
+        self._resolve(method.delivery_tag, method.multiple, error)
+
+    def _resolve(self, delivery_tag, multiple, error=None):
+        """
+        Feloldja a delivery_tag-hez (multiple esetén az összes addigi tag-hez) tartozó Future-öket.
+        """
+        if multiple:
+            resolved = []
+            while self._pending:
+                tag = next(iter(self._pending))
+                if tag > delivery_tag:
+                    break
+                resolved.append(self._pending.popitem(last=False)[1])
+        else:
+            future = self._pending.pop(delivery_tag, None)
+            resolved = [future] if future is not None else []
+
+        for future in resolved:
+            if error is None:
+                future.set_result(True)
+            else:
+                future.set_exception(error)
+            self._window.release()
+
+    def _fail_pending(self, error):
+        while self._pending:
+            _, future = self._pending.popitem(last=False)
+            future.set_exception(error)
+            self._window.release()
+
+    def _fail_queued(self, error):
+        """
+        Lezárt kapcsolatnál: a még el nem küldött üzenetek callbackjei már nem futnak le, itt hiúsulnak meg.
+        """
+        with self._queued_lock:
+            self._connection = None
+            queued = list(self._queued)
+            self._queued.clear()
+        for future in queued:
+            future.set_exception(error)
+            self._window.release()
+
+    def _run(self):
+        first = True
+        while not self._stopping:
+            if not first and self.topology:
+                # Újrakapcsolódás után a broker akár újra is indulhatott, ezért a topológiát újra deklaráljuk
+                try:
+                    self._declare_topology()
+                except Exception as e:
+                    logger.error(f"Confirm publisher topology declaration failed: {e}")
+                    time.sleep(self.reconnect_delay)
+                    continue
+            first = False
+
+            connection = pika.SelectConnection(
+                self.parameters,
+                on_open_callback=self._on_connection_open,
+                on_open_error_callback=self._on_connection_error,
+                on_close_callback=self._on_connection_closed
+            )
+            with self._queued_lock:
+                self._connection = connection
+            connection.ioloop.start()
+            if not self._stopping:
+                # Újrakapcsolódás előtt várunk egy kicsit, hogy ne pörögjön a ciklus, ha a broker nem érhető el
+                time.sleep(self.reconnect_delay)
+
+    def _on_connection_open(self, connection):
+        connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_channel_open(self, channel):
+        self._channel = channel
+        self._delivery_tag = 0
+        channel.confirm_delivery(self._on_confirm, callback=lambda _frame: self._ready.set())
+        logger.info("Confirm publisher channel open")
+
+    def _on_connection_error(self, connection, error):
+        logger.error(f"Confirm publisher connection failed: {error}")
+        self._fail_queued(AMQPConnectionError(f"Connection failed: {error}"))
+        connection.ioloop.stop()
+
+    def _on_connection_closed(self, connection, reason):
+        self._ready.clear()
+        self._channel = None
+        error = AMQPConnectionError(f"Connection closed before confirm: {reason}")
+        self._fail_queued(error)
+        self._fail_pending(error)
+        if not self._stopping:
+            logger.warning(f"Confirm publisher connection closed ({reason}), reconnecting...")
+        connection.ioloop.stop()
+
+    def _close_connection(self):
+        if self._connection is not None and self._connection.is_open:
+            self._connection.close()
+
+    def _declare_topology(self):
+        connection = blocking_connection(self.parameters)
+        try:
+            self.topology(connection.channel())
+        finally:
+            connection.close()
+
+
+def wait_for_confirms(futures, timeout):
+    """
+    Megvárja a Future-ök teljesülését; az első hibát (nack, kapcsolatvesztés, időtúllépés) továbbdobja.
+    """
+    for future in futures:
+        try:
+            future.result(timeout=timeout)
+        except FutureTimeoutError:
+            raise TimeoutError(f"No broker confirm within {timeout} seconds")
+
+
+def validate_confirms(confirms):
+    """
+    Ellenőrzi a PUBLISHER_CONFIRMS értékét, hogy egy elgépelés ne kapcsolja be csendben a confirm módot.
+
+    :return: a változatlan érték
+    :raises ValueError: ha nem off, async vagy wait
+    """
+    if confirms not in (CONFIRMS_OFF, CONFIRMS_ASYNC, CONFIRMS_WAIT):
+        raise ValueError(f"Invalid PUBLISHER_CONFIRMS value: {confirms} (expected off, async or wait)")
+    return confirms
+
+
+def create_publisher(parameters, confirms=CONFIRMS_OFF, topology=None, max_in_flight=1000,
+                     confirm_timeout=30.0, **pool_options):
+    """
+    A PUBLISHER_CONFIRMS beállítás alapján választ publishert az ingress szolgáltatásoknak.
+    Mindkettő ugyanazt az interfészt adja: start(), publish(..., wait=None), publish_many(...), close().
+
+    :param confirms: CONFIRMS_OFF (ChannelPool), CONFIRMS_ASYNC vagy CONFIRMS_WAIT (ConfirmPublisher)
+    :param pool_options: a ChannelPool további paraméterei (connections, setup, ...)
+    """
+    if validate_confirms(confirms) == CONFIRMS_OFF:
+        return ChannelPool(parameters, topology=topology, **pool_options)
+    if uses_memory():
+        # A memory transport szinkron publikál, nincs mire várni: a confirm mód a poollal egyenértékű
+        logger.info("In-memory transport: publisher confirms are implicit, using the channel pool")
+        return ChannelPool(parameters, topology=topology, **pool_options)
+    return ConfirmPublisher(
+        parameters,
+        max_in_flight=max_in_flight,
+        wait_by_default=(confirms == CONFIRMS_WAIT),
+        confirm_timeout=confirm_timeout,
+        topology=topology
+    )
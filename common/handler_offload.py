@@ -0,0 +1,92 @@
+"""
+Handler-futtatás korlátos szálpoolon a pika BlockingConnection alapú fogyasztókhoz.
+
+A BlockingConnection nem szálbiztos: a csatornát csak a kapcsolat saját (I/O) szála használhatja.
+Ha a handler közvetlenül az on_message_callback-ben fut, egy lassú handler a heartbeatet és az egész
+csatornát megakasztja. A HandlerOffload ezért a handlert egy worker szálon futtatja, az eredményt
+(ack / nack / reject) pedig a connection.add_callback_threadsafe() segítségével az I/O szálon
+alkalmazza, így egyetlen kapcsolat több üzenetet dolgozhat fel párhuzamosan.
+
+A folyamatban lévő üzenetek számát a prefetch (QoS ablak) korlátozza, ezért a pool sora sem nőhet
+korlátlanul; az ablakot érdemes legalább a szálak számára állítani.
+"""
+import functools
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from common.metrics import MESSAGES_IN_FLIGHT
+
+logger = logging.getLogger("handler_offload")
+
+# Fogyasztói mód: inline (a handler az I/O callbackben fut, a régi viselkedés) vagy offload (szálpool)
+CONSUMER_MODE = os.environ.get('CONSUMER_MODE', 'inline')
+HANDLER_THREADS = int(os.environ.get('HANDLER_THREADS', 8))
+
+
+class HandlerOffload:
+    """
+    - connection: a pika BlockingConnection, amelynek I/O szálán az eredményt alkalmazzuk
+    - threads: a worker szálak száma
+    """
+
+    def __init__(self, connection, threads=HANDLER_THREADS, name="handler"):
+        self.connection = connection
+        self.threads = max(1, threads)
+        self.executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix=name)
+        self._in_flight = MESSAGES_IN_FLIGHT.labels("handler_offload")
+
+    @classmethod
+    def from_env(cls, connection, name="handler"):
+        """
+        CONSUMER_MODE=offload esetén HandlerOffload, különben None (a hívó inline futtat).
+        """
+        if CONSUMER_MODE != 'offload':
+            return None
+        return cls(connection, HANDLER_THREADS, name)
+
+    def submit(self, channel, delivery_tag, work, settle, *args, redelivered=False, finished=None):
+        """
+        A work(*args) a worker szálon fut, a settle(result) az I/O szálon (ott szabad ackolni).
+
+        Ha a work kivételt dob, az első kézbesítést egyszer visszarakjuk a sorba (átmeneti hiba),
+        a már újrakézbesített üzenetet viszont requeue nélkül elutasítjuk (dead-letter exchange-re megy,
+        ha van), így egy feldolgozhatatlan üzenet nem pöröghet a végtelenségig.
+
+        :param redelivered: a method.redelivered jelzője
+        :param finished: hiba esetén az elutasítás után az I/O szálon hívjuk (pl. a prefetch-számláláshoz),
+                         mert ilyenkor a settle nem fut le
+        """
+        self._in_flight.inc()
+        self.executor.submit(self._run, channel, delivery_tag, work, settle, args, redelivered, finished)
+
+    def _run(self, channel, delivery_tag, work, settle, args, redelivered, finished):
+        try:
+            callback = functools.partial(settle, work(*args))
+        except Exception as e:
+            logger.error(f"Handler failed for delivery {delivery_tag} "
+                         f"({'rejecting' if redelivered else 'requeuing once'}): {e}")
+            callback = functools.partial(self._fail, channel, delivery_tag, not redelivered, finished)
+        finally:
+            self._in_flight.dec()
+        try:
+            self.connection.add_callback_threadsafe(callback)
+        except Exception as e:
+            # A kapcsolat közben lezárult; a nyugtázatlan üzenetet a broker újra kézbesíti
+            logger.warning(f"Cannot settle delivery {delivery_tag}, connection closed: {e}")
+
+    @staticmethod
+    def _fail(channel, delivery_tag, requeue, finished):
+        if channel.is_open:
+            channel.basic_reject(delivery_tag=delivery_tag, requeue=requeue)
+        if finished is not None:
+            finished()
+
+    def shutdown(self):
+        """
+        Megvárja a futó handlereket, majd az I/O szálon lefuttatja a még függő nyugtázásokat.
+        A fogyasztás leállítása után, a kapcsolat lezárása előtt, az I/O szálról hívandó.
+        """
+        self.executor.shutdown(wait=True)
+        if self.connection.is_open:
+            self.connection.process_data_events(time_limit=0)
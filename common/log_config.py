@@ -0,0 +1,182 @@
+"""
+Nem blokkoló, mintavételezett naplózás az összes komponenshez (a logging.basicConfig helyett).
+
+Az üzenetenkénti INFO sorok ("Received color", "Processing RED message" stb.) szinkron kiírása a
+fogyasztó / publikáló szálon többe kerülhet, mint maga a feldolgozás. Ezért:
+
+- a rekordokat egy korlátos sorba tesszük (QueueHandler), a formázást és a kiírást egy háttérszál
+  végzi (QueueListener); ha a sor megtelik, a rekordot eldobjuk, és nem várunk rá;
+- hívási helyenként (esemény-típusonként: logger + fájl + sor) mintavételezünk: LOG_SAMPLE_RATE=N
+  esetén az INFO/DEBUG sorokból minden N-ediket engedjük át (az elsőt mindig);
+- hívási helyenként másodpercenként legfeljebb LOG_RATE_LIMIT sort engedünk át (0 = nincs korlát);
+- a figyelmeztetéseket és hibákat nem mintavételezzük és nem korlátozzuk;
+- az elnyomott sorokat hívási helyenként számoljuk: a következő átengedett sor végére odaírjuk,
+  hány hasonló maradt ki, összesítve pedig a suppressed_counts() adja vissza.
+
+A hot path hívások %-os formázást használjanak (logger.info("Received color: %s", color)), így az
+elnyomott sorok formázása is elmarad, az átengedetteké pedig a háttérszálon történik.
+"""
+import atexit
+import logging
+import logging.handlers
+import multiprocessing.util
+import os
+import queue
+import threading
+import time
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', '')
+LOG_ASYNC = os.environ.get('LOG_ASYNC', '1') == '1'
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+LOG_SAMPLE_RATE = int(os.environ.get('LOG_SAMPLE_RATE', 1))
+LOG_RATE_LIMIT = float(os.environ.get('LOG_RATE_LIMIT', 0))
+
+_listener = None
+_filter = None
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Hívási helyenkénti mintavételezés és rátakorlát; WARNING alatti szintekre vonatkozik.
+
+    - sample_rate: minden sample_rate-edik sort engedjük át (1 = mindet)
+    - rate_limit: hívási helyenként legfeljebb ennyi sor másodpercenként (0 = nincs korlát)
+    """
+
+    def __init__(self, sample_rate=1, rate_limit=0.0):
+        super().__init__()
+        self.sample_rate = max(1, sample_rate)
+        self.rate_limit = rate_limit
+        self._lock = threading.Lock()
+        self._seen = {}        # hívási hely -> látott sorok száma
+        self._windows = {}     # hívási hely -> [másodperc, átengedett sorok a másodpercben]
+        self._pending = {}     # hívási hely -> a legutóbbi átengedett sor óta elnyomottak
+        self._suppressed = {}  # hívási hely -> összes elnyomott sor
+        self.dropped = 0       # a teli sor miatt eldobott rekordok (a QueueHandler növeli)
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        site = (record.name, record.pathname, record.lineno)
+        with self._lock:
+            seen = self._seen.get(site, 0)
+            self._seen[site] = seen + 1
+            allowed = seen % self.sample_rate == 0
+            if allowed and self.rate_limit:
+                second = int(time.monotonic())
+                window = self._windows.get(site)
+                if window is None or window[0] != second:
+                    window = self._windows[site] = [second, 0]
+                allowed = window[1] < self.rate_limit
+                if allowed:
+                    window[1] += 1
+            if not allowed:
+                self._pending[site] = self._pending.get(site, 0) + 1
+                self._suppressed[site] = self._suppressed.get(site, 0) + 1
+                return False
+            pending = self._pending.pop(site, 0)
+        if pending:
+            record.msg = f"{record.msg} [{pending} similar lines suppressed]"
+        return True
+
+    def suppressed_counts(self):
+        """
+        :return: {"logger:fájl:sor": elnyomott sorok száma}
+        """
+        with self._lock:
+            return {
+                f"{name}:{os.path.basename(path)}:{line}": count
+                for (name, path, line), count in self._suppressed.items()
+            }
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Nem blokkol: teli sor esetén a rekordot eldobja és megszámolja. A rekordot formázatlanul teszi a
+    sorba (a formázás a listener szálon történik); folyamaton belüli sornál ez biztonságos.
+    """
+
+    def __init__(self, log_queue, sampling=None):
+        super().__init__(log_queue)
+        self.sampling = sampling
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if self.sampling is not None:
+                self.sampling.dropped += 1
+
+
+def configure_logging(level=logging.INFO):
+    """
+    A gyökér logger beállítása. A LOG_LEVEL környezeti változó felülírja a level paramétert,
+    LOG_ASYNC=0 esetén a kiírás szinkron marad (a mintavételezés ekkor is érvényes).
+    """
+    global _listener, _filter
+    if LOG_LEVEL:
+        level = getattr(logging, LOG_LEVEL.upper(), level)
+    root = logging.getLogger()
+    root.setLevel(level)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    output = logging.StreamHandler()
+    output.setFormatter(logging.Formatter(LOG_FORMAT))
+    _filter = SamplingFilter(LOG_SAMPLE_RATE, LOG_RATE_LIMIT)
+
+    if not LOG_ASYNC:
+        output.addFilter(_filter)
+        root.addHandler(output)
+        return
+
+    handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE), _filter)
+    handler.addFilter(_filter)
+    root.addHandler(handler)
+    _listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+    def restart_in_child():
+        # fork után a listener szál nem létezik a gyerekfolyamatban: új sort és listenert indítunk
+        global _listener
+        handler.queue = queue.Queue(LOG_QUEUE_SIZE)
+        _listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+        _listener.start()
+
+    os.register_at_fork(after_in_child=restart_in_child)
+    # a multiprocessing worker os._exit()-tel lép ki, az atexit nem fut le: a kiürítést a worker
+    # kilépési finalizerére bízzuk
+    multiprocessing.util.register_after_fork(
+        handler, lambda _handler: multiprocessing.util.Finalize(None, stop_logging, exitpriority=0)
+    )
+
+
+def stop_logging():
+    """
+    Kiírja a sorban maradt rekordokat és leállítja a listener szálat.
+    """
+    global _listener
+    if _listener is not None:
+        counts = suppressed_counts()
+        if counts:
+            logging.getLogger("log_config").warning("Suppressed log lines: %s", counts)
+        _listener.stop()
+        _listener = None
+
+
+def suppressed_counts():
+    """
+    A mintavételezés / rátakorlát miatt elnyomott sorok hívási helyenként, és a teli sor miatt eldobottak.
+    """
+    if _filter is None:
+        return {}
+    counts = _filter.suppressed_counts()
+    if _filter.dropped:
+        counts["dropped"] = _filter.dropped
+    return counts
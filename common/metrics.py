@@ -0,0 +1,382 @@
+"""
+Folyamaton belüli metrika-regiszter (számlálók, gauge-ok, fix vödrös hisztogramok) és egy kis HTTP
+végpont, amely Prometheus szöveges formátumban adja ki őket (GET /metrics).
+
+A mintavétel a hot path-on nem vesz zárat: minden szál a saját (threading.local) példányába ír, és
+csak a kiolvasás (a /metrics kérés) összegzi a szálak értékeit. Zárat csak egy szál első írása
+(a saját példány regisztrálása) és a címkés gyerek első létrehozása használ.
+
+A közös metrikák (publikált / feldolgozott üzenetek, késleltetések, folyamatban lévő üzenetek)
+ebben a modulban vannak definiálva, így a publisherek, a statisztika-gyűjtő és az MDB-k
+ugyanazokat a sorozatokat írják.
+"""
+import bisect
+import logging
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("metrics")
+
+METRICS_HOST = os.environ.get('METRICS_HOST', '127.0.0.1')
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Késleltetés-vödrök (másodperc): 50 µs-tól 10 s-ig
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value):
+    """
+    Mintaérték a szöveges formátumban, teljes pontossággal (a :g 6 jegye mellett
+    az 1e6 fölötti számlálók "befagynának", és a rate() hibás lenne).
+    """
+    value = float(value)
+    if value != value:
+        return "NaN"
+    if value in (float("inf"), float("-inf")):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(value)
+
+
+class _PerThread:
+    """
+    Szálanként külön tároló (számok listája); az írás csak a saját szál tárolóját érinti, zár nélkül.
+
+    A kérésenként szálat indító szervereknél (Flask threaded, ThreadingWSGIServer) a leállt szálak
+    tárolóit egy közös "nyugdíjas" összegbe olvasztjuk, így a tárolók száma nem nő korlátlanul.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._live = []  # (szál, tároló) párok
+        self._retired = factory()
+
+    def mine(self):
+        try:
+            return self._local.value
+        except AttributeError:
+            value = self._local.value = self._factory()
+            with self._lock:
+                self._fold_dead()
+                self._live.append((threading.current_thread(), value))
+            return value
+
+    def _fold_dead(self):
+        # A leállt szál már nem ír a tárolójába, ezért zár nélkül is biztonságosan összeadható
+        alive = []
+        for thread, value in self._live:
+            if thread.is_alive():
+                alive.append((thread, value))
+            else:
+                for i, number in enumerate(value):
+                    self._retired[i] += number
+        self._live = alive
+
+    def all(self):
+        with self._lock:
+            self._fold_dead()
+            return [self._retired] + [value for _, value in self._live]
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """
+        A címkeértékekhez tartozó gyerek (a címkék sorrendje a labelnames szerinti).
+        """
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _default(self):
+        # Címke nélküli metrikánál a metrika maga is írható (inc / set / observe)
+        return self.labels()
+
+    def _label_text(self, values, extra=()):
+        pairs = list(zip(self.labelnames, values)) + list(extra)
+        if not pairs:
+            return ""
+        escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+        return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._child_lines(values, child))
+        return lines
+
+
+class _CounterChild:
+    def __init__(self):
+        self._values = _PerThread(lambda: [0.0])
+
+    def inc(self, amount=1):
+        self._values.mine()[0] += amount
+
+    def value(self):
+        return sum(values[0] for values in self._values.all())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def _child_lines(self, values, child):
+        return [f"{self.name}{self._label_text(values)} {_format_value(child.value())}"]
+
+
+class _GaugeChild:
+    """
+    set(): az utolsó írás érvényes; inc() / dec(): szálanként összegzett eltérés az alapértékhez;
+    set_function(): a kiolvasáskor meghívott függvény adja az értéket (pl. pool kihasználtság).
+    """
+
+    def __init__(self):
+        self._base = 0.0
+        self._deltas = _PerThread(lambda: [0.0])
+        self._function = None
+
+    def set(self, value):
+        self._base = value
+
+    def inc(self, amount=1):
+        self._deltas.mine()[0] += amount
+
+    def dec(self, amount=1):
+        self._deltas.mine()[0] -= amount
+
+    def set_function(self, function):
+        self._function = function
+
+    def value(self):
+        if self._function is not None:
+            return self._function()
+        return self._base + sum(delta[0] for delta in self._deltas.all())
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._default().set(value)
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def dec(self, amount=1):
+        self._default().dec(amount)
+
+    def set_function(self, function):
+        self._default().set_function(function)
+
+    def _child_lines(self, values, child):
+        try:
+            value = child.value()
+        except Exception as e:
+            logger.warning(f"Gauge {self.name} callback failed: {e}")
+            return []
+        return [f"{self.name}{self._label_text(values)} {_format_value(value)}"]
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # szálanként: vödrönkénti darabszámok (+Inf-fel együtt), majd az összeg
+        self._values = _PerThread(lambda: [0] * (len(buckets) + 1) + [0.0])
+
+    def observe(self, value):
+        values = self._values.mine()
+        values[bisect.bisect_left(self.buckets, value)] += 1
+        values[-1] += value
+
+    def snapshot(self):
+        """
+        :return: (vödrönkénti darabszámok +Inf-fel, összeg), a szálak összesítve
+        """
+        width = len(self.buckets) + 1
+        counts = [0] * width
+        total = 0.0
+        for values in self._values.all():
+            for i in range(width):
+                counts[i] += values[i]
+            total += values[-1]
+        return counts, total
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+    def _child_lines(self, values, child):
+        counts, total = child.snapshot()
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else f"{bound:g}"
+            lines.append(f"{self.name}_bucket{self._label_text(values, [('le', le)])} {cumulative}")
+        lines.append(f"{self.name}_sum{self._label_text(values)} {_format_value(total)}")
+        lines.append(f"{self.name}_count{self._label_text(values)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """
+    A metrikák és a gyűjtők (collector) nyilvántartása. A gyűjtő egy függvény, amely a kiolvasáskor
+    Prometheus szöveges sorokat ad vissza (pl. más folyamatok megosztott memóriás számlálóiból).
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"Metric {metric.name} already registered with a different type or labels")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(self, collector):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def exposition(self):
+        """
+        Az összes metrika Prometheus szöveges formátumban.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.collect())
+        for collector in collectors:
+            try:
+                lines.extend(collector())
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {e}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# ---- közös metrikák ----
+
+MESSAGES_PUBLISHED = REGISTRY.counter(
+    "color_messages_published_total", "Messages published to the broker", ["publisher"])
+PUBLISH_ERRORS = REGISTRY.counter(
+    "color_publish_errors_total", "Publishes that failed or were not confirmed", ["publisher"])
+PUBLISH_LATENCY = REGISTRY.histogram(
+    "color_publish_latency_seconds", "Publish latency (until the broker confirm in confirm mode)", ["publisher"])
+MESSAGES_CONSUMED = REGISTRY.counter(
+    "color_messages_consumed_total", "Consumed messages by color and outcome (acked, rejected, requeued, ignored)",
+    ["color", "outcome"])
+MESSAGES_DEAD_LETTERED = REGISTRY.counter(
+    "color_messages_dead_lettered_total", "Messages rejected into a dead-letter exchange", ["color"])
+HANDLE_LATENCY = REGISTRY.histogram(
+    "color_handle_latency_seconds", "Time from delivery to ack/nack in the consumer", ["consumer"])
+MESSAGE_LATENCY = REGISTRY.histogram(
+    "color_message_latency_seconds", "Ingress-to-handle and queue-dwell latency of traced messages",
+    ["color", "kind"])
+MESSAGES_IN_FLIGHT = REGISTRY.gauge(
+    "color_messages_in_flight", "Messages delivered or published but not yet settled", ["component"])
+POOL_IN_USE = REGISTRY.gauge(
+    "color_publisher_channels_in_use", "Borrowed channels of the publisher pool", ["publisher"])
+PREFETCH_WINDOW = REGISTRY.gauge(
+    "color_prefetch_window", "Current prefetch (QoS) window of the consumer", ["consumer"])
+
+
+# ---- HTTP végpont ----
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        body = self.registry.exposition().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # A lekérdezéseket nem naplózzuk (a scraper néhány másodpercenként hív)
+        pass
+
+
+def start_metrics_server(port, host=METRICS_HOST, registry=REGISTRY):
+    """
+    Háttérszálon elindítja a /metrics végpontot. Ha a port foglalt, figyelmeztet és None-t ad vissza
+    (a metrikák hiánya miatt a szolgáltatás nem állhat le).
+    """
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+    try:
+        server = ThreadingHTTPServer((host, port), handler)
+    except OSError as e:
+        logger.warning(f"Cannot start metrics endpoint on {host}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info(f"Metrics available at http://{host}:{port}/metrics")
+    return server
+
+
+def serve_metrics(default_port):
+    """
+    A METRICS_PORT környezeti változó (alapértelmezés: default_port) portján indítja a végpontot;
+    METRICS_PORT=0 esetén kikapcsolva.
+    """
+    port = int(os.environ.get('METRICS_PORT', default_port))
+    if not port:
+        return None
+    return start_metrics_server(port)
@@ -0,0 +1,208 @@
+"""
+Adaptív prefetch (QoS ablak) szabályozó a pika alapú ColorMessageProcessor-okhoz.
+
+A fix prefetch_count=1 mellett a fogyasztó minden üzenet után kivár egy teljes broker oda-vissza utat
+(ack -> következő kézbesítés). A nagy fix érték viszont elvonja az üzeneteket a többi fogyasztótól.
+A szabályozó ezért méri a handler idejét és az ack utáni várakozást, és futás közben állítja az ablakot:
+
+- ha a fogyasztó az ack után érdemben várakozik a következő üzenetre (éhezik), az ablakot
+  multiplikatívan növeli;
+- ha a várakozás elhanyagolható, az ablakot tartja: a közel nulla várakozás éppen a cél, ezért csak
+  shrink_after egymást követő ilyen intervallum után csökkent egyesével (óvatos visszapróbálás). Azt az
+  ablakot, amelynél már éhezett, nem próbálja újra (a csökkentés alsó határa fölé kerül), így az ablak a
+  legkisebb elégséges értéken beáll, nem ingadozik. Ez a határ üresjárat (üres sor) után törlődik, mert
+  a terhelés addigra megváltozhatott.
+
+A hosszú várakozás (idle_threshold felett) azt jelenti, hogy üres a sor; ezt nem számítjuk éhezésnek.
+
+Offload módban (workers megadva) több handler fut párhuzamosan, így az ack utáni várakozás nem jelent
+éhezést. Ilyenkor a tétlen worker-időt mérjük: amíg van folyamatban lévő üzenet, de kevesebb, mint a
+workerek száma, a szabad workerek ideje éhezés (a kézbesítés nem tart lépést a pool-lal). Ha a
+folyamatban lévő üzenetek száma egy teljes intervallumon át az ablak fele alatt marad, az ablak
+túlméretezett, ilyenkor a shrink_after intervallum kivárása nélkül csökkentünk.
+"""
+import logging
+import math
+import os
+import time
+
+from common.metrics import HANDLE_LATENCY, PREFETCH_WINDOW
+
+logger = logging.getLogger("prefetch_controller")
+
+
+class AdaptivePrefetchController:
+    """
+    - min_prefetch / max_prefetch: az ablak határai
+    - adjust_interval: legfeljebb ilyen gyakran (másodperc) módosítunk
+    - starvation_high: ha az ack utáni várakozás a handler idejéhez képest ennél nagyobb arányú, növelünk
+    - starvation_low: ha ennél kisebb, az intervallum "nyugodt"; shrink_after egymást követő nyugodt
+      intervallum után csökkentünk, a kettő között tartjuk az ablakot
+    - idle_threshold: ennél hosszabb várakozás üres sort jelent, nem éhezést
+    - workers: offload módban a handler szálak száma (az ablak alsó korlátja is); None = inline mód
+    - apply: függvény, amely az új ablakot beállítja (pl. lambda n: channel.basic_qos(prefetch_count=n))
+    - enabled: kikapcsolva az ablak végig min_prefetch marad
+    """
+
+    def __init__(self, min_prefetch=1, max_prefetch=256, adjust_interval=1.0, starvation_high=0.05,
+                 starvation_low=0.005, idle_threshold=0.05, shrink_after=5, workers=None, apply=None, enabled=True,
+                 name="consumer"):
+        if workers is not None:
+            min_prefetch = max(min_prefetch, workers)
+        self.min_prefetch = min_prefetch
+        self.max_prefetch = max(min_prefetch, max_prefetch)
+        self.adjust_interval = adjust_interval
+        self.starvation_high = starvation_high
+        self.starvation_low = starvation_low
+        self.idle_threshold = idle_threshold
+        self.shrink_after = max(1, shrink_after)
+        self.workers = workers
+        self.apply = apply
+        self.enabled = enabled
+        self.name = name
+
+        self.window = min_prefetch
+        self.adjustments = 0
+        self.handler_time_avg = 0.0  # mozgóátlag (EWMA), másodperc
+        self.ack_wait_avg = 0.0      # az ack és a következő kézbesítés közti várakozás mozgóátlaga
+
+        self._last_ack = None
+        self._busy = 0.0
+        self._starved = 0.0
+        self._calm_intervals = 0
+        self._floor = min_prefetch  # a legutóbb éhező ablak + 1; ez alá nem csökkentünk
+        # Offload mód: folyamatban lévő üzenetek és a tétlen worker-idő
+        self._in_flight = 0
+        self._peak_in_flight = 0
+        self._last_change = time.monotonic()
+        self._last_adjust = self._last_change
+        self._handle_latency = HANDLE_LATENCY.labels(name)
+        PREFETCH_WINDOW.labels(name).set_function(lambda: self.window)
+
+    @classmethod
+    def from_env(cls, apply=None, name="consumer", workers=None):
+        """
+        Beállítás környezeti változókból: ADAPTIVE_PREFETCH (0/1), PREFETCH_MIN, PREFETCH_MAX,
+        PREFETCH_SHRINK_AFTER (intervallum).
+
+        ADAPTIVE_PREFETCH=1 esetén az ablakot futás közben állítjuk PREFETCH_MIN és PREFETCH_MAX között
+        (inline módban az ack utáni várakozás, offload módban a tétlen worker-idő alapján); kikapcsolva
+        végig a PREFETCH_MIN (1) marad.
+
+        :param workers: offload módban (CONSUMER_MODE) a handler szálak száma; ez az ablak alsó korlátja is
+                        a PREFETCH_MIN-től függetlenül, különben a szálpool sosem telhetne meg
+        """
+        return cls(
+            min_prefetch=int(os.environ.get('PREFETCH_MIN', 1)),
+            max_prefetch=int(os.environ.get('PREFETCH_MAX', 256)),
+            shrink_after=int(os.environ.get('PREFETCH_SHRINK_AFTER', 5)),
+            workers=workers,
+            apply=apply,
+            enabled=os.environ.get('ADAPTIVE_PREFETCH', '0') == '1',
+            name=name
+        )
+
+    def message_started(self):
+        """
+        A feldolgozás elején hívandó; visszaadja a kezdési időt, amit a message_finished() vár.
+        """
+        now = time.monotonic()
+        if self.workers is not None:
+            self._track_workers(now, 1)
+        elif self._last_ack is not None:
+            wait = now - self._last_ack
+            # A hosszú szünet üres sort jelent, az nem a prefetch hibája
+            if wait < self.idle_threshold:
+                self._starved += wait
+                self.ack_wait_avg = 0.9 * self.ack_wait_avg + 0.1 * wait
+            else:
+                self._floor = self.min_prefetch
+        return now
+
+    def message_finished(self, started):
+        """
+        A nyugtázás után hívandó. Ha esedékes, újraszámolja és beállítja az ablakot.
+
+        :return: az új ablak, ha változott, különben None
+        """
+        now = time.monotonic()
+        handler_time = now - started
+        if self.workers is not None:
+            self._track_workers(now, -1)
+        else:
+            self._busy += handler_time
+        self.handler_time_avg = 0.9 * self.handler_time_avg + 0.1 * handler_time
+        self._handle_latency.observe(handler_time)
+        self._last_ack = now
+
+        if not self.enabled or now - self._last_adjust < self.adjust_interval:
+            return None
+        return self._adjust(now)
+
+    def _track_workers(self, now, delta):
+        """
+        Offload mód: a folyamatban lévő üzenetek számának változásakor az eltelt időt busy / tétlen
+        worker-időre bontja. Üres pool (0 folyamatban) nem számít éhezésnek, az üres sort jelent.
+        """
+        elapsed = now - self._last_change
+        if self._in_flight > 0:
+            running = min(self._in_flight, self.workers)
+            self._busy += elapsed * running
+            self._starved += elapsed * (self.workers - running)
+        elif elapsed >= self.idle_threshold:
+            self._floor = self.min_prefetch
+        self._in_flight += delta
+        self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+        self._last_change = now
+
+    def _adjust(self, now):
+        if self.workers is not None:
+            # A még futó szakaszt is beszámítjuk, különben egy hosszú intervallum kimaradna
+            self._track_workers(now, 0)
+        busy, starved = self._busy, self._starved
+        peak_in_flight, self._peak_in_flight = self._peak_in_flight, self._in_flight
+        self._busy = self._starved = 0.0
+        self._last_adjust = now
+        if busy <= 0:
+            return None
+
+        starvation = starved / busy
+        if starvation > self.starvation_high:
+            # Éhezik: a hiányzó várakozás arányában, de legalább eggyel és legfeljebb duplájára növelünk
+            factor = min(2.0, 1.0 + starvation)
+            new_window = min(self.max_prefetch, max(self.window + 1, math.ceil(self.window * factor)))
+            self._floor = min(self.max_prefetch, max(self._floor, self.window + 1))
+            self._calm_intervals = 0
+        elif starvation < self.starvation_low:
+            self._calm_intervals += 1
+            oversized = self.workers is not None and peak_in_flight <= self.window // 2
+            if not oversized and self._calm_intervals < self.shrink_after:
+                return None
+            new_window = max(self._floor, self.window - 1)
+            self._calm_intervals = 0
+        else:
+            self._calm_intervals = 0
+            return None
+
+        if new_window == self.window:
+            return None
+
+        logger.info(f"{self.name} prefetch window {self.window} -> {new_window} "
+                    f"(starvation {starvation:.1%}, handler {self.handler_time_avg * 1000:.2f} ms, "
+                    f"ack wait {self.ack_wait_avg * 1000:.2f} ms)")
+        self.window = new_window
+        self.adjustments += 1
+        if self.apply:
+            self.apply(new_window)
+        return new_window
+
+    def metrics(self):
+        """
+        A szabályozó aktuális állapota metrikaként.
+        """
+        return {
+            "prefetch_window": self.window,
+            "prefetch_adjustments": self.adjustments,
+            "handler_time_avg_ms": self.handler_time_avg * 1000,
+            "ack_wait_avg_ms": self.ack_wait_avg * 1000
+        }
@@ -0,0 +1,318 @@
+import itertools
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import pika
+from pika.exceptions import AMQPChannelError, AMQPConnectionError
+
+from common.metrics import MESSAGES_PUBLISHED, PUBLISH_ERRORS, PUBLISH_LATENCY, POOL_IN_USE
+from common.transport import blocking_connection, uses_memory
+
+logger = logging.getLogger("publisher_pool")
+
+_pool_ids = itertools.count(1)
+
+
+def connection_parameters(host, port, user, password, **kwargs):
+    """
+    A szolgáltatásokban ismétlődő pika.ConnectionParameters összeállítása.
+    A heartbeat-et az egészség-ellenőrző szál szolgálja ki, így a tétlen kapcsolatok sem szakadnak le.
+    """
+    kwargs.setdefault('heartbeat', 60)
+    kwargs.setdefault('blocked_connection_timeout', 30)
+    return pika.ConnectionParameters(
+        host=host,
+        port=port,
+        credentials=pika.PlainCredentials(user, password),
+        **kwargs
+    )
+
+
+def _check_wait(wait):
+    """
+    A ChannelPool nem kér visszaigazolást, így wait=True mellett a sikeres visszatérés hamis ígéret lenne.
+    Kivétel a memory transport: ott a publikálás szinkron, a visszatéréskor az üzenet már a sorban van
+    (ezért adja a create_publisher() confirm módban is a poolt).
+    """
+    if wait and not uses_memory():
+        raise ValueError("Cannot wait for broker confirms: publisher confirms are disabled (PUBLISHER_CONFIRMS=off)")
+
+
+class _PooledConnection:
+    """
+    Egy fizikai (TCP) kapcsolat és a rajta megnyitott csatornák.
+    A pika BlockingConnection nem szálbiztos, ezért minden I/O a kapcsolat zárja alatt történik.
+    """
+
+    def __init__(self, parameters, topology=None, topology_declared=None):
+        self.parameters = parameters
+        self.topology = topology
+        self.topology_declared = topology_declared  # a pool kapcsolatai között megosztott threading.Event
+        self.lock = threading.Lock()
+        self.connection = None
+        self.generation = 0  # minden újrakapcsolódáskor nő, így a csatornák tudják, hogy elavultak
+
+    def is_open(self):
+        return self.connection is not None and self.connection.is_open
+
+    def ensure_open(self):
+        if not self.is_open():
+            self.connection = blocking_connection(self.parameters)
+            self.generation += 1
+            # Az első kapcsolatnál egyszer, újrakapcsolódás után pedig újra deklaráljuk a topológiát,
+            # mert a broker közben akár újra is indulhatott
+            if self.topology and (self.generation > 1 or not self.topology_declared.is_set()):
+                self.declare_topology()
+        return self.connection
+
+    def declare_topology(self):
+        channel = self.connection.channel()
+        try:
+            self.topology(channel)
+        finally:
+            channel.close()
+        self.topology_declared.set()
+
+    def close(self):
+        if self.is_open():
+            try:
+                self.connection.close()
+            except Exception as e:
+                logger.warning(f"Error closing pooled connection: {e}")
+        self.connection = None
+
+
+class PooledChannel:
+    """
+    A poolból kölcsönözhető csatorna. A tényleges pika csatornát lustán, az első használatkor nyitja meg,
+    és ha a kapcsolat vagy a csatorna közben bezárult, újranyitja.
+    """
+
+    def __init__(self, pooled_connection, setup=None):
+        self.pooled_connection = pooled_connection
+        self.setup = setup
+        self.channel = None
+        self.generation = -1
+
+    def ensure_open(self):
+        connection = self.pooled_connection.ensure_open()
+        if (self.channel is None or not self.channel.is_open
+                or self.generation != self.pooled_connection.generation):
+            self.channel = connection.channel()
+            self.generation = self.pooled_connection.generation
+            if self.setup:
+                self.setup(self.channel)
+        return self.channel
+
+    def invalidate(self):
+        """
+        Hiba után eldobja a csatornát; a következő kölcsönzés újat nyit.
+        """
+        if self.channel is not None and self.channel.is_open:
+            try:
+                self.channel.close()
+            except Exception:
+                pass
+        self.channel = None
+
+
+class ChannelPool:
+    """
+    Szálbiztos, hosszú életű publisher pool.
+
+    A Flask/WSGI worker szálak kérésenként kölcsönöznek egy csatornát, így egy publikálás
+    egyetlen frame írása, nem pedig egy teljes kapcsolat felépítése és lezárása.
+
+    - connections: a fizikai kapcsolatok száma, kapcsolatonként egy csatornával. Csak ez skálázódik: a pika
+      BlockingConnection nem szálbiztos, így egy kapcsolat minden csatornája ugyanazt a zárat használná,
+      és több csatorna sem adna párhuzamosságot. Ennyi publikálás futhat valóban párhuzamosan.
+    - setup: a csatorna megnyitásakor egyszer lefutó függvény (pl. queue_declare), újrakapcsolódáskor újra lefut
+    - topology: exchange-eket és queue-kat deklaráló függvény; az első kapcsolat megnyitásakor (start()) egyszer fut,
+      és csak egy kapcsolat újranyitásakor fut le ismét
+    - acquire_timeout: ennyi másodpercig vár szabad csatornára, utána TimeoutError
+    - health_check_interval: a tétlen kapcsolatok heartbeat-kiszolgálásának gyakorisága (0 = kikapcsolva)
+    - name: a pool címkéje a kölcsönzött csatornák metrikájában (alapértelmezés: "pool-<sorszám>", így egy
+      folyamat több poolja nem írja felül egymás értékét)
+    """
+
+    def __init__(self, parameters, connections=2, setup=None, topology=None, acquire_timeout=5.0,
+                 health_check_interval=10.0, retries=1, name=None):
+        self.parameters = parameters
+        self.acquire_timeout = acquire_timeout
+        self.retries = retries
+        self._topology_declared = threading.Event()
+        self._connections = [
+            _PooledConnection(parameters, topology, self._topology_declared) for _ in range(connections)
+        ]
+        self._free = queue.LifoQueue(maxsize=connections)
+        for pooled_connection in self._connections:
+            self._free.put(PooledChannel(pooled_connection, setup))
+
+        self._closed = threading.Event()
+        self._health_thread = None
+        self._published = MESSAGES_PUBLISHED.labels("pool")
+        self._errors = PUBLISH_ERRORS.labels("pool")
+        self._latency = PUBLISH_LATENCY.labels("pool")
+        self.name = name or f"pool-{next(_pool_ids)}"
+        POOL_IN_USE.labels(self.name).set_function(lambda: self.size - self.available())
+        if health_check_interval:
+            self._health_thread = threading.Thread(
+                target=self._health_check_loop,
+                args=(health_check_interval,),
+                name="publisher-pool-health",
+                daemon=True
+            )
+            self._health_thread.start()
+
+    @property
+    def size(self):
+        return self._free.maxsize
+
+    def available(self):
+        """
+        A pillanatnyilag szabad csatornák száma (metrikákhoz, diagnosztikához).
+        """
+        return self._free.qsize()
+
+    def start(self):
+        """
+        Induláskor megnyitja az összes kapcsolatot és egyszer deklarálja a topológiát,
+        így a konfigurációs hibák már induláskor kiderülnek, nem az első kérésnél.
+        """
+        for pooled_connection in self._connections:
+            with pooled_connection.lock:
+                pooled_connection.ensure_open()
+        return self
+
+    @contextmanager
+    def acquire(self):
+        """
+        Kölcsönöz egy nyitott csatornát a poolból:
+
+            with pool.acquire() as channel:
+                channel.basic_publish(...)
+
+        Kapcsolati hiba esetén a csatornát eldobja, a következő kölcsönzés újat nyit.
+        """
+        if self._closed.is_set():
+            raise RuntimeError("Channel pool is closed")
+        try:
+            pooled = self._free.get(timeout=self.acquire_timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No free channel in the pool within {self.acquire_timeout} seconds")
+
+        lock = pooled.pooled_connection.lock
+        lock.acquire()
+        try:
+            channel = pooled.ensure_open()
+            yield channel
+        except (AMQPConnectionError, AMQPChannelError):
+            pooled.invalidate()
+            if not pooled.pooled_connection.is_open():
+                pooled.pooled_connection.close()
+            raise
+        finally:
+            lock.release()
+            self._free.put(pooled)
+
+    def publish(self, exchange, routing_key, body, properties=None, wait=None):
+        """
+        Üzenet küldése egy kölcsönzött csatornán.
+        Kapcsolati hiba esetén átlátszóan újrakapcsolódik és legfeljebb `retries` alkalommal újrapróbálja.
+
+        :param wait: csak a ConfirmPublisherrel közös interfész miatt van; confirm mód nélkül nincs mire várni
+        :raises ValueError: wait=True esetén (visszaigazolás nélkül nem tudjuk megvárni)
+        """
+        _check_wait(wait)
+        attempt = 0
+        started = time.perf_counter()
+        while True:
+            try:
+                with self.acquire() as channel:
+                    channel.basic_publish(
+                        exchange=exchange,
+                        routing_key=routing_key,
+                        body=body,
+                        properties=properties
+                    )
+                self._published.inc()
+                self._latency.observe(time.perf_counter() - started)
+                return
+            except (AMQPConnectionError, AMQPChannelError) as e:
+                if attempt >= self.retries:
+                    self._errors.inc()
+                    raise
+                attempt += 1
+                logger.warning(f"Publish failed ({e}), reconnecting (attempt {attempt}/{self.retries})...")
+
+    def publish_many(self, messages, wait=None):
+        """
+        Több üzenet küldése egyetlen kölcsönzött csatornán, egy sorozatban.
+        Ha közben megszakad a kapcsolat, a már elküldött üzenetek sikeresek maradnak, a többi hibát kap.
+
+        :param messages: (exchange, routing_key, body, properties) négyesek listája
+        :return: elemenkénti hibák listája (None = sikeres)
+        :raises ValueError: wait=True esetén (visszaigazolás nélkül nem tudjuk megvárni)
+        """
+        _check_wait(wait)
+        errors = [None] * len(messages)
+        sent = 0
+        try:
+            with self.acquire() as channel:
+                for exchange, routing_key, body, properties in messages:
+                    channel.basic_publish(
+                        exchange=exchange,
+                        routing_key=routing_key,
+                        body=body,
+                        properties=properties
+                    )
+                    sent += 1
+        except Exception as e:
+            for index in range(sent, len(messages)):
+                errors[index] = e
+            self._errors.inc(len(messages) - sent)
+        self._published.inc(sent)
+        return errors
+
+    def _health_check_loop(self, interval):
+        """
+        Háttérszál: a tétlen kapcsolatokon kiszolgálja a heartbeat-et, és eldobja a halott kapcsolatokat,
+        hogy a következő kérés már ne egy leszakadt socketre fusson rá.
+        """
+        while not self._closed.wait(interval):
+            for pooled_connection in self._connections:
+                # Ha éppen használatban van, a publikálás úgyis kiszolgálja a kapcsolatot
+                if not pooled_connection.lock.acquire(blocking=False):
+                    continue
+                try:
+                    if pooled_connection.connection is None:
+                        continue
+                    if pooled_connection.is_open():
+                        pooled_connection.connection.process_data_events(time_limit=0)
+                    else:
+                        pooled_connection.close()
+                except Exception as e:
+                    logger.warning(f"Health check failed, dropping pooled connection: {e}")
+                    pooled_connection.close()
+                finally:
+                    pooled_connection.lock.release()
+
+    def close(self, timeout=5.0):
+        """
+        Lezárja a pool összes kapcsolatát. A kölcsönzött csatornák visszaadását legfeljebb `timeout` ideig várja.
+        """
+        self._closed.set()
+        deadline = time.monotonic() + timeout
+        for pooled_connection in self._connections:
+            remaining = max(0.0, deadline - time.monotonic())
+            acquired = pooled_connection.lock.acquire(timeout=remaining)
+            try:
+                pooled_connection.close()
+            finally:
+                if acquired:
+                    pooled_connection.lock.release()
+        if self._health_thread is not None:
+            self._health_thread.join(timeout=1)
@@ -0,0 +1,299 @@
+"""
+Folyamaton belüli statisztika-gyűjtő az MDB-khez.
+
+A feldolgozók korábban minden 10. üzenet után szinkron basic_publish-sel küldtek egy szöveges
+statisztikát a fogyasztó csatornán, ami nagy forgalomnál plusz 10% broker-forgalom, és megállítja
+a fogyasztást. Itt a feldolgozó csak egy számlálót növel (szín és kimenetel szerint), a háttérszál pedig
+intervallumonként (vagy N üzenetenként) egyetlen tömör delta üzenetet küld, saját kapcsolaton.
+
+A delta alapértelmezésben a common.stats_codec bináris formátumában megy (STATS_FORMAT=binary);
+hibakereséshez olvasható JSON is kérhető (STATS_FORMAT=json):
+    {"type": "color_stats", "v": 1, "processor": "host:1234", "window_start": 1700000000.0,
+     "window_end": 1700000001.0, "counts": {"RED": {"acked": 120, "requeued": 3}}}
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+import pika
+
+from common.metrics import MESSAGES_CONSUMED
+from common.stats_codec import STATS_CONTENT_TYPE, StatsRecord, encode_batch, processor_code
+from common.tracing import KIND_INGRESS_TO_HANDLE, LatencyHistogram
+from common.transport import blocking_connection
+
+logger = logging.getLogger("stats_aggregator")
+
+STATISTICS_QUEUE = 'colorStatistics'
+
+# Az üzenetek kimenetele
+OUTCOME_ACKED = 'acked'        # feldolgozva és nyugtázva
+OUTCOME_REJECTED = 'rejected'  # visszautasítva requeue nélkül (pl. DLQ-ba)
+OUTCOME_REQUEUED = 'requeued'  # visszarakva a sorba
+OUTCOME_IGNORED = 'ignored'    # nyugtázva, de nem ennek a feldolgozónak szólt
+OUTCOMES = (OUTCOME_ACKED, OUTCOME_REJECTED, OUTCOME_REQUEUED, OUTCOME_IGNORED)
+
+STATS_RECORD_TYPE = 'color_stats'
+STATS_RECORD_VERSION = 1
+
+# A STATS_FORMAT környezeti változó értékei
+FORMAT_BINARY = 'binary'
+FORMAT_JSON = 'json'
+
+
+def default_processor_id():
+    return os.environ.get('STATS_PROCESSOR_ID') or f"{socket.gethostname()}:{os.getpid()}"
+
+
+class StatsAggregator:
+    """
+    Szálbiztos számlálók és háttérben futó küldés.
+
+    - parameters: pika.ConnectionParameters a küldő (saját) kapcsolathoz
+    - processor_id: a rekordban szereplő feldolgozó-azonosító
+    - flush_interval: legalább ilyen gyakran (másodperc) küldünk, ha van mit
+    - flush_every: ennyi rögzített üzenet után az intervallum lejárta előtt is küldünk
+    - stats_format: FORMAT_BINARY (alapértelmezett) vagy FORMAT_JSON (hibakereséshez)
+    """
+
+    def __init__(self, parameters, processor_id=None, flush_interval=1.0, flush_every=1000,
+                 queue=STATISTICS_QUEUE, stats_format=FORMAT_BINARY):
+        if stats_format not in (FORMAT_BINARY, FORMAT_JSON):
+            raise ValueError(f"Invalid STATS_FORMAT value: {stats_format} (expected binary or json)")
+        self.parameters = parameters
+        self.processor_id = processor_id or default_processor_id()
+        self.stats_format = stats_format
+        self.flush_interval = flush_interval
+        self.flush_every = flush_every
+        self.queue = queue
+
+        self._lock = threading.Lock()
+        self._counts = {}  # (szín, kimenetel) -> [darab, késleltetés-minták száma, összege, minimuma, maximuma]
+        self._latency = {}  # (szín, fajta) -> LatencyHistogram (common.tracing)
+        self._pending = 0
+        self._window_start = time.time()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._connection = None
+        self._channel = None
+
+    @classmethod
+    def from_env(cls, parameters, processor_id=None):
+        """
+        Beállítás környezeti változókból: STATS_FLUSH_INTERVAL (másodperc), STATS_FLUSH_EVERY (üzenet),
+        STATS_FORMAT (binary | json).
+        """
+        return cls(
+            parameters,
+            processor_id=processor_id,
+            flush_interval=float(os.environ.get('STATS_FLUSH_INTERVAL', 1.0)),
+            flush_every=int(os.environ.get('STATS_FLUSH_EVERY', 1000)),
+            stats_format=os.environ.get('STATS_FORMAT', FORMAT_BINARY)
+        )
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="stats-flusher", daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self, timeout=5.0):
+        """
+        Leállítja a háttérszálat; a még el nem küldött számlálókat utoljára kiküldi.
+        """
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    # ---- a feldolgozók hot path-ja ----
+
+    def record(self, color, outcome, count=1, latency=None):
+        """
+        Egy üzenet kimenetelének rögzítése. Nem végez I/O-t, csak a zár alatt növel egy számlálót.
+
+        :param latency: opcionális késleltetés másodpercben (a rekord min/átlag/max mezőihez); ha nincs,
+                        a bináris rekord ezeket a szín ingress -> feldolgozás hisztogramjából tölti ki
+        """
+        key = (color, outcome)
+        with self._lock:
+            entry = self._counts.get(key)
+            if entry is None:
+                entry = self._counts[key] = [0, 0, 0.0, None, None]
+            entry[0] += count
+            if latency is not None:
+                entry[1] += 1
+                entry[2] += latency
+                if entry[3] is None or latency < entry[3]:
+                    entry[3] = latency
+                if entry[4] is None or latency > entry[4]:
+                    entry[4] = latency
+            self._pending += count
+            full = self._pending >= self.flush_every
+        MESSAGES_CONSUMED.labels(color, outcome).inc(count)
+        if full:
+            self._wake.set()
+
+    def record_latency(self, color, kind, seconds):
+        """
+        Egy végpontok közötti késleltetés-minta (common.tracing) a színenkénti hisztogramba.
+        """
+        key = (color, kind)
+        with self._lock:
+            histogram = self._latency.get(key)
+            if histogram is None:
+                histogram = self._latency[key] = LatencyHistogram()
+            histogram.record(seconds)
+
+    # ---- háttérszál ----
+
+    def _take(self):
+        """
+        Kicseréli a számlálókat üresre, és visszaadja az eddigi deltát az ablak határaival.
+        """
+        with self._lock:
+            counts, self._counts = self._counts, {}
+            latency, self._latency = self._latency, {}
+            self._pending = 0
+            window_start, self._window_start = self._window_start, time.time()
+        return counts, latency, window_start, self._window_start
+
+    def _restore(self, counts, latency):
+        """
+        Sikertelen küldés után a deltát visszaolvasztja, hogy a következő körben elmenjen.
+        """
+        with self._lock:
+            for key, histogram in latency.items():
+                self._latency.setdefault(key, LatencyHistogram()).merge(histogram)
+            for key, (count, samples, total, low, high) in counts.items():
+                entry = self._counts.get(key)
+                if entry is None:
+                    self._counts[key] = [count, samples, total, low, high]
+                else:
+                    entry[0] += count
+                    entry[1] += samples
+                    entry[2] += total
+                    if low is not None and (entry[3] is None or low < entry[3]):
+                        entry[3] = low
+                    if high is not None and (entry[4] is None or high > entry[4]):
+                        entry[4] = high
+                self._pending += count
+
+    def encode(self, counts, window_start, window_end, latency=None):
+        """
+        :param latency: (szín, fajta) -> LatencyHistogram; a hisztogramok vödörszámai összevonhatók
+        :return: (törzs, content_type) a beállított formátum szerint
+        """
+        latency = latency or {}
+        if self.stats_format == FORMAT_JSON:
+            by_color = {}
+            for (color, outcome), entry in counts.items():
+                by_color.setdefault(color, {})[outcome] = entry[0]
+            record = {
+                "type": STATS_RECORD_TYPE,
+                "v": STATS_RECORD_VERSION,
+                "processor": self.processor_id,
+                "window_start": round(window_start, 3),
+                "window_end": round(window_end, 3),
+                "counts": by_color
+            }
+            if latency:
+                record["latency"] = {}
+                for (color, kind), histogram in latency.items():
+                    record["latency"].setdefault(color, {})[kind] = histogram.counts
+            body = json.dumps(record, separators=(',', ':')).encode('utf-8')
+            return body, 'application/json'
+
+        processor = processor_code(self.processor_id)
+        window_start_ms = int(window_start * 1000)
+        window_ms = max(0, int((window_end - window_start) * 1000))
+        records = []
+        for (color, outcome), (count, samples, total, low, high) in counts.items():
+            # A feldolgozott üzenetek késleltetés-mezői a szín ingress -> feldolgozás hisztogramjából (ha van);
+            # a record(latency=...) mintái a min / átlag / max mezőkben elsőbbséget kapnak
+            histogram = latency.get((color, KIND_INGRESS_TO_HANDLE)) if outcome == OUTCOME_ACKED else None
+            if samples:
+                low_us, avg_us, high_us = _micros(low), _micros(total / samples), _micros(high)
+            elif histogram is not None:
+                low_us, avg_us, high_us = (_clamp(histogram.minimum()), _clamp(histogram.mean()),
+                                           _clamp(histogram.maximum()))
+            else:
+                low_us = avg_us = high_us = 0
+            p99 = histogram.percentile(0.99) if histogram is not None else None
+            records.append(StatsRecord(
+                color, outcome, processor, count, window_start_ms, window_ms,
+                low_us, avg_us, high_us, _clamp(p99)
+            ))
+        histograms = [(color, kind, histogram.counts) for (color, kind), histogram in latency.items()]
+        return encode_batch(records, histograms), STATS_CONTENT_TYPE
+
+    def flush(self):
+        counts, latency, window_start, window_end = self._take()
+        if not counts and not latency:
+            return
+        body, content_type = self.encode(counts, window_start, window_end, latency)
+        try:
+            self._ensure_channel()
+            self._channel.basic_publish(
+                exchange='',
+                routing_key=self.queue,
+                body=body,
+                properties=pika.BasicProperties(content_type=content_type)
+            )
+            logger.debug(f"Sent statistics: {len(counts)} records, {len(body)} bytes")
+        except Exception as e:
+            logger.error(f"Error sending statistics: {e}")
+            self._restore(counts, latency)
+            self._drop_connection()
+
+    def _ensure_channel(self):
+        if self._connection is None or not self._connection.is_open:
+            self._connection = blocking_connection(self.parameters)
+            self._channel = self._connection.channel()
+            self._channel.queue_declare(queue=self.queue)
+
+    def _drop_connection(self):
+        try:
+            if self._connection is not None and self._connection.is_open:
+                self._connection.close()
+        except Exception:
+            pass
+        self._connection = None
+        self._channel = None
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+            # A tétlen kapcsolaton is kiszolgáljuk a heartbeat-et
+            if self._connection is not None and self._connection.is_open:
+                try:
+                    self._connection.process_data_events(0)
+                except Exception:
+                    self._drop_connection()
+        self.flush()
+        self._drop_connection()
+
+
+def _micros(seconds):
+    """
+    Másodperc -> µs, a rekord u32 mezőjébe szorítva (None = nincs adat = 0).
+    """
+    if seconds is None:
+        return 0
+    return _clamp(seconds * 1_000_000)
+
+
+def _clamp(micros):
+    """
+    µs -> a rekord u32 mezője (None = nincs adat = 0).
+    """
+    if micros is None:
+        return 0
+    return min(0xFFFFFFFF, max(0, int(micros)))
@@ -0,0 +1,152 @@
+"""
+Tömör, verziózott bináris formátum a színstatisztikákhoz (MDB -> colorStatistics -> statistics_client).
+
+Egy AMQP üzenet = fejléc + N rögzített méretű rekord (little-endian):
+
+    fejléc  (6 bájt):  magic "CS" | verzió u8 | flags u8 | rekordok száma u16
+    rekord (40 bájt):  szín u8 | kimenetel u8 | foglalt u16 | feldolgozó u32 | darab u32 |
+                       ablak kezdete u64 (epoch ms) | ablak hossza u32 (ms) |
+                       késleltetés min / átlag / max / p99 u32 (µs, 0 = nincs adat)
+
+A dekódoló a rekordokat egyetlen struct.iter_unpack menetben, a törzs memoryview-ján bontja ki,
+másolás nélkül. A szöveges (JSON) forma hibakereséshez megmaradt (STATS_FORMAT=json).
+
+Ha a fejléc flags mezőjében a FLAG_HISTOGRAMS bit be van állítva, a rekordok után késleltetés-
+hisztogramok következnek (common.tracing, összevonható vödörszámok):
+
+    szakasz fejléce (2 bájt):   hisztogramok száma u16
+    hisztogram (4 bájt):        szín u8 | fajta u8 | nem üres vödrök száma u16
+    vödör (6 bájt):             vödörindex u16 | darab u32
+
+A régi dekódoló a flags-et nem nézi, a rekordok utáni részt figyelmen kívül hagyja.
+"""
+import struct
+import zlib
+from collections import namedtuple
+
+from common.color_codec import COLOR_CODES
+
+STATS_CONTENT_TYPE = 'application/x-color-stats'
+STATS_MAGIC = b'CS'
+STATS_VERSION = 1
+
+HEADER = struct.Struct('<2sBBH')
+RECORD = struct.Struct('<BBHIIQIIIII')
+MAX_RECORDS = 0xFFFF
+
+FLAG_HISTOGRAMS = 0x01
+HISTOGRAM_SECTION = struct.Struct('<H')
+HISTOGRAM = struct.Struct('<BBH')
+BUCKET = struct.Struct('<HI')
+
+# A kódokat csak bővíteni szabad, átszámozni nem (a régi rekordok is olvashatók maradjanak)
+COLOR_IDS = COLOR_CODES  # ugyanaz a színkód, mint az üzenetekben (common.color_codec)
+COLOR_NAMES = {code: name for name, code in COLOR_IDS.items()}
+OUTCOME_IDS = {"acked": 1, "rejected": 2, "requeued": 3, "ignored": 4}
+OUTCOME_NAMES = {code: name for name, code in OUTCOME_IDS.items()}
+LATENCY_KIND_IDS = {"ingress_to_handle": 1, "queue_dwell": 2}
+LATENCY_KIND_NAMES = {code: name for name, code in LATENCY_KIND_IDS.items()}
+UNKNOWN = 0
+
+StatsRecord = namedtuple("StatsRecord", [
+    "color", "outcome", "processor", "count", "window_start_ms", "window_ms",
+    "latency_min_us", "latency_avg_us", "latency_max_us", "latency_p99_us"
+])
+
+
+def processor_code(processor_id):
+    """
+    A feldolgozó szöveges azonosítójából (pl. "host:1234") 32 bites kód.
+    """
+    return zlib.crc32(processor_id.encode('utf-8'))
+
+
+def encode_batch(records, histograms=None):
+    """
+    :param records: StatsRecord-ok (color és outcome névvel, pl. "RED", "acked")
+    :param histograms: opcionális (szín, fajta, {vödörindex: darab}) hármasok
+    :return: bytes - egyetlen AMQP üzenet törzse
+    """
+    if len(records) > MAX_RECORDS:
+        raise ValueError(f"Too many stats records in one batch: {len(records)} (max {MAX_RECORDS})")
+    buffer = bytearray(HEADER.size + RECORD.size * len(records))
+    HEADER.pack_into(buffer, 0, STATS_MAGIC, STATS_VERSION, FLAG_HISTOGRAMS if histograms else 0, len(records))
+    offset = HEADER.size
+    for record in records:
+        RECORD.pack_into(
+            buffer, offset,
+            COLOR_IDS.get(record.color, UNKNOWN), OUTCOME_IDS.get(record.outcome, UNKNOWN), 0,
+            record.processor, record.count, record.window_start_ms, record.window_ms,
+            record.latency_min_us, record.latency_avg_us, record.latency_max_us, record.latency_p99_us
+        )
+        offset += RECORD.size
+    if histograms:
+        buffer += HISTOGRAM_SECTION.pack(len(histograms))
+        for color, kind, counts in histograms:
+            buffer += HISTOGRAM.pack(COLOR_IDS.get(color, UNKNOWN), LATENCY_KIND_IDS.get(kind, UNKNOWN), len(counts))
+            for index, count in counts.items():
+                buffer += BUCKET.pack(index, min(count, 0xFFFFFFFF))
+    return bytes(buffer)
+
+
+def iter_raw(body):
+    """
+    A rekordokat nyers tuple-ként adja vissza, egyetlen iter_unpack menetben, másolás nélkül:
+    (szín kód, kimenetel kód, foglalt, feldolgozó, darab, ablak kezdete, ablak hossza, lat min, átlag, max, p99)
+
+    :raises ValueError: ha a törzs nem ilyen formátumú vagy ismeretlen a verziója
+    """
+    view = memoryview(body)
+    if len(view) < HEADER.size:
+        raise ValueError("Stats batch too short")
+    magic, version, _flags, count = HEADER.unpack_from(view)
+    if magic != STATS_MAGIC:
+        raise ValueError("Not a color stats batch")
+    if version != STATS_VERSION:
+        raise ValueError(f"Unsupported stats batch version: {version}")
+    end = HEADER.size + count * RECORD.size
+    if len(view) < end:
+        raise ValueError(f"Truncated stats batch: {count} records announced, {len(view)} bytes")
+    return RECORD.iter_unpack(view[HEADER.size:end])
+
+
+def decode_batch(body):
+    """
+    :return: StatsRecord-ok listája, a kódok névre fordítva (ismeretlen kód esetén a szám marad)
+    """
+    return [
+        StatsRecord(COLOR_NAMES.get(color, color), OUTCOME_NAMES.get(outcome, outcome), *rest)
+        for color, outcome, _reserved, *rest in iter_raw(body)
+    ]
+
+
+def iter_histograms(body):
+    """
+    A rekordok utáni hisztogram-szakasz: (szín kód, fajta kód, {vödörindex: darab}) hármasok.
+    Ha nincs ilyen szakasz, üres.
+    """
+    view = memoryview(body)
+    _magic, _version, flags, count = HEADER.unpack_from(view)
+    if not flags & FLAG_HISTOGRAMS:
+        return
+    offset = HEADER.size + count * RECORD.size
+    (histograms,) = HISTOGRAM_SECTION.unpack_from(view, offset)
+    offset += HISTOGRAM_SECTION.size
+    for _ in range(histograms):
+        color, kind, buckets = HISTOGRAM.unpack_from(view, offset)
+        offset += HISTOGRAM.size
+        end = offset + buckets * BUCKET.size
+        if len(view) < end:
+            raise ValueError("Truncated stats histogram section")
+        yield color, kind, dict(BUCKET.iter_unpack(view[offset:end]))
+        offset = end
+
+
+def decode_histograms(body):
+    """
+    :return: (szín, fajta, {vödörindex: darab}) hármasok listája, a kódok névre fordítva
+    """
+    return [
+        (COLOR_NAMES.get(color, color), LATENCY_KIND_NAMES.get(kind, kind), counts)
+        for color, kind, counts in iter_histograms(body)
+    ]
@@ -0,0 +1,213 @@
+"""
+Végpontok közötti késleltetés-mérés az ingress szolgáltatásoktól az MDB-kig.
+
+Az ingress (REST, SOAP, WebSocket) minden üzenetre AMQP tulajdonságokat tesz:
+    message_id      - folyamaton belül egyedi azonosító ("host:pid-sorszám")
+    x-ingress-us    - fejléc: a kérés beérkezésének ideje (epoch µs)
+    x-publish-us    - fejléc: a publikálás ideje (epoch µs)
+
+Az MDB a feldolgozáskor két késleltetést rögzít színenként:
+    ingress_to_handle - beérkezéstől a feldolgozásig (a teljes út)
+    queue_dwell       - publikálástól a feldolgozásig (broker + sorban állás + prefetch puffer)
+
+Alapértelmezésben be van kapcsolva, TRACE_MESSAGES=0 kikapcsolja. A bélyegzés ára, hogy minden üzenet
+saját pika.BasicProperties-t, két 64 bites fejlécet és message_id-t kap, vagyis visszajön az üzenetenkénti
+fejléc-kódolás és allokáció, amit az előre elkészített tulajdonságok megspórolnak. Ha a késleltetés-
+hisztogramokra nincs szükség, és ez a költség számít, a kikapcsolás az előre elkészített tulajdonságokhoz tér vissza.
+
+Az időbélyegek falióra szerintiek (time.time_ns), ezért különböző gépek között az órák eltérése
+is benne van; egy gépen (vagy NTP-vel szinkronizált gépeken) a mérés µs pontosságú.
+
+A mintákat log-lineáris vödrös hisztogramba gyűjtjük (2 hatványonként 8 vödör, legfeljebb 12,5%
+relatív hiba). A vödrönkénti darabszámok egyszerűen összeadhatók, így több feldolgozó és több
+időablak hisztogramja veszteség nélkül összevonható, és abból számolható p50 / p99 / p999.
+"""
+import itertools
+import os
+import socket
+import time
+
+from common.metrics import MESSAGE_LATENCY
+
+HEADER_INGRESS = 'x-ingress-us'
+HEADER_PUBLISH = 'x-publish-us'
+
+KIND_INGRESS_TO_HANDLE = 'ingress_to_handle'
+KIND_QUEUE_DWELL = 'queue_dwell'
+LATENCY_KINDS = (KIND_INGRESS_TO_HANDLE, KIND_QUEUE_DWELL)
+
+# Az ingress alapértelmezésben bélyegez; TRACE_MESSAGES=0 esetén az előre elkészített tulajdonságokat használja
+TRACE_MESSAGES = os.environ.get('TRACE_MESSAGES', '1') == '1'
+
+EXACT_BELOW = 16   # 16 µs alatt minden µs külön vödör
+SUB_BUCKETS = 8    # 2 hatványonként ennyi vödör
+_SUB_BITS = 3
+
+_ids = itertools.count(1)
+_id_prefix = None
+
+
+def now_us():
+    return time.time_ns() // 1000
+
+
+def next_message_id():
+    """
+    Olcsó, folyamaton belül egyedi üzenetazonosító (nem kell hozzá uuid).
+    """
+    global _id_prefix
+    if _id_prefix is None:
+        _id_prefix = f"{socket.gethostname()}:{os.getpid()}-"
+    return _id_prefix + str(next(_ids))
+
+
+def _reset_ids():
+    # fork után a gyerek új előtagot kap, különben a szülővel ütköző azonosítókat adna
+    global _ids, _id_prefix
+    _ids = itertools.count(1)
+    _id_prefix = None
+
+
+os.register_at_fork(after_in_child=_reset_ids)
+
+
+def trace_headers(ingress_us, headers=None):
+    """
+    A meglévő fejlécek (pl. COLOR) kiegészítve a bélyegekkel; új dict, a bemenetet nem módosítja.
+    """
+    traced = dict(headers) if headers else {}
+    traced[HEADER_INGRESS] = ingress_us
+    traced[HEADER_PUBLISH] = now_us()
+    return traced
+
+
+def delivery_latencies(headers, handled_us=None):
+    """
+    :return: (ingress_to_handle, queue_dwell) másodpercben, a hiányzó bélyeg helyén None;
+             bélyeg nélküli (régi) üzenetnél None
+    """
+    if not headers:
+        return None
+    ingress = headers.get(HEADER_INGRESS)
+    published = headers.get(HEADER_PUBLISH)
+    if ingress is None and published is None:
+        return None
+    handled_us = now_us() if handled_us is None else handled_us
+    return (
+        max(0, handled_us - ingress) / 1_000_000 if ingress is not None else None,
+        max(0, handled_us - published) / 1_000_000 if published is not None else None
+    )
+
+
+def record_delivery(stats, color, headers):
+    """
+    Az MDB feldolgozáskor hívja: a bélyegzett üzenet két késleltetését a statisztika-gyűjtőbe írja.
+    """
+    latencies = delivery_latencies(headers)
+    if latencies is None:
+        return
+    for kind, seconds in zip(LATENCY_KINDS, latencies):
+        if seconds is not None:
+            stats.record_latency(color, kind, seconds)
+            MESSAGE_LATENCY.labels(color, kind).observe(seconds)
+
+
+def bucket_index(micros):
+    """
+    A µs érték vödörindexe (log-lineáris skála).
+    """
+    micros = int(micros)
+    if micros < EXACT_BELOW:
+        return max(0, micros)
+    exponent = micros.bit_length() - 1
+    sub = (micros >> (exponent - _SUB_BITS)) & (SUB_BUCKETS - 1)
+    return EXACT_BELOW + (exponent - 4) * SUB_BUCKETS + sub
+
+
+def bucket_lower(index):
+    """
+    A vödör alsó határa µs-ban.
+    """
+    if index < EXACT_BELOW:
+        return index
+    exponent, sub = divmod(index - EXACT_BELOW, SUB_BUCKETS)
+    exponent += 4
+    return (SUB_BUCKETS + sub) << (exponent - _SUB_BITS)
+
+
+def bucket_upper(index):
+    """
+    A vödör felső határa µs-ban (a percentilis ezt adja vissza, így sosem becsül alá).
+    """
+    if index < EXACT_BELOW:
+        return index
+    exponent, sub = divmod(index - EXACT_BELOW, SUB_BUCKETS)
+    exponent += 4
+    width = 1 << (exponent - _SUB_BITS)
+    return ((SUB_BUCKETS + sub) << (exponent - _SUB_BITS)) + width - 1
+
+
+class LatencyHistogram:
+    """
+    Ritka (csak a nem üres vödröket tároló) összevonható hisztogram; a minták µs-ban.
+    """
+
+    __slots__ = ("counts", "total")
+
+    def __init__(self, counts=None):
+        self.counts = {}
+        self.total = 0
+        if counts:
+            self.merge(counts)
+
+    def record(self, seconds):
+        index = bucket_index(seconds * 1_000_000)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.total += 1
+
+    def merge(self, counts):
+        """
+        :param counts: másik hisztogram vagy {vödörindex: darab}
+        """
+        if isinstance(counts, LatencyHistogram):
+            counts = counts.counts
+        for index, count in counts.items():
+            index = int(index)
+            self.counts[index] = self.counts.get(index, 0) + count
+            self.total += count
+
+    def percentile(self, fraction):
+        """
+        :param fraction: 0..1 (pl. 0.99)
+        :return: µs (a vödör felső határa), üres hisztogramnál None
+        """
+        if not self.total:
+            return None
+        rank = max(1, int(fraction * self.total + 0.999999))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return bucket_upper(index)
+        return bucket_upper(max(self.counts))
+
+    def minimum(self):
+        """
+        :return: µs (a legkisebb nem üres vödör alsó határa), üres hisztogramnál None
+        """
+        return bucket_lower(min(self.counts)) if self.total else None
+
+    def maximum(self):
+        """
+        :return: µs (a legnagyobb nem üres vödör felső határa), üres hisztogramnál None
+        """
+        return bucket_upper(max(self.counts)) if self.total else None
+
+    def mean(self):
+        """
+        :return: µs (a vödrök középpontjaiból becsülve), üres hisztogramnál None
+        """
+        if not self.total:
+            return None
+        weighted = sum(count * (bucket_lower(index) + bucket_upper(index)) for index, count in self.counts.items())
+        return weighted / (2 * self.total)
@@ -0,0 +1,936 @@
+"""
+Cserélhető üzenetközvetítő réteg: RabbitMQ vagy folyamaton belüli (in-memory) broker.
+
+A komponensek a kapcsolatot a pika.BlockingConnection / aio_pika.connect_robust helyett a
+blocking_connection() / connect_robust() függvénnyel nyitják. A TRANSPORT környezeti változó dönti el,
+mi van mögötte:
+
+    TRANSPORT=rabbitmq  (alapértelmezés) a valódi broker, változatlan viselkedéssel
+    TRANSPORT=memory    a MemoryBroker, amely ugyanabban a folyamatban fut
+
+A MemoryBroker kapcsolatai és csatornái a pika BlockingConnection / BlockingChannel, illetve az
+aio_pika kapcsolat / csatorna / sor / exchange általunk használt részhalmazát utánozzák, így a
+fogyasztói stratégiák élő RabbitMQ nélkül, determinisztikusan mérhetők és tesztelhetők, és a saját
+költségünk elválik a brokerétől. Támogatott:
+
+- sorok (argumentumokkal, x-dead-letter-exchange / x-dead-letter-routing-key), default, direct,
+  fanout, topic és headers exchange (x-match: all / any);
+- prefetch (fogyasztónkénti ablak, basic_qos / set_qos futás közben is állítható);
+- ack / nack / reject, multiple, requeue (redelivered jelzővel, a sor elejére), a csatorna
+  lezárásakor a nyugtázatlan üzenetek visszakerülnek a sorba;
+- dead-lettering x-death fejléccel, mint a RabbitMQ-nál;
+- a kézbesítés a fogyasztó kapcsolatának saját szálán (start_consuming / process_data_events), illetve
+  event loopján fut, ahogy a pikánál.
+
+Nincs: tartósság, TTL, sorhossz-korlát, mandatory / visszaküldés, tranzakciók. A confirm mód
+elfogadott, de a publikálás szinkron, így minden üzenet azonnal "visszaigazolt".
+
+A broker folyamaton belüli: a külön konténerben futó szolgáltatások és a multiprocessing workerek
+nem látják egymás sorait. Ezért csak olyan futtatóban használható, amely minden publikálót és
+fogyasztót ugyanabban a folyamatban indít, és ezt az embed() hívással jelzi (pl. benchmark/mdb_benchmark.py).
+Enélkül memory módban figyelmeztetünk, gyermekfolyamatban pedig hibát dobunk.
+"""
+import asyncio
+import copy
+import functools
+import heapq
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import deque, namedtuple
+from contextlib import asynccontextmanager
+
+import pika
+import pika.frame
+import pika.spec
+from pika.exceptions import ChannelClosedByBroker, ConnectionWrongStateError
+
+logger = logging.getLogger("transport")
+
+TRANSPORT_RABBITMQ = 'rabbitmq'
+TRANSPORT_MEMORY = 'memory'
+TRANSPORT = os.environ.get('TRANSPORT', TRANSPORT_RABBITMQ)
+
+# A broker számlálói (MemoryBroker.snapshot())
+COUNTERS = ("published", "unroutable", "delivered", "redelivered", "acked", "requeued", "dead_lettered", "dropped")
+
+DeclareResult = namedtuple("DeclareResult", "message_count consumer_count")
+
+_embedded = False
+_warned = False
+
+
+def uses_memory():
+    return TRANSPORT == TRANSPORT_MEMORY
+
+
+def embed():
+    """
+    A futtató jelzi, hogy minden publikáló és fogyasztó ebben a folyamatban fut, így a memory mód értelmes.
+    """
+    global _embedded
+    _embedded = True
+
+
+def _check_memory_use():
+    global _warned
+    if multiprocessing.parent_process() is not None:
+        raise RuntimeError("TRANSPORT=memory cannot be used in a child process: "
+                           "its messages would never reach the parent or any other process")
+    if not _embedded and not _warned:
+        _warned = True
+        logger.warning("TRANSPORT=memory outside an in-process harness: messages stay inside this process "
+                       f"(pid {os.getpid()}) and no other service will see them")
+
+
+def blocking_connection(parameters):
+    """
+    A pika.BlockingConnection(parameters) helyett; memory módban a paramétereket figyelmen kívül hagyja.
+    """
+    if uses_memory():
+        _check_memory_use()
+        return MemoryConnection(BROKER)
+    return pika.BlockingConnection(parameters)
+
+
+async def connect_robust(*args, **kwargs):
+    """
+    Az aio_pika.connect_robust(...) helyett, ugyanazokkal a paraméterekkel.
+    """
+    if uses_memory():
+        _check_memory_use()
+        return MemoryRobustConnection(BROKER)
+    import aio_pika
+    return await aio_pika.connect_robust(*args, **kwargs)
+
+
+def _not_found(kind, name):
+    return ChannelClosedByBroker(404, f"NOT_FOUND - no {kind} '{name}' in vhost '/'")
+
+
+def _topic_match(binding_words, routing_words):
+    # "*" pontosan egy szót, "#" nulla vagy több szót illeszt
+    if not binding_words:
+        return not routing_words
+    head, rest = binding_words[0], binding_words[1:]
+    if head == '#':
+        return any(_topic_match(rest, routing_words[index:]) for index in range(len(routing_words) + 1))
+    if not routing_words:
+        return False
+    return head in ('*', routing_words[0]) and _topic_match(rest, routing_words[1:])
+
+
+class _Message:
+    __slots__ = ("exchange", "routing_key", "body", "properties", "redelivered", "returned_by")
+
+    def __init__(self, exchange, routing_key, body, properties):
+        self.exchange = exchange
+        self.routing_key = routing_key
+        self.body = body
+        self.properties = properties
+        self.redelivered = False
+        self.returned_by = None  # a fogyasztó, amelyik legutóbb requeue-val visszaadta
+
+
+class _Exchange:
+    __slots__ = ("name", "type", "bindings")
+
+    def __init__(self, name, exchange_type):
+        self.name = name
+        self.type = exchange_type
+        self.bindings = []  # (sor neve, routing key, argumentumok, topic szavak)
+
+    def route(self, routing_key, headers):
+        """
+        :return: a célsorok nevei, duplikáció nélkül, a bindolás sorrendjében
+        """
+        targets = []
+        for queue_name, binding_key, arguments, words in self.bindings:
+            if self.type == 'fanout':
+                matched = True
+            elif self.type == 'direct':
+                matched = binding_key == routing_key
+            elif self.type == 'topic':
+                matched = _topic_match(words, routing_key.split('.'))
+            elif self.type == 'headers':
+                matched = _headers_match(arguments, headers or {})
+            else:
+                matched = False
+            if matched and queue_name not in targets:
+                targets.append(queue_name)
+        return targets
+
+
+def _headers_match(arguments, headers):
+    arguments = arguments or {}
+    match_any = arguments.get('x-match', 'all') in ('any', 'any-with-x')
+    pairs = [(key, value) for key, value in arguments.items() if not key.startswith('x-')]
+    if not pairs:
+        return not match_any
+    results = (key in headers and headers[key] == value for key, value in pairs)
+    return any(results) if match_any else all(results)
+
+
+class _Queue:
+    __slots__ = ("name", "arguments", "messages", "consumers", "turn")
+
+    def __init__(self, name, arguments):
+        self.name = name
+        self.arguments = dict(arguments or {})
+        self.messages = deque()
+        self.consumers = []
+        self.turn = 0  # a körforgásos kézbesítés következő fogyasztója
+
+
+class _Consumer:
+    __slots__ = ("tag", "queue", "channel", "callback", "auto_ack", "unacked", "active")
+
+    def __init__(self, tag, queue, channel, callback, auto_ack):
+        self.tag = tag
+        self.queue = queue
+        self.channel = channel
+        self.callback = callback
+        self.auto_ack = auto_ack
+        self.unacked = 0
+        self.active = True
+
+    def has_capacity(self):
+        prefetch = self.channel.prefetch_count
+        return self.auto_ack or not prefetch or self.unacked < prefetch
+
+
+class MemoryBroker:
+    """
+    Folyamaton belüli broker. Minden állapot egyetlen zár alatt változik, így bármely szálról hívható;
+    a fogyasztói callbackek viszont sosem a zár alatt, hanem a fogyasztó kapcsolatának szálán futnak.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        # A RabbitMQ a visszarakott üzenetet a sor elejéről a következő szabad fogyasztónak adja, akár
+        # ugyanannak, amelyik visszaadta. Itt a kézbesítés szinkron, ezért prefetch=1 mellett egy
+        # requeue-s fogyasztó örökre a saját üzenetét kaphatja vissza (a valódi brokernél a hálózati
+        # késés közben más fogyasztót is szóhoz juttat). True esetén a visszaadott üzenet, ha van más
+        # fogyasztó, nem megy vissza azonnal ugyanahhoz; ez eltérés a RabbitMQ-tól, csak kérésre.
+        self.redeliver_elsewhere = False
+        self._tags = itertools.count(1)
+        self.reset()
+
+    def reset(self):
+        """
+        Minden sort, exchange-et és számlálót töröl (pl. két mérés között). Nyitott kapcsolat ne legyen.
+        """
+        with self.lock:
+            self.exchanges = {'': _Exchange('', 'direct')}
+            self.queues = {}
+            self.counters = dict.fromkeys(COUNTERS, 0)
+            self.queue_counters = {}
+
+    def snapshot(self):
+        """
+        :return: a számlálók és soronként a várakozó / nyugtázatlan üzenetek és a fogyasztók száma
+        """
+        with self.lock:
+            queues = {}
+            for name, q in self.queues.items():
+                queues[name] = dict(
+                    self.queue_counters[name],
+                    ready=len(q.messages),
+                    unacked=sum(consumer.unacked for consumer in q.consumers),
+                    consumers=len(q.consumers)
+                )
+            return {"counters": dict(self.counters), "queues": queues}
+
+    def _count(self, q, counter, amount=1):
+        self.counters[counter] += amount
+        if q is not None:
+            self.queue_counters[q.name][counter] += amount
+
+    # ---- topológia ----
+
+    def declare_exchange(self, name, exchange_type='direct', passive=False):
+        exchange_type = getattr(exchange_type, 'value', exchange_type)
+        with self.lock:
+            exchange = self.exchanges.get(name)
+            if exchange is None:
+                if passive:
+                    raise _not_found("exchange", name)
+                self.exchanges[name] = _Exchange(name, exchange_type)
+            elif not passive and exchange.type != exchange_type:
+                raise ChannelClosedByBroker(
+                    406, f"PRECONDITION_FAILED - inequivalent arg 'type' for exchange '{name}': "
+                         f"received '{exchange_type}' but current is '{exchange.type}'"
+                )
+
+    def declare_queue(self, name, arguments=None, passive=False):
+        """
+        :return: (a sor neve, várakozó üzenetek, fogyasztók); üres névnél a broker generál nevet
+        """
+        with self.lock:
+            if not name:
+                name = f"amq.gen-{next(self._tags)}"
+            q = self.queues.get(name)
+            if q is None:
+                if passive:
+                    raise _not_found("queue", name)
+                q = self.queues[name] = _Queue(name, arguments)
+                self.queue_counters[name] = dict.fromkeys(COUNTERS, 0)
+            elif not passive and dict(arguments or {}) != q.arguments:
+                raise ChannelClosedByBroker(
+                    406, f"PRECONDITION_FAILED - inequivalent arguments for queue '{name}': "
+                         f"received {dict(arguments or {})} but current is {q.arguments}"
+                )
+            return name, len(q.messages), len(q.consumers)
+
+    def bind(self, queue_name, exchange_name, routing_key=None, arguments=None):
+        with self.lock:
+            if queue_name not in self.queues:
+                raise _not_found("queue", queue_name)
+            exchange = self.exchanges.get(exchange_name)
+            if exchange is None:
+                raise _not_found("exchange", exchange_name)
+            routing_key = queue_name if routing_key is None else routing_key
+            words = tuple(routing_key.split('.')) if exchange.type == 'topic' else None
+            binding = (queue_name, routing_key, dict(arguments or {}), words)
+            if binding not in exchange.bindings:
+                exchange.bindings.append(binding)
+
+    def purge(self, queue_name):
+        with self.lock:
+            q = self.queues.get(queue_name)
+            if q is None:
+                raise _not_found("queue", queue_name)
+            count = len(q.messages)
+            q.messages.clear()
+            return count
+
+    def delete_queue(self, queue_name):
+        with self.lock:
+            q = self.queues.pop(queue_name, None)
+            if q is None:
+                return 0
+            for consumer in q.consumers:
+                consumer.active = False
+            for exchange in self.exchanges.values():
+                exchange.bindings = [binding for binding in exchange.bindings if binding[0] != queue_name]
+            return len(q.messages)
+
+    # ---- üzenetek ----
+
+    def publish(self, exchange_name, routing_key, body, properties):
+        """
+        :return: True, ha legalább egy sorba került
+        """
+        with self.lock:
+            exchange = self.exchanges.get(exchange_name)
+            if exchange is None:
+                raise _not_found("exchange", exchange_name)
+            self.counters["published"] += 1
+            if not self._route(exchange, routing_key, body, properties):
+                self.counters["unroutable"] += 1
+                return False
+            return True
+
+    def _route(self, exchange, routing_key, body, properties):
+        if exchange.name == '':
+            targets = [routing_key] if routing_key in self.queues else []
+        else:
+            targets = exchange.route(routing_key, properties.headers)
+        for queue_name in targets:
+            q = self.queues[queue_name]
+            self.queue_counters[queue_name]["published"] += 1
+            q.messages.append(_Message(exchange.name, routing_key, body, properties))
+            self._dispatch(q)
+        return bool(targets)
+
+    def _dispatch(self, q):
+        """
+        A várakozó üzeneteket körforgásban osztja ki a szabad ablakú fogyasztóknak.
+        """
+        while q.messages and q.consumers:
+            consumer = self._next_consumer(q, q.messages[0])
+            if consumer is None:
+                return
+            message = q.messages.popleft()
+            message.returned_by = None
+            self._count(q, "delivered")
+            if message.redelivered:
+                self._count(q, "redelivered")
+            consumer.channel._deliver(consumer, message)
+
+    def _next_consumer(self, q, message):
+        count = len(q.consumers)
+        skip = message.returned_by if self.redeliver_elsewhere and count > 1 else None
+        for step in range(count):
+            consumer = q.consumers[(q.turn + step) % count]
+            if consumer is skip:
+                continue
+            if consumer.has_capacity():
+                q.turn = (q.turn + step + 1) % count
+                return consumer
+        return None
+
+    def _requeue(self, q, messages):
+        # A visszarakott üzenetek az eredeti sorrendjükben a sor elejére kerülnek
+        for message in messages:
+            message.redelivered = True
+        q.messages.extendleft(reversed(messages))
+        self._count(q, "requeued", len(messages))
+
+    def _dead_letter(self, q, message, reason):
+        dlx = q.arguments.get('x-dead-letter-exchange')
+        exchange = self.exchanges.get(dlx) if dlx is not None else None
+        if exchange is None:
+            # Dead-letter exchange nélkül (vagy ha nem létezik) az üzenet elvész, mint a RabbitMQ-nál
+            self._count(q, "dropped")
+            return
+        self._count(q, "dead_lettered")
+        headers = dict(message.properties.headers or {})
+        deaths = [dict(death) for death in headers.get('x-death') or []]
+        for death in deaths:
+            if death.get('queue') == q.name and death.get('reason') == reason:
+                death['count'] = death.get('count', 0) + 1
+                deaths.remove(death)
+                deaths.insert(0, death)
+                break
+        else:
+            deaths.insert(0, {
+                'count': 1,
+                'reason': reason,
+                'queue': q.name,
+                'time': int(time.time()),
+                'exchange': message.exchange,
+                'routing-keys': [message.routing_key]
+            })
+        headers['x-death'] = deaths
+        headers.setdefault('x-first-death-queue', q.name)
+        headers.setdefault('x-first-death-reason', reason)
+        headers.setdefault('x-first-death-exchange', message.exchange)
+        properties = copy.copy(message.properties)
+        properties.headers = headers
+        routing_key = q.arguments.get('x-dead-letter-routing-key', message.routing_key)
+        self._route(exchange, routing_key, message.body, properties)
+
+
+BROKER = MemoryBroker()
+
+
+class _MemoryChannelBase:
+    """
+    A szinkron (pika) és az aszinkron (aio_pika) csatorna közös magja: fogyasztók, delivery tag-ek,
+    nyugtázás. A leszármazott csak a callback hívásának formáját adja meg (_invoke).
+    """
+
+    def __init__(self, connection, number):
+        self.connection = connection
+        self.broker = connection.broker
+        self.channel_number = number
+        self.prefetch_count = 0
+        self._delivery_tags = itertools.count(1)
+        self._consumer_tags = itertools.count(1)
+        self._unacked = {}    # delivery tag -> (fogyasztó, üzenet)
+        self._consumers = {}  # consumer tag -> fogyasztó
+        self._open = True
+
+    def _check_open(self):
+        if not self._open:
+            raise pika.exceptions.ChannelWrongStateError("Channel is closed.")
+
+    def _set_prefetch(self, prefetch_count):
+        self._check_open()
+        with self.broker.lock:
+            self.prefetch_count = prefetch_count
+            # Nagyobb ablakkal a várakozó üzenetek azonnal kioszthatók
+            for consumer in list(self._consumers.values()):
+                self.broker._dispatch(consumer.queue)
+
+    def _publish(self, exchange, routing_key, body, properties):
+        self._check_open()
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        return self.broker.publish(exchange, routing_key, body, properties or pika.BasicProperties())
+
+    def _consume(self, queue_name, callback, auto_ack, consumer_tag=None):
+        self._check_open()
+        with self.broker.lock:
+            q = self.broker.queues.get(queue_name)
+            if q is None:
+                raise _not_found("queue", queue_name)
+            tag = consumer_tag or f"ctag{self.channel_number}.{next(self._consumer_tags)}"
+            consumer = _Consumer(tag, q, self, callback, auto_ack)
+            self._consumers[tag] = consumer
+            q.consumers.append(consumer)
+            self.broker._dispatch(q)
+            return tag
+
+    def _cancel(self, consumer_tag):
+        with self.broker.lock:
+            consumer = self._consumers.pop(consumer_tag, None)
+            if consumer is None:
+                return
+            consumer.active = False
+            if consumer in consumer.queue.consumers:
+                consumer.queue.consumers.remove(consumer)
+
+    def _deliver(self, consumer, message):
+        # A broker zárja alatt fut: tag-et ad, nyilvántartja, a callbacket a kapcsolat szálára ütemezi
+        delivery_tag = next(self._delivery_tags)
+        if consumer.auto_ack:
+            self.broker._count(consumer.queue, "acked")
+        else:
+            consumer.unacked += 1
+            self._unacked[delivery_tag] = (consumer, message)
+        self.connection._schedule(functools.partial(self._run_callback, consumer, delivery_tag, message))
+
+    def _run_callback(self, consumer, delivery_tag, message):
+        if consumer.active and self._open:
+            self._invoke(consumer, delivery_tag, message)
+
+    def _invoke(self, consumer, delivery_tag, message):
+        raise NotImplementedError
+
+    def _settle(self, delivery_tag, multiple, outcome, requeue=False):
+        """
+        :param outcome: "ack", "nack" vagy "reject"
+        """
+        self._check_open()
+        with self.broker.lock:
+            if multiple:
+                tags = sorted(tag for tag in self._unacked if not delivery_tag or tag <= delivery_tag)
+            elif delivery_tag in self._unacked:
+                tags = [delivery_tag]
+            else:
+                self._close()
+                raise ChannelClosedByBroker(406, f"PRECONDITION_FAILED - unknown delivery tag {delivery_tag}")
+            requeued = {}
+            for tag in tags:
+                consumer, message = self._unacked.pop(tag)
+                consumer.unacked -= 1
+                q = consumer.queue
+                if outcome == "ack":
+                    self.broker._count(q, "acked")
+                elif requeue:
+                    message.returned_by = consumer
+                    requeued.setdefault(q.name, (q, []))[1].append(message)
+                else:
+                    self.broker._dead_letter(q, message, "rejected")
+            for q, messages in requeued.values():
+                self.broker._requeue(q, messages)
+            for q in {consumer.queue for consumer in self._consumers.values()} | {q for q, _ in requeued.values()}:
+                self.broker._dispatch(q)
+
+    def _close(self):
+        """
+        Lezárja a csatornát: a fogyasztókat törli, a nyugtázatlan üzeneteket visszarakja a sorukba.
+        """
+        with self.broker.lock:
+            if not self._open:
+                return
+            self._open = False
+            for consumer_tag in list(self._consumers):
+                self._cancel(consumer_tag)
+            requeued = {}
+            for tag in sorted(self._unacked):
+                consumer, message = self._unacked[tag]
+                requeued.setdefault(consumer.queue.name, (consumer.queue, []))[1].append(message)
+            self._unacked.clear()
+            for q, messages in requeued.values():
+                self.broker._requeue(q, messages)
+                self.broker._dispatch(q)
+
+
+# ---- szinkron (pika BlockingConnection-szerű) oldal ----
+
+class MemoryChannel(_MemoryChannelBase):
+    """
+    A pika BlockingChannel általunk használt részhalmaza.
+    """
+
+    @property
+    def is_open(self):
+        return self._open and self.connection.is_open
+
+    @property
+    def is_closed(self):
+        return not self.is_open
+
+    def exchange_declare(self, exchange, exchange_type='direct', passive=False, durable=False,
+                         auto_delete=False, internal=False, arguments=None):
+        self._check_open()
+        self.broker.declare_exchange(exchange, exchange_type, passive)
+
+    def queue_declare(self, queue, passive=False, durable=False, exclusive=False, auto_delete=False,
+                      arguments=None):
+        self._check_open()
+        name, message_count, consumer_count = self.broker.declare_queue(queue, arguments, passive)
+        return pika.frame.Method(self.channel_number, pika.spec.Queue.DeclareOk(name, message_count, consumer_count))
+
+    def queue_bind(self, queue, exchange, routing_key=None, arguments=None):
+        self._check_open()
+        self.broker.bind(queue, exchange, routing_key, arguments)
+
+    def queue_purge(self, queue):
+        self._check_open()
+        return pika.frame.Method(self.channel_number, pika.spec.Queue.PurgeOk(self.broker.purge(queue)))
+
+    def queue_delete(self, queue, if_unused=False, if_empty=False):
+        self._check_open()
+        return pika.frame.Method(self.channel_number, pika.spec.Queue.DeleteOk(self.broker.delete_queue(queue)))
+
+    def basic_qos(self, prefetch_size=0, prefetch_count=0, global_qos=False):
+        self._set_prefetch(prefetch_count)
+
+    def confirm_delivery(self):
+        # A publikálás szinkron, ezért minden üzenet azonnal "visszaigazolt"
+        self._check_open()
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        self._publish(exchange, routing_key, body, properties)
+
+    def basic_consume(self, queue, on_message_callback, auto_ack=False, exclusive=False, consumer_tag=None,
+                      arguments=None):
+        return self._consume(queue, on_message_callback, auto_ack, consumer_tag)
+
+    def basic_cancel(self, consumer_tag=''):
+        self._cancel(consumer_tag)
+        return []
+
+    def basic_ack(self, delivery_tag=0, multiple=False):
+        self._settle(delivery_tag, multiple, "ack")
+
+    def basic_nack(self, delivery_tag=0, multiple=False, requeue=True):
+        self._settle(delivery_tag, multiple, "nack", requeue)
+
+    def basic_reject(self, delivery_tag=0, requeue=True):
+        self._settle(delivery_tag, False, "reject", requeue)
+
+    def start_consuming(self):
+        """
+        Addig szolgálja ki a kapcsolat eseményeit, amíg van fogyasztó ezen a csatornán.
+        """
+        while self._consumers and self.is_open:
+            self.connection.process_data_events(time_limit=None)
+
+    def stop_consuming(self, consumer_tag=None):
+        """
+        Bármely szálról hívható: törli a fogyasztókat, és felébreszti a start_consuming ciklust.
+        """
+        for tag in [consumer_tag] if consumer_tag else list(self._consumers):
+            self._cancel(tag)
+        self.connection._schedule(lambda: None)
+
+    def close(self, reply_code=0, reply_text="Normal shutdown"):
+        self._close()
+
+    def _invoke(self, consumer, delivery_tag, message):
+        method = pika.spec.Basic.Deliver(
+            consumer_tag=consumer.tag,
+            delivery_tag=delivery_tag,
+            redelivered=message.redelivered,
+            exchange=message.exchange,
+            routing_key=message.routing_key
+        )
+        consumer.callback(self, method, message.properties, message.body)
+
+
+class MemoryConnection:
+    """
+    A pika BlockingConnection megfelelője. A kézbesítések és az add_callback_threadsafe() callbackjei
+    egy sorba kerülnek, és azon a szálon futnak, amelyik a process_data_events()-et
+    (start_consuming-ot) hívja.
+    """
+
+    def __init__(self, broker=None):
+        self.broker = broker or BROKER
+        self.is_open = True
+        self._events = queue.SimpleQueue()
+        self._timers = []  # (határidő, azonosító, callback) kupac
+        self._timer_ids = itertools.count(1)
+        self._cancelled_timers = set()
+        self._channel_numbers = itertools.count(1)
+        self._channels = []
+
+    @property
+    def is_closed(self):
+        return not self.is_open
+
+    def channel(self, channel_number=None):
+        if not self.is_open:
+            raise ConnectionWrongStateError("Connection is closed.")
+        channel = MemoryChannel(self, channel_number or next(self._channel_numbers))
+        self._channels.append(channel)
+        return channel
+
+    def _schedule(self, callback):
+        self._events.put(callback)
+
+    def add_callback_threadsafe(self, callback):
+        if not self.is_open:
+            raise ConnectionWrongStateError("BlockingConnection.add_callback_threadsafe() called on closed connection")
+        self._events.put(callback)
+
+    def call_later(self, delay, callback):
+        timer_id = next(self._timer_ids)
+        heapq.heappush(self._timers, (time.monotonic() + delay, timer_id, callback))
+        return timer_id
+
+    def remove_timeout(self, timeout_id):
+        self._cancelled_timers.add(timeout_id)
+
+    def _run_timers(self):
+        ran = False
+        now = time.monotonic()
+        while self._timers and self._timers[0][0] <= now:
+            _, timer_id, callback = heapq.heappop(self._timers)
+            if timer_id in self._cancelled_timers:
+                self._cancelled_timers.discard(timer_id)
+                continue
+            callback()
+            ran = True
+        return ran
+
+    def _timer_delay(self):
+        if not self._timers:
+            return None
+        return max(0.0, self._timers[0][0] - time.monotonic())
+
+    def process_data_events(self, time_limit=0):
+        """
+        Legfeljebb time_limit másodpercig (None = korlátlanul) vár az első eseményre, majd a már
+        várakozó eseményeket is lefuttatja, mint a pika.
+        """
+        deadline = None if time_limit is None else time.monotonic() + time_limit
+        while not self._run_timers():
+            wait = self._timer_delay()
+            if deadline is not None:
+                remaining = max(0.0, deadline - time.monotonic())
+                wait = remaining if wait is None else min(wait, remaining)
+            try:
+                callback = self._events.get(timeout=wait) if wait is None or wait > 0 else self._events.get_nowait()
+            except queue.Empty:
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+                continue
+            callback()
+            break
+        # Csak a hívás pillanatában már várakozó eseményeket futtatjuk, hogy a hívás mindig visszatérjen
+        for _ in range(self._events.qsize()):
+            try:
+                callback = self._events.get_nowait()
+            except queue.Empty:
+                break
+            callback()
+        self._run_timers()
+
+    def sleep(self, duration):
+        deadline = time.monotonic() + duration
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            self.process_data_events(time_limit=remaining)
+
+    def close(self, reply_code=200, reply_text="Normal shutdown"):
+        if not self.is_open:
+            raise ConnectionWrongStateError("Connection is closed.")
+        for channel in self._channels:
+            channel._close()
+        self.is_open = False
+
+
+# ---- aszinkron (aio_pika-szerű) oldal ----
+
+class MemoryExchange:
+    def __init__(self, channel, name):
+        self.channel = channel
+        self.name = name
+
+    async def publish(self, message, routing_key, *, mandatory=True, immediate=False, timeout=None):
+        properties = pika.BasicProperties(
+            content_type=message.content_type,
+            content_encoding=message.content_encoding,
+            headers=dict(message.headers) if message.headers else None,
+            correlation_id=message.correlation_id,
+            reply_to=message.reply_to,
+            message_id=message.message_id,
+            type=message.type,
+            app_id=message.app_id
+        )
+        self.channel._publish(self.name, routing_key, message.body, properties)
+
+
+class MemoryQueue:
+    def __init__(self, channel, name, declaration_result):
+        self.channel = channel
+        self.name = name
+        self.declaration_result = declaration_result
+
+    async def bind(self, exchange, routing_key=None, *, arguments=None, timeout=None):
+        exchange_name = getattr(exchange, 'name', exchange)
+        self.channel.broker.bind(self.name, exchange_name, routing_key, arguments)
+
+    async def consume(self, callback, no_ack=False, exclusive=False, arguments=None, consumer_tag=None,
+                      timeout=None):
+        return self.channel._consume(self.name, callback, no_ack, consumer_tag)
+
+    async def cancel(self, consumer_tag, timeout=None, nowait=False):
+        self.channel._cancel(consumer_tag)
+
+    async def purge(self, no_wait=False, timeout=None):
+        return self.channel.broker.purge(self.name)
+
+
+class MemoryIncomingMessage:
+    """
+    Az aio_pika IncomingMessage megfelelője (body, headers, content_type, ack / nack / reject, process()).
+    """
+
+    def __init__(self, channel, delivery_tag, message, no_ack):
+        self.channel = channel
+        self.delivery_tag = delivery_tag
+        self.body = message.body
+        self.routing_key = message.routing_key
+        self.exchange = message.exchange
+        self.redelivered = message.redelivered
+        self.properties = message.properties
+        self.processed = no_ack
+
+    @property
+    def headers(self):
+        return self.properties.headers or {}
+
+    @property
+    def content_type(self):
+        return self.properties.content_type
+
+    @property
+    def message_id(self):
+        return self.properties.message_id
+
+    @property
+    def correlation_id(self):
+        return self.properties.correlation_id
+
+    def _mark_processed(self):
+        if self.processed:
+            raise RuntimeError("Message already processed")
+        self.processed = True
+
+    async def ack(self, multiple=False):
+        self._mark_processed()
+        self.channel._settle(self.delivery_tag, multiple, "ack")
+
+    async def nack(self, multiple=False, requeue=True):
+        self._mark_processed()
+        self.channel._settle(self.delivery_tag, multiple, "nack", requeue)
+
+    async def reject(self, requeue=False):
+        self._mark_processed()
+        self.channel._settle(self.delivery_tag, False, "reject", requeue)
+
+    @asynccontextmanager
+    async def process(self, requeue=False, reject_on_redelivered=False, ignore_processed=False):
+        """
+        Mint az aio_pika: hiba nélkül ack, kivétel esetén reject (requeue szerint), a kivétel továbbmegy.
+        """
+        try:
+            yield self
+        except BaseException:
+            if not self.processed and self.channel._open:
+                await self.reject(requeue=requeue)
+            raise
+        if not self.processed and self.channel._open:
+            await self.ack()
+
+
+class MemoryRobustChannel(_MemoryChannelBase):
+    """
+    Az aio_pika csatorna általunk használt részhalmaza.
+    """
+
+    def __init__(self, connection, number):
+        super().__init__(connection, number)
+        self._tasks = set()
+
+    @property
+    def is_closed(self):
+        return not self._open
+
+    @property
+    def default_exchange(self):
+        return MemoryExchange(self, '')
+
+    async def set_qos(self, prefetch_count=0, prefetch_size=0, global_=False, timeout=None, all_channels=None):
+        self._set_prefetch(prefetch_count)
+
+    async def declare_exchange(self, name, type='direct', *, durable=False, auto_delete=False, internal=False,
+                               passive=False, arguments=None, timeout=None):
+        self._check_open()
+        self.broker.declare_exchange(name, type, passive)
+        return MemoryExchange(self, name)
+
+    async def get_exchange(self, name, *, ensure=True):
+        if ensure:
+            self.broker.declare_exchange(name, passive=True)
+        return MemoryExchange(self, name)
+
+    async def declare_queue(self, name=None, *, durable=False, exclusive=False, passive=False, auto_delete=False,
+                            arguments=None, timeout=None):
+        self._check_open()
+        name, message_count, consumer_count = self.broker.declare_queue(name, arguments, passive)
+        return MemoryQueue(self, name, DeclareResult(message_count, consumer_count))
+
+    async def get_queue(self, name, *, ensure=True):
+        return await self.declare_queue(name, passive=ensure)
+
+    async def close(self, exc=None):
+        self._close()
+
+    def _invoke(self, consumer, delivery_tag, message):
+        task = asyncio.ensure_future(
+            consumer.callback(MemoryIncomingMessage(self, delivery_tag, message, consumer.auto_ack))
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+
+class MemoryRobustConnection:
+    """
+    Az aio_pika.connect_robust() kapcsolatának megfelelője; a kézbesítések a létrehozó event loopján futnak.
+    """
+
+    def __init__(self, broker=None):
+        self.broker = broker or BROKER
+        self.loop = asyncio.get_running_loop()
+        self.is_closed = False
+        self._channel_numbers = itertools.count(1)
+        self._channels = []
+
+    def _schedule(self, callback):
+        try:
+            self.loop.call_soon_threadsafe(callback)
+        except RuntimeError:
+            # Lezárt event loop: a kézbesítést eldobjuk, a nyugtázatlan üzenet a csatorna lezárásakor visszakerül
+            pass
+
+    async def channel(self, channel_number=None, publisher_confirms=True, on_return_raises=False):
+        if self.is_closed:
+            raise ConnectionWrongStateError("Connection is closed.")
+        channel = MemoryRobustChannel(self, channel_number or next(self._channel_numbers))
+        self._channels.append(channel)
+        return channel
+
+    async def close(self, exc=None):
+        for channel in self._channels:
+            channel._close()
+        self.is_closed = True
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        await self.close()
@@ -1,11 +1,25 @@
+import os
+import sys
+import time
 import asyncio
-import aio_pika
 import logging
+from concurrent.futures import ProcessPoolExecutor
+
+# A közös modulok (common/) a projekt gyökeréből érhetők el
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.publisher_pool import connection_parameters
+from common.transport import connect_robust
+from common.stats_aggregator import StatsAggregator, OUTCOME_ACKED, OUTCOME_IGNORED, OUTCOME_REJECTED, \
+    OUTCOME_REQUEUED
+from common.color_codec import decode_color
+from common.metrics import HANDLE_LATENCY, MESSAGES_IN_FLIGHT, serve_metrics
+from common.log_config import configure_logging
+from common.tracing import record_delivery
 
 
 
 # Beállítjuk a naplózást
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+configure_logging()
 logger = logging.getLogger("color_processor")
 
 # RabbitMQ kapcsolati adatok
@@ -15,14 +29,79 @@ RABBITMQ_USER = 'guest'
 RABBITMQ_PASSWORD = 'guest'
 COLOR_QUEUE = 'colorQueue'
 STATISTICS_QUEUE = 'colorStatistics'
+COLORS = ["RED", "GREEN", "BLUE"]
+
+# Futási mód: competing (mindhárom feldolgozó saját kapcsolattal olvassa a colorQueue-t, prefetch=1)
+# vagy dispatcher (egyetlen fogyasztó nagy prefetch-csel, színenkénti asyncio sorokba osztja szét az üzeneteket)
+MDB_MODE = os.environ.get('MDB_MODE', 'competing')
+DISPATCHER_PREFETCH = int(os.environ.get('DISPATCHER_PREFETCH', 300))
+DISPATCHER_QUEUE_SIZE = int(os.environ.get('DISPATCHER_QUEUE_SIZE', 100))
+
+# Feldolgozónként (színenként) ennyi handler futhat egyszerre; competing módban a prefetch is ennyi,
+# dispatcher módban a közös prefetch-et a DISPATCHER_PREFETCH adja
+HANDLER_CONCURRENCY = int(os.environ.get('HANDLER_CONCURRENCY', 1))
+# A handlerek futtatása: inline (az event loopon) vagy process (ProcessPoolExecutor, CPU-igényes handlerekhez)
+HANDLER_EXECUTOR = os.environ.get('HANDLER_EXECUTOR', 'inline')
+HANDLER_PROCESSES = int(os.environ.get('HANDLER_PROCESSES', 0)) or None  # None = a magok száma
+# Szimulált CPU-munka üzenetenként (ms), mérésekhez; 0 = nincs
+SIMULATED_WORK_MS = float(os.environ.get('SIMULATED_WORK_MS', 0))
+
+
+def process_color(body, color):
+    """
+    A tényleges feldolgozás. Modulszintű, tiszta függvény, hogy ProcessPoolExecutor-ban is futtatható legyen.
+
+    :return: True, ha az üzenet ennek a feldolgozónak szólt és feldolgoztuk
+    """
+    if body != color:
+        return False
+    if SIMULATED_WORK_MS:
+        deadline = time.perf_counter() + SIMULATED_WORK_MS / 1000
+        while time.perf_counter() < deadline:
+            pass
+    return True
+
+
+def failure_outcome(message):
+    """
+    Hibás handler esetén ugyanaz a szabály, mint a HandlerOffload-nál: az első kézbesítést egyszer visszarakjuk
+    a sorba (átmeneti hiba), a már újrakézbesítettet requeue nélkül elutasítjuk (dead-letter exchange-re megy,
+    ha van), így egy feldolgozhatatlan üzenet nem pöröghet a végtelenségig.
+
+    :return: (requeue, kimenetel a statisztikához)
+    """
+    if message.redelivered:
+        return False, OUTCOME_REJECTED
+    return True, OUTCOME_REQUEUED
+
+
+def create_stats_aggregator():
+    return StatsAggregator.from_env(
+        connection_parameters(RABBITMQ_HOST, RABBITMQ_PORT, RABBITMQ_USER, RABBITMQ_PASSWORD)
+    ).start()
+
 
 class AsyncColorProcessor:
-    def __init__(self, color):
+    """
+    - concurrency: ennyi handler futhat egyszerre (a prefetch is ennyi); a nyugták a befejezés sorrendjében mennek
+    - executor: opcionális ProcessPoolExecutor; ha megadjuk, a process_color() ott fut, nem akasztja meg az event loopot
+    """
+
+    def __init__(self, color, stats=None, concurrency=HANDLER_CONCURRENCY, executor=None):
         self.color = color
         self.message_count = 0
+        self.concurrency = max(1, concurrency)
+        self.executor = executor
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._tasks = set()
+        self._handle_latency = HANDLE_LATENCY.labels(f"MDB {color}")
+        self._in_flight = MESSAGES_IN_FLIGHT.labels(f"MDB {color}")
+        # A statisztikát a háttérszálon futó gyűjtő küldi, a feldolgozás csak számlálót növel
+        self.owns_stats = stats is None
+        self.stats = stats or create_stats_aggregator()
 
     async def connect(self):
-        self.connection = await aio_pika.connect_robust(
+        self.connection = await connect_robust(
             host=RABBITMQ_HOST,
             port=RABBITMQ_PORT,
             login=RABBITMQ_USER,
@@ -30,8 +109,8 @@ class AsyncColorProcessor:
         )
         self.channel = await self.connection.channel()
 
-        # QoS beállítása
-        await self.channel.set_qos(prefetch_count=1)
+        # QoS beállítása: a broker annyi üzenetet ad ki, ahány handler egyszerre futhat
+        await self.channel.set_qos(prefetch_count=self.concurrency)
 
         # Üzenetsorok
         self.color_queue = await self.channel.declare_queue(COLOR_QUEUE)
@@ -40,45 +119,192 @@ class AsyncColorProcessor:
         # Feliratkozás az üzenetekre
         await self.color_queue.consume(self.process_message)
 
-        logger.info(f"{self.color} processor connected and waiting for messages")
+        logger.info(f"{self.color} processor connected (concurrency={self.concurrency}) and waiting for messages")
 
     async def process_message(self, message):
-        async with message.process():
-            body = message.body.decode()
-            logger.info(f"MDB {self.color} received message: {body}")
+        """
+        Az üzenetet külön taskban dolgozzuk fel, így egyszerre legfeljebb concurrency handler fut,
+        és mindegyik a saját befejezésekor nyugtáz.
+        """
+        await self.submit(self._process(message))
 
-            if body == self.color:
-                logger.info(f"Processing {self.color} message")
-                self.message_count += 1
+    async def submit(self, coroutine):
+        """
+        A coroutine-t külön taskban futtatja, ha van szabad hely (legfeljebb concurrency fut egyszerre).
+        A competing mód és a dispatcher workerei is ezen át indítják a handlert.
+        """
+        await self._slots.acquire()
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
 
-                if self.message_count % 10 == 0:
-                    await self.send_statistics()
-            else:
-                logger.info(f"Ignoring {body} message (not {self.color})")
+    def _task_done(self, task):
+        self._tasks.discard(task)
+        self._slots.release()
 
-    async def send_statistics(self):
-        statistic_message = f"10 '{self.color}' messages has been processed"
+    async def _process(self, message):
+        started = time.perf_counter()
+        self._in_flight.inc()
+        requeue, outcome = failure_outcome(message)
+        color = None
+        try:
+            async with message.process(requeue=requeue):
+                color = decode_color(message.body, message.content_type)
+                await self.handle(color, message.headers)
+        except Exception as e:
+            logger.error(f"Error in {self.color} handler ({'requeuing once' if requeue else 'rejecting'}): {e}")
+            if color is not None:
+                self.stats.record(color, outcome)
+        finally:
+            self._handle_latency.observe(time.perf_counter() - started)
+            self._in_flight.dec()
 
-        await self.channel.default_exchange.publish(
-            aio_pika.Message(body=statistic_message.encode()),
-            routing_key=STATISTICS_QUEUE
-        )
+    async def handle(self, body, headers=None):
+        logger.info("MDB %s received message: %s", self.color, body)
 
-        logger.info(f"Sent statistics: {statistic_message}")
+        if self.executor is None:
+            processed = process_color(body, self.color)
+        else:
+            processed = await asyncio.get_running_loop().run_in_executor(self.executor, process_color, body, self.color)
+
+        if processed:
+            logger.info("Processing %s message", self.color)
+            self.message_count += 1
+            self.stats.record(body, OUTCOME_ACKED)
+            record_delivery(self.stats, body, headers)
+        else:
+            logger.info("Ignoring %s message (not %s)", body, self.color)
+            self.stats.record(body, OUTCOME_IGNORED)
 
     async def close(self):
+        # A futó handlereket még befejezzük (és nyugtázzuk), mielőtt a kapcsolatot lezárjuk
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
         if self.connection and not self.connection.is_closed:
             await self.connection.close()
             logger.info(f"{self.color} processor connection closed")
+        if self.owns_stats:
+            # A záró flush blokkolhat, ezért nem az event loopon várunk rá
+            await asyncio.to_thread(self.stats.close)
+
+
+class ColorDispatcher:
+    """
+    Egyetlen fogyasztó a colorQueue-n, nagy prefetch-csel. Az üzeneteket szín szerint korlátos asyncio
+    sorokba osztja szét, ahonnan a színenkénti AsyncColorProcessor dolgozza fel őket. A nyugtázás a
+    feldolgozás után történik, így mindhárom szín egyetlen kapcsolaton, teljes pipeline-mélységgel fut,
+    és egyetlen üzenetet sem kell "nem az én színem" miatt eldobni.
+    """
+
+    def __init__(self, colors=COLORS, prefetch_count=DISPATCHER_PREFETCH, queue_size=DISPATCHER_QUEUE_SIZE,
+                 stats=None, executor=None):
+        self.prefetch_count = prefetch_count
+        self.owns_stats = stats is None
+        self.stats = stats or create_stats_aggregator()
+        self.processors = {color: AsyncColorProcessor(color, self.stats, executor=executor) for color in colors}
+        self.queues = {color: asyncio.Queue(maxsize=queue_size) for color in colors}
+        self.workers = []
+        self.connection = None
+
+    async def connect(self):
+        self.connection = await connect_robust(
+            host=RABBITMQ_HOST,
+            port=RABBITMQ_PORT,
+            login=RABBITMQ_USER,
+            password=RABBITMQ_PASSWORD
+        )
+        self.channel = await self.connection.channel()
+
+        # Nagy prefetch: a broker ennyi nyugtázatlan üzenetet adhat ki egyszerre
+        await self.channel.set_qos(prefetch_count=self.prefetch_count)
+
+        # Üzenetsorok
+        self.color_queue = await self.channel.declare_queue(COLOR_QUEUE)
+        await self.channel.declare_queue(STATISTICS_QUEUE)
+
+        # A feldolgozóknak saját kapcsolatuk nincs, a statisztikát a közös gyűjtő küldi
+        for color, processor in self.processors.items():
+            processor.connection = None
+            processor.channel = self.channel
+            self.workers.append(asyncio.create_task(self.run_worker(color)))
+
+        # Feliratkozás az üzenetekre
+        await self.color_queue.consume(self.dispatch)
+
+        logger.info(f"Dispatcher connected (prefetch={self.prefetch_count}) and waiting for messages")
+
+    async def dispatch(self, message):
+        """
+        A beérkező üzenetet a színének megfelelő sorba teszi. Ha a sor tele van, itt várunk (backpressure).
+        """
+        color = decode_color(message.body, message.content_type)
+        queue = self.queues.get(color)
+        if queue is None:
+            logger.info("Ignoring %s message (no processor for this color)", color)
+            await message.ack()
+            return
+        await queue.put(message)
+
+    async def run_worker(self, color):
+        """
+        Egy szín feldolgozó ciklusa: sorból vesz, és a feldolgozó concurrency korlátja alatt külön taskban
+        feldolgoz, majd nyugtáz (hiba esetén lásd failure_outcome()). Így a HANDLER_CONCURRENCY és a
+        folyamatpool dispatcher módban is érvényes.
+        """
+        processor = self.processors[color]
+        queue = self.queues[color]
+        while True:
+            message = await queue.get()
+            await processor.submit(self.handle(processor, color, message))
+
+    async def handle(self, processor, color, message):
+        try:
+            await processor.handle(color, message.headers)  # a dispatcher már dekódolta és szín szerint szétosztotta
+            await message.ack()
+        except asyncio.CancelledError:
+            await message.nack(requeue=True)
+            raise
+        except Exception as e:
+            requeue, outcome = failure_outcome(message)
+            logger.error(f"Error in {color} handler ({'requeuing once' if requeue else 'rejecting'}): {e}")
+            await message.nack(requeue=requeue)
+            self.stats.record(color, outcome)
+        finally:
+            self.queues[color].task_done()
+
+    async def close(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        # A már elindított handlereket még befejezzük (és nyugtázzuk)
+        for processor in self.processors.values():
+            if processor._tasks:
+                await asyncio.gather(*processor._tasks, return_exceptions=True)
+        if self.connection and not self.connection.is_closed:
+            await self.connection.close()
+            logger.info("Dispatcher connection closed")
+        if self.owns_stats:
+            await asyncio.to_thread(self.stats.close)
 
 
 async def main():
-    # Létrehozzuk és elindítjuk mindhárom színfeldolgozót
+    # Prometheus metrikák: http://127.0.0.1:9110/metrics (METRICS_PORT=0 kikapcsolja)
+    serve_metrics(9110)
+    # Létrehozzuk és elindítjuk a feldolgozókat a választott módban
+    # A feldolgozók egyetlen statisztika-gyűjtőt és küldő kapcsolatot használnak
+    stats = create_stats_aggregator()
+    # CPU-igényes handlerekhez közös folyamatpool, hogy a feldolgozás ne akassza meg az event loopot
+    executor = ProcessPoolExecutor(max_workers=HANDLER_PROCESSES) if HANDLER_EXECUTOR == 'process' else None
     processors = []
-    for color in ["RED", "GREEN", "BLUE"]:
-        processor = AsyncColorProcessor(color)
-        await processor.connect()
-        processors.append(processor)
+    if MDB_MODE == 'dispatcher':
+        dispatcher = ColorDispatcher(stats=stats, executor=executor)
+        await dispatcher.connect()
+        processors.append(dispatcher)
+    else:
+        for color in COLORS:
+            processor = AsyncColorProcessor(color, stats, executor=executor)
+            await processor.connect()
+            processors.append(processor)
 
     # Futtatjuk, amíg meg nem szakítják
     try:
@@ -88,6 +314,9 @@ async def main():
         # Bezárjuk a kapcsolatokat
         for processor in processors:
             await processor.close()
+        await asyncio.to_thread(stats.close)
+        if executor is not None:
+            executor.shutdown()
 
 
 if __name__ == "__main__":
@@ -1,8 +1,20 @@
+import os
+import sys
 import pika
 import logging
 
+# A közös modulok (common/) a projekt gyökeréből érhetők el
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.publisher_pool import connection_parameters
+from common.transport import blocking_connection
+from common.stats_aggregator import StatsAggregator, OUTCOME_ACKED, OUTCOME_IGNORED
+from common.color_codec import decode_color
+from common.log_config import configure_logging
+from common.tracing import record_delivery
+from common.metrics import serve_metrics
+
 # Beállítjuk a naplózást
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+configure_logging()
 logger = logging.getLogger("mdb_blue")
 
 # RabbitMQ kapcsolati adatok
@@ -26,8 +38,13 @@ class BlueMessageProcessor:
         self.message_count = 0
         self.color = "BLUE"
 
+        # Statisztika: csak számlálót növelünk, a tömör delta rekordot a háttérszál küldi
+        self.stats = StatsAggregator.from_env(
+            connection_parameters(RABBITMQ_HOST, RABBITMQ_PORT, RABBITMQ_USER, RABBITMQ_PASSWORD)
+        ).start()
+
         # Kapcsolódás a RabbitMQ-hoz
-        self.connection = pika.BlockingConnection(
+        self.connection = blocking_connection(
             pika.ConnectionParameters(
                 host=RABBITMQ_HOST,
                 port=RABBITMQ_PORT,
@@ -61,37 +78,22 @@ class BlueMessageProcessor:
         :param properties: Az üzenet tulajdonságai
         :param body: Az üzenet tartalma
         """
-        message = body.decode('utf-8')
-        logger.info(f"MDB {self.color} received message: {message}")
+        message = decode_color(body, properties.content_type)  # bináris (1 bájtos kód) vagy régi szöveges törzs
+        logger.info("MDB %s received message: %s", self.color, message)
 
         # Csak a kék üzeneteket dolgozzuk fel
         if message == self.color:
-            logger.info(f"Processing {self.color} message")
+            logger.info("Processing %s message", self.color)
             self.message_count += 1
-
-            # Ha elértük a 10 üzenetet, statisztikát küldünk
-            if self.message_count % 10 == 0:
-                self.send_statistics()
+            self.stats.record(message, OUTCOME_ACKED)
+            record_delivery(self.stats, message, properties.headers)
         else:
-            logger.info(f"Ignoring {message} message (not {self.color})")
+            logger.info("Ignoring %s message (not %s)", message, self.color)
+            self.stats.record(message, OUTCOME_IGNORED)
 
         # Nyugtázzuk az üzenet feldolgozását
         ch.basic_ack(delivery_tag=method.delivery_tag)
 
-    def send_statistics(self):
-        """
-        Statisztikát küld a statisztikai üzenetsorba.
-        """
-        statistic_message = f"10 '{self.color}' messages has been processed"
-
-        self.channel.basic_publish(
-            exchange='',
-            routing_key=STATISTICS_QUEUE,
-            body=statistic_message.encode('utf-8')
-        )
-
-        logger.info(f"Sent statistics: {statistic_message}")
-
     def start(self):
         """
         Elindítja az üzenetfeldolgozást.
@@ -100,12 +102,15 @@ class BlueMessageProcessor:
 
 
 if __name__ == "__main__":
+    # Prometheus metrikák: http://127.0.0.1:9113/metrics (METRICS_PORT=0 kikapcsolja)
+    serve_metrics(9113)
     processor = BlueMessageProcessor()
     try:
         processor.start()
     except KeyboardInterrupt:
         logger.info("Stopping processor...")
     finally:
+        processor.stats.close()
         if processor.connection.is_open:
             processor.connection.close()
             logger.info("Connection closed")
\ No newline at end of file
@@ -1,9 +1,24 @@
+import os
+import sys
 import pika
+import signal
 import logging
-import multiprocessing
+
+# A közös modulok (common/) a projekt gyökeréből érhetők el
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.prefetch_controller import AdaptivePrefetchController
+from common.publisher_pool import connection_parameters
+from common.transport import blocking_connection
+from common.stats_aggregator import StatsAggregator, OUTCOME_ACKED, OUTCOME_IGNORED
+from common.color_codec import decode_color
+from common.color_routing import COLORS, ROUTING_HEADERS, color_queue_name, declare_headers_routing
+from common.log_config import configure_logging
+from common.tracing import record_delivery
+from common.metrics import REGISTRY, serve_metrics
+from worker_runtime import SharedMetrics, Supervisor
 
 # Beállítjuk a naplózást
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+configure_logging()
 logger = logging.getLogger("color_processor")
 
 # RabbitMQ kapcsolati adatok
@@ -14,14 +29,39 @@ RABBITMQ_PASSWORD = 'guest'
 COLOR_QUEUE = 'colorQueue'
 STATISTICS_QUEUE = 'colorStatistics'
 
+# Routing mód: queue (minden worker a közös colorQueue-t olvassa, és bármely színt feldolgoz - nincs
+# "nem az én színem" eldobás) vagy headers (színenkénti sorok, a workerek a sorok között vannak szétosztva)
+COLOR_ROUTING = os.environ.get('COLOR_ROUTING', 'queue')
+# Workerek száma sor-shardonként; 0 = a magok száma egyenletesen elosztva a sorok között
+WORKERS_PER_QUEUE = int(os.environ.get('WORKERS_PER_QUEUE', 0))
+METRICS_INTERVAL = float(os.environ.get('METRICS_INTERVAL', 10))
+
+# A workerek megosztott memóriában vezetett metrikái (slotonként)
+METRIC_FIELDS = tuple(f"processed_{color}" for color in COLORS) + ("ignored", "errors", "restarts")
+
 
 class ColorMessageProcessor:
-    def __init__(self, color):
+    """
+    - color: a feldolgozandó szín; None = bármely ismert szín (közös sor esetén)
+    - queue_name: a fogyasztott sor (headers módban a színenkénti sor)
+    - metrics / slot: a worker megosztott memóriás metrikái (opcionális)
+    """
+
+    def __init__(self, color, stats=None, queue_name=COLOR_QUEUE, metrics=None, slot=0):
         self.message_count = 0
         self.color = color
+        self.queue_name = queue_name
+        self.metrics = metrics
+        self.slot = slot
+        # Statisztika: csak számlálót növelünk, a küldést a háttérben futó gyűjtő végzi saját kapcsolaton
+        # (a szálak közösen használhatják; ha nem kaptunk, saját gyűjtőt indítunk)
+        self.owns_stats = stats is None
+        self.stats = stats or StatsAggregator.from_env(
+            connection_parameters(RABBITMQ_HOST, RABBITMQ_PORT, RABBITMQ_USER, RABBITMQ_PASSWORD)
+        ).start()
 
         # Kapcsolódás a RabbitMQ-hoz
-        self.connection = pika.BlockingConnection(
+        self.connection = blocking_connection(
             pika.ConnectionParameters(
                 host=RABBITMQ_HOST,
                 port=RABBITMQ_PORT,
@@ -30,48 +70,51 @@ class ColorMessageProcessor:
         )
         self.channel = self.connection.channel()
 
-        # Üzenetsorok létrehozása
-        self.channel.queue_declare(queue=COLOR_QUEUE)
+        # Üzenetsorok létrehozása (headers módban az exchange és a színenkénti sorok kötéssel együtt)
+        if COLOR_ROUTING == ROUTING_HEADERS:
+            declare_headers_routing(self.channel)
+        else:
+            self.channel.queue_declare(queue=self.queue_name)
         self.channel.queue_declare(queue=STATISTICS_QUEUE)
 
         # QoS és feliratkozás
-        self.channel.basic_qos(prefetch_count=1)
+        # A prefetch-ablak beállítását lásd: AdaptivePrefetchController.from_env()
+        self.prefetch = AdaptivePrefetchController.from_env(
+            apply=lambda count: self.channel.basic_qos(prefetch_count=count),
+            name=f"MDB {self.color or 'ANY'} [{self.slot}]"
+        )
+        self.channel.basic_qos(prefetch_count=self.prefetch.window)
         self.channel.basic_consume(
-            queue=COLOR_QUEUE,
+            queue=self.queue_name,
             on_message_callback=self.process_message,
             auto_ack=False
         )
 
-        logger.info(f"{self.color} Message Processor started. Waiting for messages...")
+        logger.info(f"{self.color or 'ANY'} Message Processor started. Waiting for messages on {self.queue_name}...")
 
     def process_message(self, ch, method, properties, body):
-        message = body.decode('utf-8')
-        logger.info(f"MDB {self.color} received message: {message}")
+        started = self.prefetch.message_started()
+        message = decode_color(body, properties.content_type)  # bináris (1 bájtos kód) vagy régi szöveges törzs
+        logger.info("MDB %s received message: %s", self.color, message)
 
-        # Csak a megfelelő színű üzeneteket dolgozzuk fel
-        if message == self.color:
-            logger.info(f"Processing {self.color} message")
+        # Csak a megfelelő színű üzeneteket dolgozzuk fel (color=None esetén bármely ismert színt)
+        if message == self.color or (self.color is None and message in COLORS):
+            logger.info("Processing %s message", message)
             self.message_count += 1
-
-            # Ha elértük a 10 üzenetet, statisztikát küldünk
-            if self.message_count % 10 == 0:
-                self.send_statistics()
+            self.stats.record(message, OUTCOME_ACKED)
+            record_delivery(self.stats, message, properties.headers)
+            if self.metrics is not None:
+                self.metrics.add(self.slot, f"processed_{message}")
         else:
-            logger.info(f"Ignoring {message} message (not {self.color})")
+            logger.info("Ignoring %s message (not %s)", message, self.color)
+            self.stats.record(message, OUTCOME_IGNORED)
+            if self.metrics is not None:
+                self.metrics.add(self.slot, "ignored")
 
         # Nyugtázzuk az üzenet feldolgozását
         ch.basic_ack(delivery_tag=method.delivery_tag)
 
-    def send_statistics(self):
-        statistic_message = f"10 '{self.color}' messages has been processed"
-
-        self.channel.basic_publish(
-            exchange='',
-            routing_key=STATISTICS_QUEUE,
-            body=statistic_message.encode('utf-8')
-        )
-
-        logger.info(f"Sent statistics: {statistic_message}")
+        self.prefetch.message_finished(started)
 
     def start(self):
         self.channel.start_consuming()
@@ -80,36 +123,64 @@ class ColorMessageProcessor:
         if self.connection.is_open:
             self.channel.stop_consuming()
             self.connection.close()
-            logger.info(f"{self.color} processor connection closed")
-
-
-def processor_thread(color):
-    processor = ColorMessageProcessor(color)
+            logger.info(f"{self.color or 'ANY'} processor connection closed")
+        if self.owns_stats:
+            self.stats.close()
+
+
+def worker_assignments():
+    """
+    Slotonként a worker (szín, sor) párja. Headers módban a színenkénti sorok között, körbeforgó
+    kiosztással; queue módban minden worker a közös sort olvassa, bármely színnel.
+    """
+    cores = os.cpu_count() or 1
+    if COLOR_ROUTING == ROUTING_HEADERS:
+        shards = [(color, color_queue_name(color)) for color in COLORS]
+    else:
+        shards = [(None, COLOR_QUEUE)]
+    per_queue = WORKERS_PER_QUEUE or max(1, cores // len(shards))
+    return [shards[i % len(shards)] for i in range(per_queue * len(shards))]
+
+
+def worker_main(slot, assignment, metrics):
+    """
+    Egy worker folyamat belépési pontja. A SIGTERM-et (a supervisor leállítása) rendezett kilépéssé
+    alakítjuk, a Ctrl+C-t pedig a supervisor kezeli. Hiba esetén nem nulla kóddal lépünk ki,
+    így a supervisor újraindítja a workert.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    color, queue_name = assignment
+    processor = None
     try:
+        processor = ColorMessageProcessor(color, queue_name=queue_name, metrics=metrics, slot=slot)
         processor.start()
     except Exception as e:
-        logger.error(f"Error in {color} processor: {e}")
+        logger.error(f"Error in worker {slot} ({queue_name}): {e}")
+        metrics.add(slot, "errors")
+        sys.exit(1)
     finally:
-        processor.stop()
+        if processor is not None:
+            processor.stop()
 
 
 if __name__ == "__main__":
-    # Létrehozzuk a három folyamatot a három színnek
-    processes = []
-    for color in ["RED", "GREEN", "BLUE"]:
-        process = multiprocessing.Process(target=processor_thread, args=(color,))
-        processes.append(process)
-        process.start()
-        logger.info(f"Started {color} processor process")
-
-    # Várunk amíg a főprogram fut
+    # Magonként egy worker folyamat, a sorok között elosztva; a supervisor újraindítja a leállt workereket
+    assignments = worker_assignments()
+    metrics = SharedMetrics(len(assignments), METRIC_FIELDS)
+    supervisor = Supervisor(worker_main, assignments, metrics).start()
+    # A workerek megosztott memóriás számlálói a supervisor /metrics végpontján (METRICS_PORT=0 kikapcsolja)
+    REGISTRY.register_collector(metrics.exposition)
+    serve_metrics(9110)
+    logger.info(f"Started {len(assignments)} worker processes ({COLOR_ROUTING} routing)")
+
     try:
         # A főfolyamat addig fut, amíg a felhasználó meg nem szakítja
-        for process in processes:
-            process.join()
+        supervisor.run(metrics_interval=METRICS_INTERVAL)
     except KeyboardInterrupt:
         logger.info("Stopping all processors...")
-        for process in processes:
-            process.terminate()
+    finally:
+        supervisor.stop()
 
-    logger.info("All processors stopped")
\ No newline at end of file
+    logger.info("All processors stopped")
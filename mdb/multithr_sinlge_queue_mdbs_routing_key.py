@@ -1,11 +1,24 @@
 import os
+import sys
 import pika
 import logging
 import threading
 import time
 
+# A közös modulok (common/) a projekt gyökeréből érhetők el
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.prefetch_controller import AdaptivePrefetchController
+from common.publisher_pool import connection_parameters
+from common.transport import blocking_connection
+from common.stats_aggregator import StatsAggregator, OUTCOME_ACKED, OUTCOME_REJECTED, OUTCOME_REQUEUED
+from common.color_codec import decode_color
+from common.color_routing import ROUTING_HEADERS, color_queue_name, declare_headers_routing
+from common.log_config import configure_logging
+from common.tracing import record_delivery
+from common.metrics import serve_metrics
+
 # Beállítjuk a naplózást
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+configure_logging()
 logger = logging.getLogger("color_processor")
 logging.getLogger("pika").setLevel(logging.WARNING)
 
@@ -17,16 +30,28 @@ RABBITMQ_PASSWORD = os.environ.get('RABBITMQ_PASS', 'guest')
 COLOR_QUEUE = 'colorQueue'
 STATISTICS_QUEUE = 'colorStatistics'
 
+# Routing mód: queue (mindhárom feldolgozó a közös colorQueue-t olvassa, a más színűt requeue-olja)
+# vagy headers (a COLOR fejléc szerinti headers exchange, minden feldolgozónak saját sora van).
+# Az ingress (soap_service.py) COLOR_ROUTING beállításának ezzel egyeznie kell.
+COLOR_ROUTING = os.environ.get('COLOR_ROUTING', 'queue')
+
 
 class ColorMessageProcessor:
-    def __init__(self, color):
+    def __init__(self, color, stats=None):
         self.message_count = 0
         self.color = color
-        self.queue_name = COLOR_QUEUE  
+        # Statisztika: csak számlálót növelünk, a küldést a háttérben futó gyűjtő végzi saját kapcsolaton
+        # (a szálak közösen használhatják; ha nem kaptunk, saját gyűjtőt indítunk)
+        self.owns_stats = stats is None
+        self.stats = stats or StatsAggregator.from_env(
+            connection_parameters(RABBITMQ_HOST, RABBITMQ_PORT, RABBITMQ_USER, RABBITMQ_PASSWORD)
+        ).start()
+        # Headers módban saját, a COLOR fejlécre kötött sor, így nincs requeue-vihar
+        self.queue_name = color_queue_name(color) if COLOR_ROUTING == ROUTING_HEADERS else COLOR_QUEUE
 
 
         # Kapcsolódás a RabbitMQ-hoz
-        self.connection = pika.BlockingConnection(
+        self.connection = blocking_connection(
             pika.ConnectionParameters(
                 host=RABBITMQ_HOST,
                 port=RABBITMQ_PORT,
@@ -37,15 +62,23 @@ class ColorMessageProcessor:
 
 
 
-        # Üzenetsor létrehozása
-        self.channel.queue_declare(queue=self.queue_name)
+        # Üzenetsor létrehozása (headers módban az exchange és a színenkénti sorok kötéssel együtt)
+        if COLOR_ROUTING == ROUTING_HEADERS:
+            declare_headers_routing(self.channel, colors=[self.color])
+        else:
+            self.channel.queue_declare(queue=self.queue_name)
 
 
         # Statisztikai sor létrehozása
         self.channel.queue_declare(queue=STATISTICS_QUEUE)
 
         # QoS és feliratkozás
-        self.channel.basic_qos(prefetch_count=1)
+        # A prefetch-ablak beállítását lásd: AdaptivePrefetchController.from_env()
+        self.prefetch = AdaptivePrefetchController.from_env(
+            apply=lambda count: self.channel.basic_qos(prefetch_count=count),
+            name=f"MDB {self.color}"
+        )
+        self.channel.basic_qos(prefetch_count=self.prefetch.window)
         self.channel.basic_consume(
             queue=self.queue_name,
             on_message_callback=self.process_message,
@@ -63,35 +96,27 @@ class ColorMessageProcessor:
         body        | maga az üzenet tartalma                                       | RabbitMQ tölti
         """
 
-        message = body.decode('utf-8')
+        started = self.prefetch.message_started()
+        message = decode_color(body, properties.content_type)  # bináris (1 bájtos kód) vagy régi szöveges törzs
 
         # Ellenőrizzük, hogy a megfelelő színű üzenet-e
-        if properties.headers and properties.headers.get('COLOR') == self.color:
-            logger.info(f"MDB {self.color} processing message: {message}")
+        if message == self.color:
+            logger.info("MDB %s processing message: %s", self.color, message)
             self.message_count += 1
 
-            # Ha elértük a 10 üzenetet, statisztikát küldünk
-            if self.message_count % 10 == 0:
-                self.send_statistics()
-
             # Nyugtázzuk a feldolgozott üzenetet
             ch.basic_ack(delivery_tag=method.delivery_tag)
+            self.stats.record(self.color, OUTCOME_ACKED)
+            record_delivery(self.stats, self.color, properties.headers)
         else:
-            logger.info(f"MDB {self.color} rejecting message: {message} (wrong color)")
-            # Visszautasítjuk az üzenetet, hogy visszakerüljön a sorba
-            ch.basic_reject(delivery_tag=method.delivery_tag, requeue=True)
-        
-
-    def send_statistics(self):
-        statistic_message = f"10 '{self.color}' messages has been processed"
-
-        self.channel.basic_publish(
-            exchange='',
-            routing_key=STATISTICS_QUEUE,
-            body=statistic_message.encode('utf-8')
-        )
+            logger.info("MDB %s rejecting message: %s (wrong color)", self.color, message)
+            # Visszautasítjuk az üzenetet, hogy visszakerüljön a sorba.
+            # Headers módban ide csak hibás fejlécű üzenet juthat; azt a saját sorunkba visszarakni végtelen ciklus lenne.
+            requeue = COLOR_ROUTING != ROUTING_HEADERS
+            ch.basic_reject(delivery_tag=method.delivery_tag, requeue=requeue)
+            self.stats.record(message, OUTCOME_REQUEUED if requeue else OUTCOME_REJECTED)
 
-        logger.info(f"Sent statistics: {statistic_message}")
+        self.prefetch.message_finished(started)
 
     def start(self):
         self.channel.start_consuming()
@@ -101,10 +126,12 @@ class ColorMessageProcessor:
             self.channel.stop_consuming()
             self.connection.close()
             logger.info(f"{self.color} processor connection closed")
+        if self.owns_stats:
+            self.stats.close()
 
 
-def processor_thread(color):
-    processor = ColorMessageProcessor(color)
+def processor_thread(color, stats=None):
+    processor = ColorMessageProcessor(color, stats)
     try:
         processor.start() # elindul a consume, ez blokkoló
     except Exception as e:
@@ -114,10 +141,16 @@ def processor_thread(color):
 
 
 if __name__ == "__main__":
+    # Prometheus metrikák: http://127.0.0.1:9110/metrics (METRICS_PORT=0 kikapcsolja)
+    serve_metrics(9110)
+    # A három szál egyetlen statisztika-gyűjtőt és küldő kapcsolatot használ
+    stats = StatsAggregator.from_env(
+        connection_parameters(RABBITMQ_HOST, RABBITMQ_PORT, RABBITMQ_USER, RABBITMQ_PASSWORD)
+    ).start()
     # Létrehozzuk a három szálat a három színnek
     threads = []
     for color in ["RED", "GREEN", "BLUE"]:
-        thread = threading.Thread(target=processor_thread, args=(color,))
+        thread = threading.Thread(target=processor_thread, args=(color, stats))
         thread.daemon = True  # Főprogram leállása esetén a szálak is leállnak
         threads.append(thread)
         thread.start()
@@ -134,5 +167,6 @@ if __name__ == "__main__":
     # Megvárjuk, hogy minden szál befejeződjön
     for thread in threads:
         thread.join(timeout=5)
+    stats.close()
 
     logger.info("All processors stopped")
\ No newline at end of file
@@ -1,11 +1,25 @@
 import os
+import sys
 import pika
+import functools
 import logging
 import threading
 import time
 
+# A közös modulok (common/) a projekt gyökeréből érhetők el
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.prefetch_controller import AdaptivePrefetchController
+from common.publisher_pool import connection_parameters
+from common.transport import blocking_connection
+from common.stats_aggregator import StatsAggregator, OUTCOME_ACKED, OUTCOME_REQUEUED
+from common.color_codec import decode_color
+from common.handler_offload import HandlerOffload
+from common.log_config import configure_logging
+from common.tracing import record_delivery
+from common.metrics import serve_metrics
+
 # Beállítjuk a naplózást
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+configure_logging()
 logger = logging.getLogger("color_processor")
 logging.getLogger("pika").setLevel(logging.WARNING)
 
@@ -18,14 +32,20 @@ STATISTICS_QUEUE = 'colorStatistics'
 
 
 class ColorMessageProcessor:
-    def __init__(self, color):
+    def __init__(self, color, stats=None):
         self.message_count = 0
         self.color = color
+        # Statisztika: csak számlálót növelünk, a küldést a háttérben futó gyűjtő végzi saját kapcsolaton
+        # (a szálak közösen használhatják; ha nem kaptunk, saját gyűjtőt indítunk)
+        self.owns_stats = stats is None
+        self.stats = stats or StatsAggregator.from_env(
+            connection_parameters(RABBITMQ_HOST, RABBITMQ_PORT, RABBITMQ_USER, RABBITMQ_PASSWORD)
+        ).start()
         self.queue_name = f"queue_{color.lower()}"  # pl. queue_red
         self.routing_key = f"color.{color.lower()}"  # pl. color.red
 
         # Kapcsolódás a RabbitMQ-hoz
-        self.connection = pika.BlockingConnection(
+        self.connection = blocking_connection(
             pika.ConnectionParameters(
                 host=RABBITMQ_HOST,
                 port=RABBITMQ_PORT,
@@ -48,8 +68,17 @@ class ColorMessageProcessor:
         # Statisztikai sor létrehozása
         self.channel.queue_declare(queue=STATISTICS_QUEUE)
 
+        # CONSUMER_MODE=offload esetén a handler korlátos szálpoolon fut, az I/O szál csak kézbesít és nyugtáz
+        self.offload = HandlerOffload.from_env(self.connection, name=f"mdb-{self.color.lower()}")
+
         # QoS és feliratkozás
-        self.channel.basic_qos(prefetch_count=1)
+        # A prefetch-ablak beállítását lásd: AdaptivePrefetchController.from_env()
+        self.prefetch = AdaptivePrefetchController.from_env(
+            apply=lambda count: self.channel.basic_qos(prefetch_count=count),
+            name=f"MDB {self.color}",
+            workers=self.offload.threads if self.offload else None
+        )
+        self.channel.basic_qos(prefetch_count=self.prefetch.window)
         self.channel.basic_consume(
             queue=self.queue_name,
             on_message_callback=self.process_message,
@@ -67,34 +96,49 @@ class ColorMessageProcessor:
         body        | maga az üzenet tartalma | RabbitMQ tölti
         """
 
-        message = body.decode('utf-8')
-        logger.info(f"MDB {self.color} received message: {message}")
+        started = self.prefetch.message_started()
+        if self.offload is None:
+            self.settle(ch, method.delivery_tag, started, self.handle(body, properties))
+        else:
+            # A handler worker szálon fut, a nyugtázás az I/O szálon (add_callback_threadsafe)
+            settle = functools.partial(self.settle, ch, method.delivery_tag, started)
+            self.offload.submit(ch, method.delivery_tag, self.handle, settle, body, properties,
+                                redelivered=method.redelivered,
+                                finished=functools.partial(self.prefetch.message_finished, started))
+
+    def handle(self, body, properties):
+        """
+        A tényleges feldolgozás. Offload módban worker szálon fut, ezért a csatornához nem nyúlhat.
+
+        :return: (dekódolt üzenet, feldolgoztuk-e)
+        """
+        message = decode_color(body, properties.content_type)  # bináris (1 bájtos kód) vagy régi szöveges törzs
+        logger.info("MDB %s received message: %s", self.color, message)
 
         # Csak a megfelelő színű üzeneteket dolgozzuk fel
         if message == self.color:
-            logger.info(f"Processing {self.color} message")
+            logger.info("Processing %s message", self.color)
+            record_delivery(self.stats, message, properties.headers)
+            return message, True
+        logger.info("Ignoring %s message (not %s), requeuing...", message, self.color)
+        return message, False
+
+    def settle(self, ch, delivery_tag, started, result):
+        """
+        A nyugtázás és a számlálók; mindig a kapcsolat I/O szálán fut.
+        """
+        message, processed = result
+        if processed:
             self.message_count += 1
             # Nyugtázzuk az üzenet feldolgozását
-            ch.basic_ack(delivery_tag=method.delivery_tag)
-
-            # Ha elértük a 10 üzenetet, statisztikát küldünk
-            if self.message_count % 10 == 0:
-                self.send_statistics()
+            ch.basic_ack(delivery_tag=delivery_tag)
+            self.stats.record(message, OUTCOME_ACKED)
         else:
-            logger.info(f"Ignoring {message} message (not {self.color}), requeuing...")
             # Nem az én üzenetem, visszarakjuk
-            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
-
-    def send_statistics(self):
-        statistic_message = f"10 '{self.color}' messages has been processed"
-
-        self.channel.basic_publish(
-            exchange='',
-            routing_key=STATISTICS_QUEUE,
-            body=statistic_message.encode('utf-8')
-        )
+            ch.basic_nack(delivery_tag=delivery_tag, requeue=True)
+            self.stats.record(message, OUTCOME_REQUEUED)
 
-        logger.info(f"Sent statistics: {statistic_message}")
+        self.prefetch.message_finished(started)
 
     def start(self):
         self.channel.start_consuming()
@@ -102,12 +146,16 @@ class ColorMessageProcessor:
     def stop(self):
         if self.connection.is_open:
             self.channel.stop_consuming()
+            if self.offload is not None:
+                self.offload.shutdown()
             self.connection.close()
             logger.info(f"{self.color} processor connection closed")
+        if self.owns_stats:
+            self.stats.close()
 
 
-def processor_thread(color):
-    processor = ColorMessageProcessor(color)
+def processor_thread(color, stats=None):
+    processor = ColorMessageProcessor(color, stats)
     try:
         processor.start()
     except Exception as e:
@@ -117,10 +165,16 @@ def processor_thread(color):
 
 
 if __name__ == "__main__":
+    # Prometheus metrikák: http://127.0.0.1:9110/metrics (METRICS_PORT=0 kikapcsolja)
+    serve_metrics(9110)
+    # A három szál egyetlen statisztika-gyűjtőt és küldő kapcsolatot használ
+    stats = StatsAggregator.from_env(
+        connection_parameters(RABBITMQ_HOST, RABBITMQ_PORT, RABBITMQ_USER, RABBITMQ_PASSWORD)
+    ).start()
     # Létrehozzuk a három szálat a három színnek
     threads = []
     for color in ["RED", "GREEN", "BLUE"]:
-        thread = threading.Thread(target=processor_thread, args=(color,))
+        thread = threading.Thread(target=processor_thread, args=(color, stats))
         thread.daemon = True  # Főprogram leállása esetén a szálak is leállnak
         threads.append(thread)
         thread.start()
@@ -137,5 +191,6 @@ if __name__ == "__main__":
     # Megvárjuk, hogy minden szál befejeződjön
     for thread in threads:
         thread.join(timeout=5)
+    stats.close()
 
     logger.info("All processors stopped")
\ No newline at end of file
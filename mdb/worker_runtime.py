@@ -0,0 +1,142 @@
+"""
+Folyamat-alapú worker futtatókörnyezet a multiprocessing_mdbs.py-hoz.
+
+- Minden worker egy külön folyamat (magonként egy), egy előre kiosztott sorral (slot -> queue).
+- A Supervisor figyeli a workereket, a leállt (összeomlott) workert exponenciális várakozással
+  újraindítja ugyanabba a slotba, így a kiosztás és a metrikák folytonosak maradnak.
+- A metrikák megosztott memóriában (multiprocessing.Array, zár nélkül) vannak: minden mezőt pontosan
+  egy folyamat ír (a számlálókat a slot workere, az újraindításokat a supervisor), a supervisor
+  pedig időnként összesíti és naplózza őket.
+"""
+import logging
+import multiprocessing
+import time
+
+logger = logging.getLogger("worker_runtime")
+
+
+class SharedMetrics:
+    """
+    Slotonként egy sor számláló a megosztott memóriában.
+    """
+
+    def __init__(self, slots, fields):
+        self.slots = slots
+        self.fields = tuple(fields)
+        self._index = {name: i for i, name in enumerate(self.fields)}
+        self._values = multiprocessing.Array('Q', slots * len(self.fields), lock=False)
+
+    def add(self, slot, field, count=1):
+        """
+        Csak a slot saját workere (illetve a supervisor-mezőket a supervisor) hívja, ezért nem kell zár.
+        """
+        self._values[slot * len(self.fields) + self._index[field]] += count
+
+    def slot_values(self, slot):
+        base = slot * len(self.fields)
+        return dict(zip(self.fields, self._values[base:base + len(self.fields)]))
+
+    def totals(self):
+        width = len(self.fields)
+        values = self._values[:]
+        return {name: sum(values[i::width]) for i, name in enumerate(self.fields)}
+
+    def exposition(self, prefix="color_worker"):
+        """
+        A számlálók Prometheus szöveges sorai slotonként (a supervisor /metrics végpontjához).
+        """
+        width = len(self.fields)
+        values = self._values[:]
+        lines = []
+        for i, field in enumerate(self.fields):
+            name = f"{prefix}_{field}_total"
+            lines.append(f"# HELP {name} Worker counter {field} per slot")
+            lines.append(f"# TYPE {name} counter")
+            lines.extend(f'{name}{{slot="{slot}"}} {values[slot * width + i]}' for slot in range(self.slots))
+        return lines
+
+
+class Supervisor:
+    """
+    Elindítja és életben tartja a workereket.
+
+    - assignments: slotonként a worker paramétere (pl. a sor neve), a worker a target(slot, assignment, metrics) hívást kapja
+    - metrics: SharedMetrics; a supervisor a "restarts" mezőt írja, ha van ilyen
+    - restart_backoff / max_backoff: az újraindítás előtti várakozás (másodperc), ismételt összeomlásnál duplázódik
+    - stable_after: ennyi másodperc hibátlan futás után a várakozás visszaáll az alapértékre
+    """
+
+    def __init__(self, target, assignments, metrics, restart_backoff=1.0, max_backoff=30.0, stable_after=60.0):
+        self.target = target
+        self.assignments = list(assignments)
+        self.metrics = metrics
+        self.restart_backoff = restart_backoff
+        self.max_backoff = max_backoff
+        self.stable_after = stable_after
+
+        self.processes = [None] * len(self.assignments)
+        self._started_at = [0.0] * len(self.assignments)
+        self._backoff = [restart_backoff] * len(self.assignments)
+        self._restart_at = [None] * len(self.assignments)
+        self._stopping = False
+
+    def start(self):
+        for slot in range(len(self.assignments)):
+            self._spawn(slot)
+        return self
+
+    def _spawn(self, slot):
+        process = multiprocessing.Process(
+            target=self.target,
+            args=(slot, self.assignments[slot], self.metrics),
+            name=f"worker-{slot}",
+            daemon=True
+        )
+        process.start()
+        self.processes[slot] = process
+        self._started_at[slot] = time.monotonic()
+        self._restart_at[slot] = None
+        logger.info(f"Started worker {slot} (pid {process.pid}) for {self.assignments[slot]}")
+
+    def check(self):
+        """
+        Egy felügyeleti kör: a leállt workereket (a várakozási idő letelte után) újraindítja.
+        """
+        now = time.monotonic()
+        for slot, process in enumerate(self.processes):
+            if self._stopping or process is None or process.is_alive():
+                continue
+            if self._restart_at[slot] is None:
+                if now - self._started_at[slot] >= self.stable_after:
+                    self._backoff[slot] = self.restart_backoff
+                delay = self._backoff[slot]
+                self._backoff[slot] = min(self.max_backoff, delay * 2)
+                self._restart_at[slot] = now + delay
+                logger.warning(f"Worker {slot} (pid {process.pid}) exited with code {process.exitcode}, "
+                               f"restarting in {delay:.1f} seconds")
+            elif now >= self._restart_at[slot]:
+                if "restarts" in self.metrics.fields:
+                    self.metrics.add(slot, "restarts")
+                self._spawn(slot)
+
+    def run(self, check_interval=0.5, metrics_interval=10.0):
+        """
+        Felügyeleti ciklus; metrics_interval másodpercenként naplózza az összesített metrikákat.
+        """
+        next_report = time.monotonic() + metrics_interval
+        while not self._stopping:
+            self.check()
+            if time.monotonic() >= next_report:
+                logger.info(f"Worker metrics: {self.metrics.totals()}")
+                next_report += metrics_interval
+            time.sleep(check_interval)
+
+    def stop(self, timeout=5.0):
+        self._stopping = True
+        for process in self.processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            if process is not None:
+                process.join(timeout)
+        logger.info(f"All workers stopped. Final metrics: {self.metrics.totals()}")
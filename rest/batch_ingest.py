@@ -0,0 +1,154 @@
+"""
+Tömeges (batch) színfogadás a REST szolgáltatásokhoz (rest_service.py, rest_service_multiqueue.py).
+
+Egy kérésben sok szín érkezhet, kétféle formában:
+- JSON tömb:  ["RED", "GREEN"]  vagy  [{"color": "RED"}, {"color": "BLUE"}]
+- NDJSON (Content-Type: application/x-ndjson): soronként egy "RED" vagy {"color": "RED"}
+
+Az elemeket egy menetben validáljuk, majd egyetlen kölcsönzött csatornán, egy sorozatban publikáljuk.
+"""
+import json
+import os
+
+from common.confirm_publisher import CONFIRMS_ASYNC, CONFIRMS_OFF, CONFIRMS_WAIT
+
+SUPPORTED_COLORS = frozenset(["RED", "GREEN", "BLUE"])
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', 50000))
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+
+
+def parse_batch(request):
+    """
+    A kérés törzsét színlistává alakítja.
+
+    :param request: A Flask kérés
+    :return: A nyers elemek listája (str vagy dict)
+    :raises ValueError: Ha a törzs nem értelmezhető vagy túl nagy
+    """
+    if request.mimetype in NDJSON_CONTENT_TYPES:
+        items = []
+        for line_number, line in enumerate(request.get_data().splitlines(), start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                items.append(json.loads(line))
+            except json.JSONDecodeError:
+                # Az értelmezhetetlen sor is kap egy eredményt, nem buktatja el az egész kérést
+                items.append({"_invalid_line": line_number})
+    else:
+        items = request.get_json(silent=True)
+        if not isinstance(items, list):
+            raise ValueError("Request body must be a JSON array or an NDJSON stream of colors")
+
+    if not items:
+        raise ValueError("Empty batch")
+    if len(items) > MAX_BATCH_SIZE:
+        raise ValueError(f"Batch too large: {len(items)} items (max {MAX_BATCH_SIZE})")
+    return items
+
+
+def validate_colors(items):
+    """
+    Egy menetben validálja az elemeket.
+
+    :return: (valid, results) - valid: a publikálandó (index, szín) párok;
+             results: elemenkénti eredmény, a hibás elemeknél már kitöltve, a többinél None
+    """
+    valid = []
+    results = [None] * len(items)
+    for index, item in enumerate(items):
+        if isinstance(item, dict):
+            if '_invalid_line' in item:
+                results[index] = {"index": index, "status": "error",
+                                  "error": f"Invalid JSON on line {item['_invalid_line']}"}
+                continue
+            color = item.get('color')
+        else:
+            color = item
+
+        if color is None:
+            results[index] = {"index": index, "status": "error", "error": "Missing color parameter"}
+        elif not isinstance(color, str) or color not in SUPPORTED_COLORS:
+            results[index] = {"index": index, "status": "error",
+                              "error": f"Invalid color: {color}. Only RED, GREEN, or BLUE are supported."}
+        else:
+            valid.append((index, color))
+    return valid, results
+
+
+def publish_batch(publisher, valid, results, exchange, routing_key_for, properties_for=None, wait=None,
+                  codec=None, ingress_us=None):
+    """
+    A valid elemeket egy sorozatban publikálja (a ChannelPool egyetlen kölcsönzött csatornán,
+    a ConfirmPublisher confirm módban, szükség esetén a broker visszaigazolását is megvárva).
+
+    :param routing_key_for: szín -> routing key függvény
+    :param properties_for: opcionális szín -> pika.BasicProperties függvény
+    :param codec: opcionális common.color_codec.ColorCodec; ha megadjuk, az előre kódolt törzseket és
+                  tulajdonságokat használjuk (a properties_for ezt felülírja)
+    :param wait: megvárja-e a broker visszaigazolását (None = a publisher alapbeállítása)
+    :param ingress_us: a kérés beérkezésének ideje (common.tracing); codec esetén az üzenetek ezzel bélyegezve mennek
+    :return: a sikeresen elküldött elemek száma
+    """
+    if properties_for is None and codec is not None:
+        properties_for = lambda color: codec.message_properties(color, ingress_us)
+    body_for = codec.body if codec is not None else (lambda color: color)
+    messages = [
+        (exchange, routing_key_for(color), body_for(color), properties_for(color) if properties_for else None)
+        for _, color in valid
+    ]
+    errors = publisher.publish_many(messages, wait=wait)
+
+    sent = 0
+    for (index, color), error in zip(valid, errors):
+        if error is None:
+            results[index] = {"index": index, "status": "ok", "color": color}
+            sent += 1
+        else:
+            results[index] = {"index": index, "status": "error", "color": color,
+                              "error": f"Error sending color to queue: {error}"}
+    return sent
+
+
+def summarize(results):
+    """
+    A válasz törzse: összesítés és elemenkénti eredmények.
+    """
+    accepted = sum(1 for result in results if result["status"] == "ok")
+    return {
+        "accepted": accepted,
+        "rejected": len(results) - accepted,
+        "results": results
+    }
+
+
+def batch_status_code(total, valid, sent):
+    """
+    200: minden elem elment, 207: részleges siker, 500: a publikálás hibázott, 400: egyik elem sem valid.
+    """
+    if sent == total:
+        return 200
+    if sent > 0:
+        return 207
+    if valid > 0:
+        return 500
+    return 400
+
+
+def confirm_option(request, confirms):
+    """
+    A kérésenkénti ?confirm=wait|async paraméter; ha nincs megadva, a publisher alapbeállítása érvényes.
+
+    :param confirms: a szolgáltatás PUBLISHER_CONFIRMS beállítása
+    :raises ValueError: confirm=wait esetén, ha a visszaigazolás ki van kapcsolva (nincs mire várni,
+                        a sikeres válasz hamisan azt állítaná, hogy a broker átvette az üzenetet)
+    """
+    confirm = request.args.get('confirm')
+    if confirm == CONFIRMS_WAIT:
+        if confirms == CONFIRMS_OFF:
+            raise ValueError("confirm=wait requires PUBLISHER_CONFIRMS=async or wait on this service")
+        return True
+    if confirm == CONFIRMS_ASYNC:
+        return False
+    return None
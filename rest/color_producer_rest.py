@@ -1,15 +1,47 @@
+import os
+import sys
 import random
 import time
+import asyncio
 import logging
 import requests
+import aiohttp
 import json
 
+# A közös modulok (common/) a projekt gyökeréből érhetők el
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.log_config import configure_logging
+
 # Beállítjuk a naplózást
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+configure_logging()
 logger = logging.getLogger("color_producer")
 
 # REST API szolgáltatás elérhetősége
-REST_API_URL = 'http://localhost:5000/api/colors'  # Docker környezetben ez 'http://rest_service:5000/api/colors' lesz
+# Docker környezetben ez 'http://rest_service:5000/api/colors' lesz
+REST_API_URL = os.environ.get('REST_API_URL', 'http://localhost:5000/api/colors')
+REST_BATCH_URL = os.environ.get('REST_BATCH_URL', REST_API_URL + '/batch')
+
+COLORS = ["RED", "GREEN", "BLUE"]
+
+PRODUCER_MODE_SYNC = 'sync'    # egyszerre egy kérés, küldések között PRODUCER_INTERVAL szünet
+PRODUCER_MODE_ASYNC = 'async'  # keep-alive kapcsolatok, több párhuzamos kérés, célráta szerinti ütemezés
+
+PRODUCER_MODE = os.environ.get('PRODUCER_MODE', PRODUCER_MODE_SYNC)
+# Szinkron módban a küldések közti szünet (másodperc)
+PRODUCER_INTERVAL = float(os.environ.get('PRODUCER_INTERVAL', 0.1))
+# Aszinkron módban egyszerre ennyi kérés lehet úton (ennyi keep-alive kapcsolat)
+PRODUCER_CONCURRENCY = int(os.environ.get('PRODUCER_CONCURRENCY', 16))
+# Célráta szín/s-ban (0 = amilyen gyorsan a párhuzamos kérések engedik)
+PRODUCER_RATE = float(os.environ.get('PRODUCER_RATE', 0))
+# >0 esetén kérésenként ennyi szín megy a tömeges végpontra (/api/colors/batch)
+PRODUCER_BATCH_SIZE = int(os.environ.get('PRODUCER_BATCH_SIZE', 0))
+# Kérésenkénti időkorlát (másodperc)
+PRODUCER_TIMEOUT = float(os.environ.get('PRODUCER_TIMEOUT', 10))
+# Az aszinkron mód ennyi másodpercenként naplózza az összesítést
+REPORT_INTERVAL = float(os.environ.get('REPORT_INTERVAL', 5))
+# Ha az ütemező ennyi másodpercnél többet késik, nem próbálja behozni a lemaradást (nem zúdít ránk löketet)
+MAX_SCHEDULE_LAG = 1.0
+RETRY_DELAY = 5
 
 
 def generate_random_color():
@@ -17,15 +49,16 @@ def generate_random_color():
     Véletlenszerűen választ egy színt a RED, GREEN és BLUE közül.
     :return: A véletlenszerűen választott szín
     """
-    colors = ["RED", "GREEN", "BLUE"]
-    return random.choice(colors)
+    return random.choice(COLORS)
 
 
 def run_color_producer():
     """
-    Színeket küld a REST API-nak másodpercenként.
+    Színeket küld a REST API-nak PRODUCER_INTERVAL másodpercenként, egy keep-alive kapcsolaton.
     """
     logger.info("Color Producer started. Sending random colors to REST API service...")
+    # A Session újrahasználja a TCP kapcsolatot, nem nyit minden színhez újat
+    session = requests.Session()
 
     while True:
         try:
@@ -36,7 +69,7 @@ def run_color_producer():
             payload = {"color": color}
             headers = {"Content-Type": "application/json"}
 
-            response = requests.post(
+            response = session.post(
                 REST_API_URL,
                 data=json.dumps(payload),
                 headers=headers
@@ -44,21 +77,163 @@ def run_color_producer():
 
             if response.status_code == 200:
                 response_data = response.json()
-                logger.info(f"Sent color: {color}, Response: {response_data.get('message', 'No message')}")
+                logger.info("Sent color: %s, Response: %s", color, response_data.get('message', 'No message'))
             else:
                 logger.error(f"Error response: {response.status_code} - {response.text}")
 
-            # Várunk 1 másodpercet a következő küldésig
-            time.sleep(.1)
+            # Várunk a következő küldésig
+            time.sleep(PRODUCER_INTERVAL)
 
         except Exception as e:
             logger.error(f"Error sending color: {e}")
-            logger.info("Retrying in 5 seconds...")
-            time.sleep(5)
+            logger.info(f"Retrying in {RETRY_DELAY} seconds...")
+            time.sleep(RETRY_DELAY)
+
+
+class ProducerStats:
+    """
+    Az aszinkron mód számlálói (egy event loopon futunk, nem kell zár).
+    """
+
+    def __init__(self):
+        self.sent = 0         # a szolgáltatás által elfogadott színek
+        self.rejected = 0     # a szolgáltatás által elutasított színek
+        self.errors = 0       # sikertelen kérések (hálózati hiba, időtúllépés, 5xx)
+        self.requests = 0
+        self.in_flight = 0
+        self.lagging = 0      # hányszor nem tudta tartani az ütemező a célrátát
+        self.started = time.monotonic()
+
+    def report(self):
+        elapsed = time.monotonic() - self.started
+        logger.info(f"Sent {self.sent} colors in {elapsed:.2f} seconds ({self.sent / elapsed:.2f} colors/sec), "
+                    f"{self.requests} requests, {self.rejected} rejected, {self.errors} errors, "
+                    f"{self.in_flight} in flight, schedule lagged {self.lagging} times")
+
+
+async def post_color(session, stats):
+    """
+    Egy szín a /api/colors végpontra.
+    """
+    color = generate_random_color()
+    async with session.post(REST_API_URL, json={"color": color}) as response:
+        response_data = await response.json(content_type=None)
+    if response.status == 200:
+        stats.sent += 1
+        logger.debug("Sent color: %s, Response: %s", color, response_data.get('message', 'No message'))
+    elif response.status < 500:
+        stats.rejected += 1
+        logger.error(f"Error response: {response.status} - {response_data}")
+    else:
+        stats.errors += 1
+        logger.error(f"Error response: {response.status} - {response_data}")
+
+
+async def post_batch(session, stats, size):
+    """
+    size darab szín egy kérésben a /api/colors/batch végpontra (200: mind elment, 207: részben).
+    """
+    colors = random.choices(COLORS, k=size)
+    async with session.post(REST_BATCH_URL, json=colors) as response:
+        response_data = await response.json(content_type=None)
+    if response.status in (200, 207):
+        stats.sent += response_data.get("accepted", 0)
+        stats.rejected += response_data.get("rejected", 0)
+        logger.debug("Sent batch of %s colors, accepted: %s", size, response_data.get("accepted"))
+    else:
+        stats.errors += 1
+        logger.error(f"Error response: {response.status} - {response_data.get('error', response_data)}")
+
+
+async def send_worker(session, jobs, stats):
+    """
+    A jobs sorból vett kéréseket küldi, egyszerre egyet; PRODUCER_CONCURRENCY ilyen fut párhuzamosan.
+    """
+    while True:
+        await jobs.get()
+        stats.in_flight += 1
+        stats.requests += 1
+        try:
+            if PRODUCER_BATCH_SIZE > 0:
+                await post_batch(session, stats, PRODUCER_BATCH_SIZE)
+            else:
+                await post_color(session, stats)
+        except Exception as e:
+            stats.errors += 1
+            logger.error(f"Error sending color: {e}")
+            logger.info(f"Retrying in {RETRY_DELAY} seconds...")
+            await asyncio.sleep(RETRY_DELAY)
+        finally:
+            stats.in_flight -= 1
+
+
+async def schedule_requests(jobs, stats):
+    """
+    A célráta ütemezője: PRODUCER_RATE szín/s-nak megfelelő ütemben tesz kéréseket a sorba
+    (batch módban kérésenként PRODUCER_BATCH_SIZE színnel számolva).
+    A sor korlátos, így ha a szolgáltatás nem bírja a rátát, az ütemező is lelassul.
+    """
+    if PRODUCER_RATE <= 0:
+        while True:
+            await jobs.put(None)
+
+    interval = max(PRODUCER_BATCH_SIZE, 1) / PRODUCER_RATE
+    next_at = time.monotonic()
+    while True:
+        delay = next_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        elif -delay > MAX_SCHEDULE_LAG:
+            # Tartósan le vagyunk maradva: újraindítjuk az ütemezést a mostani időponttól
+            stats.lagging += 1
+            logger.warning(f"Producer is {-delay:.2f}s behind the target rate of {PRODUCER_RATE} colors/sec")
+            next_at = time.monotonic()
+        await jobs.put(None)
+        next_at += interval
+
+
+async def report_periodically(stats):
+    while True:
+        await asyncio.sleep(REPORT_INTERVAL)
+        stats.report()
+
+
+async def run_async_color_producer():
+    """
+    Aszinkron mód: PRODUCER_CONCURRENCY párhuzamos kérés keep-alive kapcsolatokon (aiohttp),
+    opcionális célrátával és tömeges végponttal.
+    """
+    logger.info(f"Async Color Producer started: {PRODUCER_CONCURRENCY} concurrent requests, "
+                f"target rate: {PRODUCER_RATE or 'unlimited'} colors/sec, "
+                f"batch size: {PRODUCER_BATCH_SIZE or 'single'}")
+    stats = ProducerStats()
+    # A connector legfeljebb annyi kapcsolatot tart nyitva, ahány kérés egyszerre úton lehet
+    connector = aiohttp.TCPConnector(limit=PRODUCER_CONCURRENCY, keepalive_timeout=30)
+    timeout = aiohttp.ClientTimeout(total=PRODUCER_TIMEOUT)
+    jobs = asyncio.Queue(maxsize=PRODUCER_CONCURRENCY)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        tasks = [asyncio.create_task(send_worker(session, jobs, stats)) for _ in range(PRODUCER_CONCURRENCY)]
+        tasks.append(asyncio.create_task(report_periodically(stats)))
+        try:
+            await schedule_requests(jobs, stats)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            stats.report()
 
 
 if __name__ == "__main__":
     # Várunk néhány másodpercet, hogy a REST API szolgáltatás elinduljon
     logger.info("Waiting for REST API service to start...")
     time.sleep(5)
-    run_color_producer()
+    if PRODUCER_MODE not in (PRODUCER_MODE_SYNC, PRODUCER_MODE_ASYNC):
+        raise ValueError(f"Invalid PRODUCER_MODE value: {PRODUCER_MODE} (expected sync or async)")
+    if PRODUCER_MODE == PRODUCER_MODE_ASYNC:
+        try:
+            asyncio.run(run_async_color_producer())
+        except KeyboardInterrupt:
+            logger.info("Color Producer stopped by user")
+    else:
+        run_color_producer()
@@ -1,9 +1,20 @@
+import os
+import sys
 import logging
 from flask import Flask, request, jsonify
-import pika
+
+# A közös modulok (common/) a projekt gyökeréből érhetők el
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.publisher_pool import connection_parameters
+from common.confirm_publisher import create_publisher
+from common.color_codec import ColorCodec
+from common.tracing import now_us
+from common.log_config import configure_logging
+from common.metrics import serve_metrics
+from batch_ingest import parse_batch, validate_colors, publish_batch, summarize, batch_status_code, confirm_option
 
 # Beállítjuk a naplózást
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+configure_logging()
 logger = logging.getLogger("rest_service")
 
 # RabbitMQ kapcsolati adatok
@@ -12,23 +23,55 @@ RABBITMQ_PORT = 5672
 RABBITMQ_USER = 'guest'
 RABBITMQ_PASSWORD = 'guest'
 COLOR_QUEUE = 'colorQueue'
+PUBLISHER_CONNECTIONS = int(os.environ.get('PUBLISHER_CONNECTIONS', 4))
+# Broker-visszaigazolás: off | async | wait (kérésenként felülírható: ?confirm=wait vagy ?confirm=async)
+PUBLISHER_CONFIRMS = os.environ.get('PUBLISHER_CONFIRMS', 'off')
+MAX_IN_FLIGHT = int(os.environ.get('MAX_IN_FLIGHT', 1000))
+CONFIRM_TIMEOUT = float(os.environ.get('CONFIRM_TIMEOUT', 30))
+# Üzenetformátum: text (a régi "RED" törzs, alapértelmezés) vagy binary (1 bájtos színkód, ha már minden
+# fogyasztó a common.color_codec dekódolóját használja)
+COLOR_CODEC = os.environ.get('COLOR_CODEC', 'text')
+# Előre kódolt törzsek és üzenettulajdonságok (content_type alapján a fogyasztó mindkét formát érti)
+codec = ColorCodec(COLOR_CODEC, color_header=False)
 
 app = Flask(__name__)
 
 
+def declare_color_queue(channel):
+    """
+    Üzenetsor létrehozása, ha még nem létezik. Az első kapcsolódáskor (és újrakapcsolódáskor) fut le,
+    nem minden kérésnél.
+    """
+    channel.queue_declare(queue=COLOR_QUEUE)
+
+
+# Hosszú életű, a Flask worker szálak között megosztott publisher (pool vagy confirm módú publisher).
+# A kapcsolatokat lustán, az első kéréskor nyitja meg.
+publisher = create_publisher(
+    connection_parameters(RABBITMQ_HOST, RABBITMQ_PORT, RABBITMQ_USER, RABBITMQ_PASSWORD),
+    confirms=PUBLISHER_CONFIRMS,
+    topology=declare_color_queue,
+    max_in_flight=MAX_IN_FLIGHT,
+    confirm_timeout=CONFIRM_TIMEOUT,
+    connections=PUBLISHER_CONNECTIONS
+)
+
+
 @app.route('/api/colors', methods=['POST'])
 def send_color_to_queue():
     """
     Színeket fogad REST API-n keresztül és továbbítja őket az üzenetsorba.
     A kérés formátuma: {"color": "RED"} (vagy GREEN, BLUE)
+    Confirm módban a ?confirm=wait paraméterrel a válasz megvárja a broker visszaigazolását.
     """
+    ingress_us = now_us()  # a végpontok közötti késleltetés kezdete (common.tracing)
     content = request.json
 
     if not content or 'color' not in content:
         return jsonify({"error": "Missing color parameter"}), 400
 
     color = content['color']
-    logger.info(f"Received color: {color}")
+    logger.info("Received color: %s", color)
 
     # Ellenőrizzük, hogy a szín megfelelő-e
     if color not in ["RED", "GREEN", "BLUE"]:
@@ -37,33 +80,30 @@ def send_color_to_queue():
         }), 400
 
     try:
-        # Kapcsolódás a RabbitMQ-hoz
-        connection = pika.BlockingConnection(
-            pika.ConnectionParameters(
-                host=RABBITMQ_HOST,
-                port=RABBITMQ_PORT,
-                credentials=pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASSWORD)
-            )
-        )
-        channel = connection.channel()
-
-        # Üzenetsor létrehozása, ha még nem létezik
-        channel.queue_declare(queue=COLOR_QUEUE)
+        wait = confirm_option(request, PUBLISHER_CONFIRMS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-        # Üzenet küldése az üzenetsorba
-        channel.basic_publish(
+    try:
+        # Üzenet küldése a nyitva tartott kapcsolaton
+        publisher.publish(
             exchange='',
             routing_key=COLOR_QUEUE,
-            body=color
+            body=codec.body(color),
+            properties=codec.message_properties(color, ingress_us),
+            wait=wait
         )
 
-        # Kapcsolat lezárása
-        connection.close()
-
         return jsonify({
             "message": f"Color {color} successfully sent to the message queue"
         }), 200
 
+    except TimeoutError as e:
+        logger.error(f"Timeout sending color to queue: {e}")
+        return jsonify({
+            "error": f"Timeout sending color to queue: {str(e)}"
+        }), 504
+
     except Exception as e:
         logger.error(f"Error sending color to queue: {e}")
         return jsonify({
@@ -71,6 +111,27 @@ def send_color_to_queue():
         }), 500
 
 
+@app.route('/api/colors/batch', methods=['POST'])
+def send_colors_to_queue():
+    """
+    Tömeges színfogadás: JSON tömb vagy NDJSON folyam, elemenkénti eredménnyel.
+    A kérés formátuma: ["RED", "GREEN"] vagy [{"color": "RED"}, ...], illetve soronként egy elem NDJSON-ban.
+    """
+    ingress_us = now_us()
+    try:
+        items = parse_batch(request)
+        wait = confirm_option(request, PUBLISHER_CONFIRMS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    valid, results = validate_colors(items)
+    logger.info("Received batch of %s colors (%s valid)", len(items), len(valid))
+
+    sent = publish_batch(publisher, valid, results, exchange='', routing_key_for=lambda color: COLOR_QUEUE,
+                         wait=wait, codec=codec, ingress_us=ingress_us)
+    return jsonify(summarize(results)), batch_status_code(len(results), len(valid), sent)
+
+
 # GET metódus a szolgáltatás elérhetőségének ellenőrzésére
 @app.route('/api/colors', methods=['GET'])
 def get_colors():
@@ -81,5 +142,10 @@ def get_colors():
 
 
 if __name__ == "__main__":
+    # Prometheus metrikák: http://127.0.0.1:9101/metrics (METRICS_PORT=0 kikapcsolja)
+    serve_metrics(9101)
     logger.info("REST API Service started at http://localhost:5000")
-    app.run(host='0.0.0.0', port=5000)
+    try:
+        app.run(host='0.0.0.0', port=5000, threaded=True)
+    finally:
+        publisher.close()
@@ -1,9 +1,20 @@
+import os
+import sys
 import logging
 from flask import Flask, request, jsonify
-import pika
+
+# A közös modulok (common/) a projekt gyökeréből érhetők el
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.publisher_pool import connection_parameters
+from common.confirm_publisher import create_publisher
+from common.color_codec import ColorCodec
+from common.tracing import now_us
+from common.log_config import configure_logging
+from common.metrics import serve_metrics
+from batch_ingest import parse_batch, validate_colors, publish_batch, summarize, batch_status_code, confirm_option
 
 # Beállítjuk a naplózást
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+configure_logging()
 logger = logging.getLogger("rest_service")
 
 # RabbitMQ kapcsolati adatok
@@ -12,29 +23,48 @@ RABBITMQ_PORT = 5672
 RABBITMQ_USER = 'guest'
 RABBITMQ_PASSWORD = 'guest'
 # COLOR_QUEUE = 'colorQueue'
+COLOR_EXCHANGE = 'color_exchange'
+PUBLISHER_CONNECTIONS = int(os.environ.get('PUBLISHER_CONNECTIONS', 4))
+# Broker-visszaigazolás: off | async | wait (kérésenként felülírható: ?confirm=wait vagy ?confirm=async)
+PUBLISHER_CONFIRMS = os.environ.get('PUBLISHER_CONFIRMS', 'off')
+MAX_IN_FLIGHT = int(os.environ.get('MAX_IN_FLIGHT', 1000))
+CONFIRM_TIMEOUT = float(os.environ.get('CONFIRM_TIMEOUT', 30))
+# Üzenetformátum: text (a régi "RED" törzs, alapértelmezés) vagy binary (1 bájtos színkód, ha már minden
+# fogyasztó a common.color_codec dekódolóját használja)
+COLOR_CODEC = os.environ.get('COLOR_CODEC', 'text')
+# Előre kódolt törzsek és üzenettulajdonságok (content_type alapján a fogyasztó mindkét formát érti)
+codec = ColorCodec(COLOR_CODEC, color_header=False)
 
 app = Flask(__name__)
 
 
-def setup_queues():
-    connection = pika.BlockingConnection(
-        pika.ConnectionParameters(
-            host=RABBITMQ_HOST,
-            port=RABBITMQ_PORT,
-            credentials=pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASSWORD)
-        )
-    )
-    channel = connection.channel()
-    channel.exchange_declare(exchange='color_exchange', exchange_type='direct')
+def setup_queues(channel):
+    """
+    Az exchange és a színenkénti sorok létrehozása induláskor (újrakapcsolódáskor a pool újra lefuttatja).
+    """
+    channel.exchange_declare(exchange=COLOR_EXCHANGE, exchange_type='direct')
 
     colors = ['red', 'green', 'blue']
     for color in colors:
         queue_name = f'queue_{color}'
         routing_key = f'color.{color}'
         channel.queue_declare(queue=queue_name)
-        channel.queue_bind(exchange='color_exchange', queue=queue_name, routing_key=routing_key)
+        channel.queue_bind(exchange=COLOR_EXCHANGE, queue=queue_name, routing_key=routing_key)
+
+
+def color_routing_key(color):
+    return f"color.{color.lower()}"  # pl. color.red
 
-    connection.close()
+
+# Hosszú életű, a Flask worker szálak között megosztott publisher (pool vagy confirm módú publisher)
+publisher = create_publisher(
+    connection_parameters(RABBITMQ_HOST, RABBITMQ_PORT, RABBITMQ_USER, RABBITMQ_PASSWORD),
+    confirms=PUBLISHER_CONFIRMS,
+    topology=setup_queues,
+    max_in_flight=MAX_IN_FLIGHT,
+    confirm_timeout=CONFIRM_TIMEOUT,
+    connections=PUBLISHER_CONNECTIONS
+)
 
 @app.route('/api/colors', methods=['POST'])
 
@@ -44,13 +74,14 @@ def send_color():
     Színeket fogad REST API-n keresztül és továbbítja őket az üzenetsorba.
     A kérés formátuma: {"color": "RED"} (vagy GREEN, BLUE)
     """
+    ingress_us = now_us()  # a végpontok közötti késleltetés kezdete (common.tracing)
     content = request.json
 
     if not content or 'color' not in content:
         return jsonify({"error": "Missing color parameter"}), 400
 
     color = content['color']
-    logger.info(f"Received color: {color}")
+    logger.info("Received color: %s", color)
 
     # Ellenőrizzük, hogy a szín megfelelő-e
     if color not in ["RED", "GREEN", "BLUE"]:
@@ -59,33 +90,30 @@ def send_color():
         }), 400
 
     try:
-        # Kapcsolódás a RabbitMQ-hoz
-        connection = pika.BlockingConnection(
-            pika.ConnectionParameters(
-                host=RABBITMQ_HOST,
-                port=RABBITMQ_PORT,
-                credentials=pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASSWORD)
-            )
-        )
-        channel = connection.channel()
-
-        # Exchange létrehozása (ha még nincs)
-        channel.exchange_declare(exchange='color_exchange', exchange_type='direct')
+        wait = confirm_option(request, PUBLISHER_CONFIRMS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-        # Üzenet küldése az exchange-be szín szerint
-        routing_key = f"color.{color.lower()}"  # pl. color.red
-        channel.basic_publish(
-            exchange='color_exchange',
-            routing_key=routing_key,
-            body=color
+    try:
+        # Üzenet küldése az exchange-be szín szerint, a nyitva tartott kapcsolaton
+        publisher.publish(
+            exchange=COLOR_EXCHANGE,
+            routing_key=color_routing_key(color),
+            body=codec.body(color),
+            properties=codec.message_properties(color, ingress_us),
+            wait=wait
         )
 
-        connection.close()
-
         return jsonify({
             "message": f"Color {color} successfully sent to the message queue"
         }), 200
 
+    except TimeoutError as e:
+        logger.error(f"Timeout sending color to queue: {e}")
+        return jsonify({
+            "error": f"Timeout sending color to queue: {str(e)}"
+        }), 504
+
     except Exception as e:
         logger.error(f"Error sending color to queue: {e}")
         return jsonify({
@@ -93,6 +121,27 @@ def send_color():
         }), 500
 
 
+@app.route('/api/colors/batch', methods=['POST'])
+def send_colors():
+    """
+    Tömeges színfogadás: JSON tömb vagy NDJSON folyam, elemenkénti eredménnyel.
+    Az elemek szín szerinti routing key-jel, egyetlen csatornán, egy sorozatban mennek az exchange-be.
+    """
+    ingress_us = now_us()
+    try:
+        items = parse_batch(request)
+        wait = confirm_option(request, PUBLISHER_CONFIRMS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    valid, results = validate_colors(items)
+    logger.info("Received batch of %s colors (%s valid)", len(items), len(valid))
+
+    sent = publish_batch(publisher, valid, results, exchange=COLOR_EXCHANGE, routing_key_for=color_routing_key,
+                         wait=wait, codec=codec, ingress_us=ingress_us)
+    return jsonify(summarize(results)), batch_status_code(len(results), len(valid), sent)
+
+
 # GET metódus a szolgáltatás elérhetőségének ellenőrzésére
 @app.route('/api/colors', methods=['GET'])
 def get_colors():
@@ -103,6 +152,12 @@ def get_colors():
 
 
 if __name__ == "__main__":
-    setup_queues()
+    # Prometheus metrikák: http://127.0.0.1:9101/metrics (METRICS_PORT=0 kikapcsolja)
+    serve_metrics(9101)
+    # RabbitMQ kapcsolatok, exchange és sorok egyszer, induláskor
+    publisher.start()
     logger.info("REST API Service started at http://localhost:5000")
-    app.run(host='0.0.0.0', port=5000)
+    try:
+        app.run(host='0.0.0.0', port=5000, threaded=True)
+    finally:
+        publisher.close()
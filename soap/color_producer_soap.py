@@ -2,10 +2,18 @@ import random
 import time
 import logging
 import os
+import sys
+import threading
+from lxml import etree
+from requests.adapters import HTTPAdapter
 from zeep import Client
 
+# A közös modulok (common/) a projekt gyökeréből érhetők el
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.log_config import configure_logging
+
 # Beállítjuk a naplózást
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+configure_logging()
 logger = logging.getLogger("color_producer")
 
 # SOAP szolgáltatás elérhetősége környezeti változókkal
@@ -13,6 +21,29 @@ SOAP_HOST = os.environ.get('SOAP_SERVICE_HOST', 'localhost')
 SOAP_PORT = os.environ.get('SOAP_SERVICE_PORT', '8000')
 SOAP_WSDL_URL = f'http://{SOAP_HOST}:{SOAP_PORT}/?wsdl'
 
+COLORS = ["RED", "GREEN", "BLUE"]
+OPERATION = 'send_color_to_queue'
+
+PRODUCER_MODE_ZEEP = 'zeep'  # minden hívás a zeep proxyn át (teljes szerializálás és válaszfeldolgozás)
+PRODUCER_MODE_FAST = 'fast'  # előre elkészített borítékok, több szál egy poolozott HTTP sessionön
+
+PRODUCER_MODE = os.environ.get('PRODUCER_MODE', PRODUCER_MODE_ZEEP)
+# zeep módban a küldések közti szünet (másodperc)
+PRODUCER_INTERVAL = float(os.environ.get('PRODUCER_INTERVAL', 0.5))
+# fast módban ennyi szál küld párhuzamosan (és ennyi keep-alive kapcsolat van a poolban)
+PRODUCER_CONCURRENCY = int(os.environ.get('PRODUCER_CONCURRENCY', 8))
+# fast módban a célráta szín/s-ban (0 = amilyen gyorsan a szálak engedik)
+PRODUCER_RATE = float(os.environ.get('PRODUCER_RATE', 0))
+# Kérésenkénti időkorlát (másodperc)
+PRODUCER_TIMEOUT = float(os.environ.get('PRODUCER_TIMEOUT', 10))
+# fast módban ennyi másodpercenként naplózzuk az összesítést
+REPORT_INTERVAL = float(os.environ.get('REPORT_INTERVAL', 5))
+# Ha az ütemező ennyi másodpercnél többet késik, nem próbálja behozni a lemaradást
+MAX_SCHEDULE_LAG = 1.0
+RETRY_DELAY = 5
+
+# A sikeres válasz ("Color RED successfully sent to the message queue") olcsó felismerése
+SUCCESS_MARKER = b"successfully sent"
 
 
 def generate_random_color():
@@ -21,8 +52,7 @@ def generate_random_color():
 
     :return: A véletlenszerűen választott szín
     """
-    colors = ["RED", "GREEN", "BLUE"]
-    return random.choice(colors)
+    return random.choice(COLORS)
 
 
 def run_color_producer():
@@ -42,19 +72,171 @@ def run_color_producer():
             # Szín küldése a SOAP szolgáltatásnak
             response = client.service.send_color_to_queue(color)
 
-            logger.info(f"Sent color: {color}, Response: {response}")
+            logger.info("Sent color: %s, Response: %s", color, response)
 
             # Várunk valamennyi másodpercet a következő küldésig
-            time.sleep(.5)
+            time.sleep(PRODUCER_INTERVAL)
+
+        except Exception as e:
+            logger.error(f"Error sending color: {e}")
+            logger.info(f"Retrying in {RETRY_DELAY} seconds...")
+            time.sleep(RETRY_DELAY)
+
+
+class EnvelopeSender:
+    """
+    A fast mód kliense: a WSDL-t egyszer töltjük le, a három szín SOAP borítékát a zeep egyszer
+    elkészíti, utána csak a kész bájtokat küldjük a zeep saját (poolozott) requests sessionjén.
+
+    A válaszból csak a sikeres szöveget keressük; ha az nincs benne (hibaüzenet, SOAP Fault,
+    nem 200-as státusz), a zeep teljes válaszfeldolgozásával értelmezzük.
+    """
+
+    def __init__(self, client, pool_size):
+        self.client = client
+        # A WSDL első szolgáltatásának első portja (a zeep publikus wsdl API-ján, mint a client.service)
+        service = next(iter(client.wsdl.services.values()))
+        port = next(iter(service.ports.values()))
+        self.proxy = client.bind(service.name, port.name)
+        self.binding = port.binding
+        self.operation = port.binding.get(OPERATION)
+        self.address = port.binding_options['address']
+        self.headers = {
+            'Content-Type': 'text/xml; charset=utf-8',
+            'SOAPAction': f'"{self.operation.soapaction or ""}"'
+        }
+        self.envelopes = {
+            color: etree.tostring(client.create_message(self.proxy, OPERATION, color),
+                                  xml_declaration=True, encoding='utf-8')
+            for color in COLORS
+        }
+        # Annyi keep-alive kapcsolat maradhat nyitva, ahány szál egyszerre küld
+        self.session = client.transport.session
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def send(self, color):
+        """
+        :return: (sikeres-e, a szolgáltatás válasza)
+        """
+        response = self.session.post(self.address, data=self.envelopes[color], headers=self.headers,
+                                     timeout=PRODUCER_TIMEOUT)
+        if response.status_code == 200 and SUCCESS_MARKER in response.content:
+            return True, None
+        # Lassú út: a zeep értelmezi a választ (SOAP Fault esetén kivételt dob)
+        result = self.binding.process_reply(self.client, self.operation, response)
+        return False, result
+
+
+class ProducerStats:
+    """
+    A fast mód számlálói, a szálak közösen használják.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0   # a szolgáltatás hibát válaszolt (érvénytelen szín, sikertelen publikálás, SOAP Fault)
+        self.errors = 0   # a kérés maga hiúsult meg (hálózat, időtúllépés)
+        self.started = time.monotonic()
 
+    def add(self, sent=0, failed=0, errors=0):
+        with self.lock:
+            self.sent += sent
+            self.failed += failed
+            self.errors += errors
+
+    def report(self):
+        elapsed = time.monotonic() - self.started
+        logger.info(f"Sent {self.sent} colors in {elapsed:.2f} seconds ({self.sent / elapsed:.2f} colors/sec), "
+                    f"{self.failed} failed, {self.errors} errors")
+
+
+class RateSchedule:
+    """
+    A szálak közös ütemezője: PRODUCER_RATE szín/s-nál nem küldenek gyorsabban (0 = nincs korlát).
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0
+        self.next_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            if now - self.next_at > MAX_SCHEDULE_LAG:
+                # Tartósan le vagyunk maradva: nem zúdítjuk rá a lemaradást a szolgáltatásra
+                self.next_at = now
+            at = self.next_at
+            self.next_at += self.interval
+        delay = at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def send_worker(sender, schedule, stats):
+    while True:
+        schedule.wait()
+        color = generate_random_color()
+        try:
+            ok, result = sender.send(color)
+            if ok:
+                stats.add(sent=1)
+                logger.debug("Sent color: %s", color)
+            else:
+                stats.add(failed=1)
+                logger.error("Color %s was not accepted: %s", color, result)
         except Exception as e:
+            stats.add(errors=1)
             logger.error(f"Error sending color: {e}")
-            logger.info("Retrying in 5 seconds...")
-            time.sleep(5)
+            logger.info(f"Retrying in {RETRY_DELAY} seconds...")
+            time.sleep(RETRY_DELAY)
+
+
+def run_fast_color_producer():
+    """
+    Nagy áteresztésű mód: előre elkészített borítékok, PRODUCER_CONCURRENCY szál, közös keep-alive pool.
+    """
+    logger.info(f"Connecting to SOAP service at {SOAP_WSDL_URL}")
+    while True:
+        try:
+            client = Client(SOAP_WSDL_URL)
+            sender = EnvelopeSender(client, PRODUCER_CONCURRENCY)
+            break
+        except Exception as e:
+            logger.error(f"Error loading WSDL: {e}")
+            logger.info(f"Retrying in {RETRY_DELAY} seconds...")
+            time.sleep(RETRY_DELAY)
+
+    logger.info(f"Fast Color Producer started: {PRODUCER_CONCURRENCY} threads, "
+                f"target rate: {PRODUCER_RATE or 'unlimited'} colors/sec, endpoint: {sender.address}")
+    stats = ProducerStats()
+    schedule = RateSchedule(PRODUCER_RATE)
+    for index in range(PRODUCER_CONCURRENCY):
+        thread = threading.Thread(target=send_worker, args=(sender, schedule, stats),
+                                  name=f"soap-producer-{index}", daemon=True)
+        thread.start()
+
+    try:
+        while True:
+            time.sleep(REPORT_INTERVAL)
+            stats.report()
+    except KeyboardInterrupt:
+        logger.info("Color Producer stopped by user")
+        stats.report()
 
 
 if __name__ == "__main__":
     # Várunk néhány másodpercet, hogy a SOAP szolgáltatás elinduljon
     logger.info("Waiting for SOAP service to start...")
     time.sleep(5)
-    run_color_producer()
\ No newline at end of file
+    if PRODUCER_MODE == PRODUCER_MODE_FAST:
+        run_fast_color_producer()
+    elif PRODUCER_MODE == PRODUCER_MODE_ZEEP:
+        run_color_producer()
+    else:
+        raise ValueError(f"Invalid PRODUCER_MODE value: {PRODUCER_MODE} (expected zeep or fast)")
@@ -1,8 +1,11 @@
 import os
 import logging
-from wsgiref.simple_server import make_server  # WSGI szerver
 
-import pika  # RabbitMQ kliens
+from soap_publisher import create_publisher, make_threaded_server, COLOR_CODEC  # közös publisher pool és többszálú WSGI szerver
+from common.color_codec import ColorCodec
+from common.log_config import configure_logging
+from common.metrics import serve_metrics
+from common.tracing import now_us
 
 from spyne import Application, ServiceBase, rpc, Unicode
 """
@@ -26,7 +29,7 @@ Hidat képez a SOAP alkalmazás és a HTTP webszerver között.
 """
 
 # Beállítjuk a naplózást
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+configure_logging()
 logger = logging.getLogger("soap_service")
 logging.getLogger("pika").setLevel(logging.WARNING)
 
@@ -48,26 +51,19 @@ STATISTICS_QUEUE = 'colorStatistics'
 DLX_NAME = 'dlx'  # Dead-letter exchange neve
 DLQ_NAME = COLOR_QUEUE + '.dlq'  # Dead-letter queue neve
 
-# Globális RabbitMQ kapcsolat és csatorna
-connection = None
-channel = None
+# A szolgáltatás közös publisher poolja. Korábban egyetlen globális csatornát használtunk,
+# ami több szálon futó szerver mellett nem szálbiztos; most kérésenként kölcsönzünk csatornát.
+publisher = None
 
+# Előre kódolt törzsek és üzenettulajdonságok (a COLOR fejléc csak a régi, text formátumnál kerül rá)
+codec = ColorCodec(COLOR_CODEC)
 
-def setup_rabbitmq():
+
+def setup_rabbitmq(channel):
     """
-    RabbitMQ kapcsolat és csatorna egyszeri inicializálása.
-    Itt hozzuk létre az exchange-eket és a queue-kat.
+    Az exchange-ek és a queue-k egyszeri létrehozása induláskor
+    (újrakapcsolódáskor a pool újra lefuttatja).
     """
-    global connection, channel
-    connection = pika.BlockingConnection(
-        pika.ConnectionParameters(
-            host=RABBITMQ_HOST,
-            port=RABBITMQ_PORT,
-            credentials=pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASSWORD)
-        )
-    )
-    channel = connection.channel()
-
     # Dead-letter exchange létrehozása (ha még nem létezik)
     channel.exchange_declare(exchange=DLX_NAME, exchange_type='fanout')
 
@@ -97,21 +93,20 @@ class ColorService(ServiceBase):
         :param color: A szín neve (RED, GREEN vagy BLUE).
         :return: Visszaigazolás az üzenet fogadásáról.
         """
-        logger.info(f"Received color: {color}")
+        ingress_us = now_us()
+        logger.info("Received color: %s", color)
 
         # Ellenőrizzük, hogy a szín megfelelő-e
         if color not in ["RED", "GREEN", "BLUE"]:
             return f"Invalid color: {color}. Only RED, GREEN, or BLUE are supported."
 
         try:
-            # A globális channel használata újranyitás helyett
-            channel.basic_publish(
+            # A poolból kölcsönzött csatorna használata újranyitás helyett
+            publisher.publish(
                 exchange='',  # Default exchange
                 routing_key=COLOR_QUEUE,  # A sor neve
-                body=color,
-                properties=pika.BasicProperties(
-                    headers={'COLOR': color}
-                )
+                body=codec.body(color),
+                properties=codec.message_properties(color, ingress_us)
             )
             return f"Color {color} successfully sent to the message queue"
         except Exception as e:
@@ -124,8 +119,11 @@ def run_soap_server():
     """
     Elindítja a SOAP webszolgáltatást.
     """
+    global publisher
+    # Prometheus metrikák: http://127.0.0.1:9102/metrics (METRICS_PORT=0 kikapcsolja)
+    serve_metrics(9102)
     # RabbitMQ setup egyszer, induláskor
-    setup_rabbitmq()
+    publisher = create_publisher(setup_rabbitmq)
 
     # SOAP alkalmazás konfigurálása
     application = Application(
@@ -138,12 +136,15 @@ def run_soap_server():
     # WSGI alkalmazás létrehozása
     wsgi_application = WsgiApplication(application)
 
-    # WSGI szerver elindítása
-    server = make_server('0.0.0.0', 8000, wsgi_application)
+    # WSGI szerver elindítása (kérésenként külön szálon)
+    server = make_threaded_server('0.0.0.0', 8000, wsgi_application)
     logger.info("SOAP Service started at http://localhost:8000")
     logger.info("WSDL available at http://localhost:8000/?wsdl")
 
-    server.serve_forever()
+    try:
+        server.serve_forever()
+    finally:
+        publisher.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,60 @@
+"""
+A SOAP szolgáltatások (soap_service.py, soap_service_multiqueue.py, dlq_ss.py) közös publisher komponense.
+
+A kérések egy korlátos csatorna-poolból kölcsönöznek csatornát, a kapcsolatok nyitva maradnak,
+az exchange-eket és queue-kat pedig induláskor egyszer deklaráljuk.
+"""
+import os
+import sys
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIServer, make_server
+
+# A közös modulok (common/) a projekt gyökeréből érhetők el
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.publisher_pool import connection_parameters
+from common.confirm_publisher import create_publisher as create_ingress_publisher
+
+# RabbitMQ kapcsolati adatok környezeti változókból
+RABBITMQ_HOST = os.environ.get('RABBITMQ_HOST', 'localhost')
+RABBITMQ_PORT = int(os.environ.get('RABBITMQ_PORT', 5672))
+RABBITMQ_USER = os.environ.get('RABBITMQ_USER', 'guest')
+RABBITMQ_PASSWORD = os.environ.get('RABBITMQ_PASS', 'guest')
+PUBLISHER_CONNECTIONS = int(os.environ.get('PUBLISHER_CONNECTIONS', 4))
+# Broker-visszaigazolás: off | async | wait (wait esetén a SOAP válasz megvárja a broker visszaigazolását)
+PUBLISHER_CONFIRMS = os.environ.get('PUBLISHER_CONFIRMS', 'off')
+MAX_IN_FLIGHT = int(os.environ.get('MAX_IN_FLIGHT', 1000))
+CONFIRM_TIMEOUT = float(os.environ.get('CONFIRM_TIMEOUT', 30))
+# Üzenetformátum: text (a régi "RED" törzs, alapértelmezés) vagy binary (1 bájtos színkód, ha már minden
+# fogyasztó a common.color_codec dekódolóját használja)
+COLOR_CODEC = os.environ.get('COLOR_CODEC', 'text')
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    """
+    A wsgiref alap szervere egyszerre csak egy kérést szolgál ki; ez a változat kérésenként új szálat indít,
+    így a SOAP ingress párhuzamos kéréseket is fogadhat.
+    """
+    daemon_threads = True
+
+
+def make_threaded_server(host, port, wsgi_application):
+    return make_server(host, port, wsgi_application, server_class=ThreadingWSGIServer)
+
+
+def create_publisher(topology):
+    """
+    Létrehozza és elindítja a SOAP szolgáltatások publisherét (a PUBLISHER_CONFIRMS beállítástól függően
+    ChannelPool vagy confirm módú ConfirmPublisher).
+
+    :param topology: Az exchange-eket és queue-kat deklaráló függvény (a csatornát kapja paraméterként)
+    :return: Az elindított publisher
+    """
+    publisher = create_ingress_publisher(
+        connection_parameters(RABBITMQ_HOST, RABBITMQ_PORT, RABBITMQ_USER, RABBITMQ_PASSWORD),
+        confirms=PUBLISHER_CONFIRMS,
+        topology=topology,
+        max_in_flight=MAX_IN_FLIGHT,
+        confirm_timeout=CONFIRM_TIMEOUT,
+        connections=PUBLISHER_CONNECTIONS
+    )
+    return publisher.start()
@@ -1,17 +1,22 @@
 import os
 import logging
-from wsgiref.simple_server import make_server  #WSGI szerver
 # a SOAP szolgáltatásokat mindig valamilyen HTTP szerveren keresztül kell elérhetővé tenni,
 # mivel XML üzeneteiket HTTP protokollon keresztül továbbítják.
 
-import pika # RabbitMQ kliens
+from soap_publisher import create_publisher, make_threaded_server, COLOR_CODEC  # közös publisher pool és többszálú WSGI szerver
+from common.color_routing import ROUTING_HEADERS, COLOR_HEADERS_EXCHANGE, declare_headers_routing
+from common.color_codec import ColorCodec
+from common.log_config import configure_logging
+from common.metrics import serve_metrics
+from common.tracing import now_us
 
-from spyne import Application, ServiceBase, rpc, Unicode
+from spyne import Application, ServiceBase, rpc, Unicode, Integer, Array, ComplexModel
 """ SOAP webszolgáltatások létrehozására szolgáló Python könyvtár
     Application: A Spyne alkalmazás alaposztálya, amely összefogja a szolgáltatásokat, protokollokat és a szervert
     ServiceBase: Alap osztály a webszolgáltatás definíciókhoz - a ColorService ebből származik
     rpc: Dekorátor, amely megjelöli a függvényeket, hogy azok távoli eljáráshívást (Remote Procedure Call) valósítanak meg
-    Unicode: Adattípus definíció, amely meghatározza, hogy a paraméterek és visszatérési értékek szöveges adatok"""
+    Unicode: Adattípus definíció, amely meghatározza, hogy a paraméterek és visszatérési értékek szöveges adatok
+    Integer, Array, ComplexModel: a tömeges művelet paraméteréhez és összesítő válaszához"""
 
 from spyne.protocol.soap import Soap11
 
@@ -24,7 +29,7 @@ from spyne.server.wsgi import WsgiApplication # WSGI kompatibilis alkalmazás-wr
     Hidat képez a SOAP alkalmazás és a HTTP webszerver között """
 
 # Beállítjuk a naplózást
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+configure_logging()
 logger = logging.getLogger("soap_service")
 logging.getLogger("pika").setLevel(logging.WARNING)
 
@@ -43,6 +48,58 @@ RABBITMQ_USER = os.environ.get('RABBITMQ_USER', 'guest')
 RABBITMQ_PASSWORD = os.environ.get('RABBITMQ_PASS', 'guest')
 COLOR_QUEUE = 'colorQueue'
 STATISTICS_QUEUE = 'colorStatistics'
+SUPPORTED_COLORS = frozenset(["RED", "GREEN", "BLUE"])
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', 10000))
+
+# Routing mód: queue (közös colorQueue) vagy headers (headers exchange a COLOR fejléc alapján,
+# színenkénti sorokkal - ilyenkor az MDB-knek nem kell requeue-olniuk a más színű üzeneteket)
+COLOR_ROUTING = os.environ.get('COLOR_ROUTING', 'queue')
+if COLOR_ROUTING == ROUTING_HEADERS:
+    PUBLISH_EXCHANGE = COLOR_HEADERS_EXCHANGE
+    PUBLISH_ROUTING_KEY = ''  # a headers exchange nem nézi a routing key-t
+else:
+    PUBLISH_EXCHANGE = ''  # Default exchange
+    PUBLISH_ROUTING_KEY = COLOR_QUEUE  # A sor neve
+
+# Előre kódolt törzsek és üzenettulajdonságok; a COLOR fejléc headers módban a routinghoz kell,
+# egyébként csak a régi (text) formátumnál tesszük rá
+codec = ColorCodec(COLOR_CODEC, color_header=True if COLOR_ROUTING == ROUTING_HEADERS else None)
+
+# A szolgáltatás közös publisher poolja, a run_soap_server() hozza létre induláskor
+publisher = None
+
+
+def declare_topology(channel):
+    """
+    Az üzenetsor (headers módban az exchange és a színenkénti sorok) egyszeri létrehozása induláskor
+    (újrakapcsolódáskor a pool újra lefuttatja).
+    """
+    if COLOR_ROUTING == ROUTING_HEADERS:
+        declare_headers_routing(channel)
+    else:
+        channel.queue_declare(queue=COLOR_QUEUE)
+
+
+class ColorFailure(ComplexModel):
+    """
+    Egy el nem küldött elem a tömeges kérésből.
+    """
+    __namespace__ = 'http://color.service.example'
+
+    index = Integer
+    color = Unicode
+    error = Unicode
+
+
+class BatchSummary(ComplexModel):
+    """
+    A send_colors_to_queue tömör válasza: összesítés és csak a hibás elemek listája.
+    """
+    __namespace__ = 'http://color.service.example'
+
+    accepted = Integer
+    rejected = Integer
+    failures = Array(ColorFailure)
 
 
 # noinspection PyMethodParameters
@@ -59,68 +116,92 @@ class ColorService(ServiceBase):
         :param color: A szín neve (RED, GREEN vagy BLUE)
         :return: Visszaigazolás az üzenet fogadásáról
         """
-        logger.info(f"Received color: {color}")
+        ingress_us = now_us()
+        logger.info("Received color: %s", color)
 
         # Ellenőrizzük, hogy a szín megfelelő-e
         if color not in ["RED", "GREEN", "BLUE"]:
             return f"Invalid color: {color}. Only RED, GREEN, or BLUE are supported."
 
         try:
-            # Kapcsolódás a RabbitMQ-hoz
-            """ nagy terhelés esetén az aszinkron alternatíva (pl. pika.SelectConnection) hatékonyabb lehet """
-            connection = pika.BlockingConnection(
-
-                pika.ConnectionParameters(
-                    host=RABBITMQ_HOST,
-                    port=RABBITMQ_PORT,
-                    credentials=pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASSWORD)
-                )
-            )
-            channel = connection.channel()
-            """
-            A RabbitMQ-val történő kommunikáció során a "csatorna" (channel) egy logikai kapcsolatot jelent 
-            a fizikai kapcsolaton belül. Azért kell csatornát létrehozni, mert:
-
-            Erőforrás-hatékonyság: Egy fizikai TCP kapcsolaton belül több logikai csatornát lehet létrehozni, 
-            ami sokkal erőforrás-hatékonyabb, mintha minden művelethez külön TCP kapcsolatot nyitnánk.
-            Párhuzamos kommunikáció: A csatornák lehetővé teszik, hogy egyidejűleg több kommunikációs folyamatot 
-            bonyolítsunk le ugyanazon a kapcsolaton.
-            Művelet-szeparáció: Különböző üzenetsorokkal vagy exchange-ekkel való kommunikációt különböző csatornákon 
-            keresztül kezelhetünk, ami elkülöníti a logikát.
-
-            A csatornát a connection.channel() hívással hozzuk létre, és minden RabbitMQ művelet 
-            (pl. üzenetsor létrehozása, üzenet küldése) ezen a csatornán keresztül történik.
-            """
-
-
-
-            # Üzenet küldése az üzenetsorba
-            # Csak a sor létrehozása
-            channel.queue_declare(queue=COLOR_QUEUE)
-
-            # Üzenet küldése a default exchange-en
-            channel.basic_publish(
-                exchange='',  # Default exchange
-                routing_key=COLOR_QUEUE,  # A sor neve
-                body=color,
-                properties=pika.BasicProperties(
-                    headers={'COLOR': color}
-                )
+            # Üzenet küldése (default exchange vagy headers exchange), a poolból kölcsönzött csatornán
+            publisher.publish(
+                exchange=PUBLISH_EXCHANGE,
+                routing_key=PUBLISH_ROUTING_KEY,
+                body=codec.body(color),
+                properties=codec.message_properties(color, ingress_us)
             )
 
-            # Kapcsolat lezárása
-            connection.close()
-
             return f"Color {color} successfully sent to the message queue"
         except Exception as e:
             logger.error(f"Error sending color to queue: {e}")
             return f"Error sending color to queue: {e}"
             # ezek a stringek válaszként mennek vissza a SOAP kliensnek.
 
+    @rpc(Array(Unicode), _returns=BatchSummary)
+    def send_colors_to_queue(ctx, colors):
+        """
+        Tömeges változat: egy SOAP borítékban sok szín érkezik, így a boríték feldolgozásának
+        és validálásának költsége sok üzenet között oszlik meg. Az elemeket egyetlen kölcsönzött
+        csatornán (confirm módban egy sorozatban, a visszaigazolásokat együtt követve) publikálja.
+
+        :param colors: A színek listája (RED, GREEN vagy BLUE)
+        :return: Összesítés az elfogadott és elutasított elemekről, a hibák elemenként
+        """
+        ingress_us = now_us()
+        colors = colors or []
+        logger.info("Received batch of %s colors", len(colors))
+
+        if len(colors) > MAX_BATCH_SIZE:
+            return BatchSummary(accepted=0, rejected=len(colors), failures=[
+                ColorFailure(index=-1, color=None, error=f"Batch too large: {len(colors)} items (max {MAX_BATCH_SIZE})")
+            ])
+
+        failures = []
+        valid = []
+        for index, color in enumerate(colors):
+            if color in SUPPORTED_COLORS:
+                valid.append((index, color))
+            else:
+                failures.append(ColorFailure(
+                    index=index, color=color,
+                    error=f"Invalid color: {color}. Only RED, GREEN, or BLUE are supported."
+                ))
+
+        # Egy sorozatban küldjük el (confirm módban a beállítástól függően a visszaigazolást is megvárva)
+        errors = publisher.publish_many([
+            (
+                PUBLISH_EXCHANGE,
+                PUBLISH_ROUTING_KEY,
+                codec.body(color),
+                codec.message_properties(color, ingress_us)
+            )
+            for _, color in valid
+        ])
+
+        sent = 0
+        for (index, color), error in zip(valid, errors):
+            if error is None:
+                sent += 1
+            else:
+                failures.append(ColorFailure(index=index, color=color, error=f"Error sending color to queue: {error}"))
+        if sent < len(valid):
+            logger.error(f"Error sending batch to queue: {len(valid) - sent} of {len(valid)} colors failed")
+            failures.sort(key=lambda failure: failure.index)
+
+        return BatchSummary(accepted=sent, rejected=len(colors) - sent, failures=failures)
+
+
 def run_soap_server():
     """
     Elindítja a SOAP webszolgáltatást.
     """
+    global publisher
+    # Prometheus metrikák: http://127.0.0.1:9102/metrics (METRICS_PORT=0 kikapcsolja)
+    serve_metrics(9102)
+    # RabbitMQ kapcsolatok és topológia egyszer, induláskor
+    publisher = create_publisher(declare_topology)
+
     # SOAP alkalmazás konfigurálása
     application = Application([ColorService],
                               tns='http://color.service.example',
@@ -134,12 +215,15 @@ def run_soap_server():
 
     wsgi_application = WsgiApplication(application)
 
-    # WSGI szerver elindítása
-    server = make_server('0.0.0.0', 8000, wsgi_application)
+    # WSGI szerver elindítása (kérésenként külön szálon)
+    server = make_threaded_server('0.0.0.0', 8000, wsgi_application)
     logger.info("SOAP Service started at http://localhost:8000")
     logger.info("WSDL available at http://localhost:8000/?wsdl")
 
-    server.serve_forever()
+    try:
+        server.serve_forever()
+    finally:
+        publisher.close()
 
 
 if __name__ == "__main__":
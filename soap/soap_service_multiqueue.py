@@ -1,10 +1,13 @@
 import os
 import logging
-from wsgiref.simple_server import make_server  #WSGI szerver
 # a SOAP szolgáltatásokat mindig valamilyen HTTP szerveren keresztül kell elérhetővé tenni,
 # mivel XML üzeneteiket HTTP protokollon keresztül továbbítják.
 
-import pika # RabbitMQ kliens
+from soap_publisher import create_publisher, make_threaded_server, COLOR_CODEC  # közös publisher pool és többszálú WSGI szerver
+from common.color_codec import ColorCodec
+from common.log_config import configure_logging
+from common.metrics import serve_metrics
+from common.tracing import now_us
 
 from spyne import Application, ServiceBase, rpc, Unicode
 """ SOAP webszolgáltatások létrehozására szolgáló Python könyvtár
@@ -24,7 +27,7 @@ from spyne.server.wsgi import WsgiApplication # WSGI kompatibilis alkalmazás-wr
     Hidat képez a SOAP alkalmazás és a HTTP webszerver között """
 
 # Beállítjuk a naplózást
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+configure_logging()
 logger = logging.getLogger("soap_service")
 logging.getLogger("pika").setLevel(logging.WARNING)
 
@@ -43,25 +46,28 @@ RABBITMQ_PORT = int(os.environ.get('RABBITMQ_PORT', 5672))
 RABBITMQ_USER = os.environ.get('RABBITMQ_USER', 'guest')
 RABBITMQ_PASSWORD = os.environ.get('RABBITMQ_PASS', 'guest')
 
-def setup_queues():
-    connection = pika.BlockingConnection(
-        pika.ConnectionParameters(
-            host=RABBITMQ_HOST,
-            port=RABBITMQ_PORT,
-            credentials=pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASSWORD)
-        )
-    )
-    channel = connection.channel()
-    channel.exchange_declare(exchange='color_exchange', exchange_type='direct')
+COLOR_EXCHANGE = 'color_exchange'
+
+# A szolgáltatás közös publisher poolja, a run_soap_server() hozza létre induláskor
+publisher = None
+
+# Előre kódolt törzsek és üzenettulajdonságok (a direct exchange a routing key alapján irányít, fejléc nem kell)
+codec = ColorCodec(COLOR_CODEC, color_header=False)
+
+
+def setup_queues(channel):
+    """
+    Az exchange és a színenkénti sorok egyszeri létrehozása induláskor
+    (újrakapcsolódáskor a pool újra lefuttatja).
+    """
+    channel.exchange_declare(exchange=COLOR_EXCHANGE, exchange_type='direct')
 
     colors = ['red', 'green', 'blue']
     for color in colors:
         queue_name = f'queue_{color}'
         routing_key = f'color.{color}'
         channel.queue_declare(queue=queue_name)
-        channel.queue_bind(exchange='color_exchange', queue=queue_name, routing_key=routing_key)
-
-    connection.close()
+        channel.queue_bind(exchange=COLOR_EXCHANGE, queue=queue_name, routing_key=routing_key)
 
 # noinspection PyMethodParameters
 class ColorService(ServiceBase):
@@ -77,54 +83,23 @@ class ColorService(ServiceBase):
         :param color: A szín neve (RED, GREEN vagy BLUE)
         :return: Visszaigazolás az üzenet fogadásáról
         """
-        logger.info(f"Received color: {color}")
+        ingress_us = now_us()
+        logger.info("Received color: %s", color)
 
         # Ellenőrizzük, hogy a szín megfelelő-e
         if color not in ["RED", "GREEN", "BLUE"]:
             return f"Invalid color: {color}. Only RED, GREEN, or BLUE are supported."
 
         try:
-            # Kapcsolódás a RabbitMQ-hoz
-            connection = pika.BlockingConnection(
-                pika.ConnectionParameters(
-                    host=RABBITMQ_HOST,
-                    port=RABBITMQ_PORT,
-                    credentials=pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASSWORD)
-                )
-            )
-            channel = connection.channel()
-
-            # Exchange létrehozása (ha még nincs)
-            channel.exchange_declare(exchange='color_exchange', exchange_type='direct')
-
-            # Üzenet küldése az exchange-be szín szerint
+            # Üzenet küldése az exchange-be szín szerint, a poolból kölcsönzött csatornán
             routing_key = f"color.{color.lower()}"  # pl. color.red
-            channel.basic_publish(
-                exchange='color_exchange',
+            publisher.publish(
+                exchange=COLOR_EXCHANGE,
                 routing_key=routing_key,
-                body=color
+                body=codec.body(color),
+                properties=codec.message_properties(color, ingress_us)
             )
 
-            connection.close()
-            """
-            A RabbitMQ-val történő kommunikáció során a "csatorna" (channel) egy logikai kapcsolatot jelent 
-            a fizikai kapcsolaton belül. Azért kell csatornát létrehozni, mert:
-
-            Erőforrás-hatékonyság: Egy fizikai TCP kapcsolaton belül több logikai csatornát lehet létrehozni, 
-            ami sokkal erőforrás-hatékonyabb, mintha minden művelethez külön TCP kapcsolatot nyitnánk.
-            Párhuzamos kommunikáció: A csatornák lehetővé teszik, hogy egyidejűleg több kommunikációs folyamatot 
-            bonyolítsunk le ugyanazon a kapcsolaton.
-            Művelet-szeparáció: Különböző üzenetsorokkal vagy exchange-ekkel való kommunikációt különböző csatornákon 
-            keresztül kezelhetünk, ami elkülöníti a logikát.
-
-            A csatornát a connection.channel() hívással hozzuk létre, és minden RabbitMQ művelet 
-            (pl. üzenetsor létrehozása, üzenet küldése) ezen a csatornán keresztül történik.
-            """
-
-
-
-
-
             return f"Color {color} successfully sent to the message queue"
         except Exception as e:
             logger.error(f"Error sending color to queue: {e}")
@@ -135,6 +110,12 @@ def run_soap_server():
     """
     Elindítja a SOAP webszolgáltatást.
     """
+    global publisher
+    # Prometheus metrikák: http://127.0.0.1:9102/metrics (METRICS_PORT=0 kikapcsolja)
+    serve_metrics(9102)
+    # RabbitMQ kapcsolatok, exchange és sorok egyszer, induláskor
+    publisher = create_publisher(setup_queues)
+
     # SOAP alkalmazás konfigurálása
     application = Application([ColorService],
                               tns='http://color.service.example',
@@ -148,14 +129,16 @@ def run_soap_server():
 
     wsgi_application = WsgiApplication(application)
 
-    # WSGI szerver elindítása
-    server = make_server('0.0.0.0', 8000, wsgi_application)
+    # WSGI szerver elindítása (kérésenként külön szálon)
+    server = make_threaded_server('0.0.0.0', 8000, wsgi_application)
     logger.info(f"SOAP Service started at http://0.0.0.0:8000")
     logger.info(f"WSDL available at http://0.0.0.0:8000/?wsdl")
 
-    server.serve_forever()
+    try:
+        server.serve_forever()
+    finally:
+        publisher.close()
 
 
 if __name__ == "__main__":
-    setup_queues()
     run_soap_server()
@@ -0,0 +1,161 @@
+"""
+Gördülő ablakos aggregálás a statisztika-klienshez.
+
+Minden (szín, kimenetel) párhoz ablakonként egy gyűrűpuffer tartozik. A puffer rögzített számú
+vödörből (bucket) áll, és mellette futó összeget tartunk, így egy frissítés O(1) (az elavult vödrök
+nullázása legfeljebb vödörszámnyi lépés, amortizáltan O(1)), a memória pedig rögzített.
+
+Alapértelmezett ablakok: 1s (10 x 100 ms), 1m (60 x 1 s), 5m (60 x 5 s), 1h (60 x 60 s).
+"""
+import math
+import time
+
+# név -> (ablak hossza másodpercben, vödrök száma)
+DEFAULT_WINDOWS = (
+    ("1s", 1.0, 10),
+    ("1m", 60.0, 60),
+    ("5m", 300.0, 60),
+    ("1h", 3600.0, 60),
+)
+
+
+class RollingCounter:
+    """
+    Egy ablak gyűrűpufferrel: az utolsó window_seconds másodperc összege, vödör pontossággal.
+    Mellette exponenciálisan súlyozott mozgóátlagot (EWMA) is számol a rátára, az ablak hosszával
+    mint időállandóval (mint a Unix load average).
+    """
+
+    __slots__ = ("window_seconds", "bucket_seconds", "buckets", "total", "_current", "_started",
+                 "ewma_rate", "_ewma_weight", "_ewma_time", "_ewma_pending")
+
+    def __init__(self, window_seconds, bucket_count, now=None):
+        now = time.monotonic() if now is None else now
+        self.window_seconds = window_seconds
+        self.bucket_seconds = window_seconds / bucket_count
+        self.buckets = [0] * bucket_count
+        self.total = 0
+        self._current = int(now // self.bucket_seconds)  # az aktuális vödör abszolút sorszáma
+        self._started = now
+        self.ewma_rate = 0.0
+        self._ewma_weight = 0.0  # torzítás-korrekció: induláskor ne a 0 kezdőérték húzza le az átlagot
+        self._ewma_time = now
+        self._ewma_pending = 0
+
+    def _advance(self, now):
+        """
+        Az eltelt időnek megfelelően nullázza a lejárt vödröket.
+        """
+        index = int(now // self.bucket_seconds)
+        if index <= self._current:
+            return
+        size = len(self.buckets)
+        if index - self._current >= size:
+            for i in range(size):
+                self.buckets[i] = 0
+            self.total = 0
+        else:
+            for absolute in range(self._current + 1, index + 1):
+                slot = absolute % size
+                self.total -= self.buckets[slot]
+                self.buckets[slot] = 0
+        self._current = index
+
+    def _update_ewma(self, now):
+        elapsed = now - self._ewma_time
+        if elapsed < self.bucket_seconds:
+            return
+        rate = self._ewma_pending / elapsed
+        alpha = 1.0 - math.exp(-elapsed / self.window_seconds)
+        self.ewma_rate += alpha * (rate - self.ewma_rate)
+        self._ewma_weight += alpha * (1.0 - self._ewma_weight)
+        self._ewma_time = now
+        self._ewma_pending = 0
+
+    def add(self, count, now=None):
+        now = time.monotonic() if now is None else now
+        self._advance(now)
+        self.buckets[self._current % len(self.buckets)] += count
+        self.total += count
+        self._ewma_pending += count
+        self._update_ewma(now)
+
+    def count(self, now=None):
+        now = time.monotonic() if now is None else now
+        self._advance(now)
+        return self.total
+
+    def rate(self, now=None):
+        """
+        Ráta (db/s) az ablakra. Induláskor, amíg az ablak nem telt meg, az eltelt idővel osztunk.
+        """
+        now = time.monotonic() if now is None else now
+        span = min(self.window_seconds, max(now - self._started, self.bucket_seconds))
+        return self.count(now) / span
+
+    def moving_average(self, now=None):
+        now = time.monotonic() if now is None else now
+        self._update_ewma(now)
+        return self.ewma_rate / self._ewma_weight if self._ewma_weight else 0.0
+
+
+class RollingStats:
+    """
+    Szín és kimenetel szerinti gördülő statisztikák, minden párhoz a DEFAULT_WINDOWS ablakaival.
+    """
+
+    def __init__(self, windows=DEFAULT_WINDOWS):
+        self.windows = windows
+        self._counters = {}  # (szín, kimenetel) -> {ablaknév: RollingCounter}
+        self.totals = {}     # (szín, kimenetel) -> összes darab az indulás óta
+
+    def add(self, color, outcome, count, now=None):
+        now = time.monotonic() if now is None else now
+        key = (color, outcome)
+        counters = self._counters.get(key)
+        if counters is None:
+            counters = self._counters[key] = {
+                name: RollingCounter(seconds, buckets, now) for name, seconds, buckets in self.windows
+            }
+            self.totals[key] = 0
+        for counter in counters.values():
+            counter.add(count, now)
+        self.totals[key] += count
+
+    def snapshot(self, now=None):
+        """
+        :return: {szín: {kimenetel: {"total": n, "1m": {"count": .., "rate": .., "avg_rate": ..}, ...}}}
+        """
+        now = time.monotonic() if now is None else now
+        result = {}
+        for (color, outcome), counters in sorted(self._counters.items()):
+            entry = {"total": self.totals[(color, outcome)]}
+            for name, counter in counters.items():
+                entry[name] = {
+                    "count": counter.count(now),
+                    "rate": counter.rate(now),
+                    "avg_rate": counter.moving_average(now)
+                }
+            result.setdefault(color, {})[outcome] = entry
+        return result
+
+    def rate(self, color, outcome, window, now=None):
+        """
+        Pl. rate("RED", "acked", "1m"): a RED nyugtázott üzenetek rátája az utolsó percben.
+        """
+        counters = self._counters.get((color, outcome))
+        return counters[window].rate(now) if counters else 0.0
+
+    def summary_lines(self, now=None):
+        """
+        Ember által olvasható összefoglaló, soronként egy (szín, kimenetel) pár.
+        """
+        lines = []
+        for color, by_outcome in self.snapshot(now).items():
+            for outcome, entry in by_outcome.items():
+                windows = " | ".join(
+                    f"{name} {entry[name]['count']} ({entry[name]['rate']:.1f}/s, avg {entry[name]['avg_rate']:.1f}/s)"
+                    for name, _, _ in self.windows
+                )
+                lines.append(f"{color} {outcome}: total {entry['total']} | {windows}")
+        return lines
@@ -1,9 +1,21 @@
 import os
+import re
+import sys
+import json
 import pika
 import logging
 
+from rolling_stats import RollingStats
+
+# A közös modulok (common/) a projekt gyökeréből érhetők el
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.stats_codec import STATS_CONTENT_TYPE, iter_raw, iter_histograms, COLOR_NAMES, OUTCOME_NAMES, LATENCY_KIND_NAMES
+from common.tracing import LatencyHistogram
+from common.transport import blocking_connection
+from common.log_config import configure_logging
+
 # Beállítjuk a naplózást
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+configure_logging()
 logger = logging.getLogger("statistics_client")
 logging.getLogger("pika").setLevel(logging.WARNING)
 
@@ -13,10 +25,13 @@ RABBITMQ_PORT = int(os.environ.get('RABBITMQ_PORT', 5672))
 RABBITMQ_USER = os.environ.get('RABBITMQ_USER', 'guest')
 RABBITMQ_PASSWORD = os.environ.get('RABBITMQ_PASS', 'guest')
 STATISTICS_QUEUE = 'colorStatistics'
+# Ilyen gyakran (másodperc) írjuk ki a gördülő ablakos összefoglalót
+SUMMARY_INTERVAL = float(os.environ.get('SUMMARY_INTERVAL', 10))
 
+# A régi, szöveges statisztika: "10 'RED' messages has been processed"
+LEGACY_STATISTICS = re.compile(r"^(\d+) '(\w+)' messages has been processed$")
 
 
-# noinspection PyMethodMayBeStatic
 class StatisticsClient:
     """
     Kliens, amely a statisztika üzenetsorból olvassa az üzeneteket.
@@ -26,8 +41,13 @@ class StatisticsClient:
         """
         Inicializálja a klienst és beállítja a kapcsolatot.
         """
+        # Színenkénti gördülő ablakos aggregálás (1s/1m/5m/1h)
+        self.stats = RollingStats()
+        # Végpontok közötti késleltetés (szín, fajta) szerint, az aktuális összefoglaló-időszakra
+        self.latency = {}
+
         # Kapcsolódás a RabbitMQ-hoz
-        self.connection = pika.BlockingConnection(
+        self.connection = blocking_connection(
             pika.ConnectionParameters(
                 host=RABBITMQ_HOST,
                 port=RABBITMQ_PORT,
@@ -46,19 +66,81 @@ class StatisticsClient:
             auto_ack=True
         )
 
+        # Időszakos összefoglaló a fogyasztó szálán (a BlockingConnection időzítőjével)
+        self.connection.call_later(SUMMARY_INTERVAL, self.print_summary)
+
         logger.info("Statistics Client started. Waiting for statistics...")
 
     def process_statistics(self, ch, method, properties, body):
         """
         Feldolgozza a statisztikai üzeneteket.
-        Megjegyzés: Bár ez a metódus nem használja a self paramétert,
-        a RabbitMQ callback-mechanizmusa miatt nem lehet statikus metódussá alakítani.
+        Az üzenetet a gördülő ablakos aggregálásba olvasztja; az összefoglalót a print_summary() írja ki.
 
         :param body: Az üzenet tartalma
         """
-        message = body.decode('utf-8')
-        logger.info(f"Statistics: {message}")
-        print(f"Statistics: {message}")  # Explicit kiírás a konzolra
+        try:
+            if properties.content_type == STATS_CONTENT_TYPE:
+                self.aggregate_binary(body)
+            else:
+                self.aggregate(body.decode('utf-8'))
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Unrecognized statistics message ({e}): {body[:200]!r}")
+
+    def aggregate_binary(self, body):
+        """
+        A bináris delta rekordokat (common.stats_codec) egyetlen menetben, másolás nélkül bontja ki.
+        """
+        for color, outcome, _reserved, _processor, count, *_ in iter_raw(body):
+            self.stats.add(COLOR_NAMES.get(color, str(color)), OUTCOME_NAMES.get(outcome, str(outcome)), count)
+        for color, kind, counts in iter_histograms(body):
+            self.merge_latency(COLOR_NAMES.get(color, str(color)), LATENCY_KIND_NAMES.get(kind, str(kind)), counts)
+
+    def aggregate(self, message):
+        """
+        A szöveges statisztikai rekordot beolvasztja a gördülő ablakokba.
+        Kezeli a hibakereséshez kérhető JSON delta rekordokat és a régi szöveges formát is.
+        """
+        logger.debug("Statistics: %s", message)
+        legacy = LEGACY_STATISTICS.match(message)
+        if legacy:
+            self.stats.add(legacy.group(2), 'acked', int(legacy.group(1)))
+            return
+
+        record = json.loads(message)
+        if record.get("type") != "color_stats":
+            raise ValueError(f"unknown record type {record.get('type')}")
+        for color, by_outcome in record["counts"].items():
+            for outcome, count in by_outcome.items():
+                self.stats.add(color, outcome, count)
+        for color, by_kind in record.get("latency", {}).items():
+            for kind, counts in by_kind.items():
+                self.merge_latency(color, kind, counts)
+
+    def merge_latency(self, color, kind, counts):
+        """
+        A feldolgozók hisztogramjait vödrönként összeadjuk, így a percentilis az összes feldolgozóra pontos.
+        """
+        histogram = self.latency.get((color, kind))
+        if histogram is None:
+            histogram = self.latency[(color, kind)] = LatencyHistogram()
+        histogram.merge(counts)
+
+    def print_summary(self):
+        """
+        Kiírja a színenkénti rátákat és az időszak késleltetés-percentiliseit, majd újraidőzíti önmagát.
+        """
+        for line in self.stats.summary_lines():
+            logger.info(f"Statistics: {line}")
+            print(f"Statistics: {line}")  # Explicit kiírás a konzolra
+        for (color, kind), histogram in sorted(self.latency.items()):
+            if not histogram.total:
+                continue
+            p50, p99, p999 = (histogram.percentile(q) / 1000 for q in (0.5, 0.99, 0.999))
+            line = f"{color} {kind} latency n={histogram.total} p50={p50:.2f}ms p99={p99:.2f}ms p999={p999:.2f}ms"
+            logger.info(f"Statistics: {line}")
+            print(f"Statistics: {line}")
+        self.latency = {}
+        self.connection.call_later(SUMMARY_INTERVAL, self.print_summary)
 
     def start(self):
         """
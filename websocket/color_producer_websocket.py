@@ -1,3 +1,5 @@
+import os
+import sys
 import asyncio
 import json
 import logging
@@ -5,13 +7,20 @@ import random
 import time
 import websockets
 
+# A közös modulok (common/) a projekt gyökeréből érhetők el
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.log_config import configure_logging
+
 # Beállítjuk a naplózást
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+configure_logging()
 logger = logging.getLogger("websocket_color_producer")
 
 # WebSocket szerver elérhetősége
 WEBSOCKET_URL = 'ws://localhost:8765'  # Docker környezetben ez 'ws://websocket_service:8765' lesz
 
+# Pipeline mód: ennyi szín lehet egyszerre úton nyugta nélkül (0 = egyszerű, üzenetenként váró mód)
+PIPELINE_WINDOW = int(os.environ.get('PIPELINE_WINDOW', 0))
+
 
 def generate_random_color():
     """
@@ -22,6 +31,63 @@ def generate_random_color():
     return random.choice(colors)
 
 
+async def run_pipelined(websocket, window_size):
+    """
+    Pipeline mód: a színeket "id"-vel küldjük, nem várunk minden egyes válaszra.
+    Legfeljebb window_size szín lehet úton; a nyugták (ack / batch_ack / nack) tetszőleges sorrendben jönnek.
+    """
+    window = asyncio.Semaphore(window_size)
+    pending = {}  # id -> szín
+    stats = {"acked": 0, "failed": 0}
+    start_time = time.time()
+
+    async def sender():
+        next_id = 0
+        while True:
+            await window.acquire()
+            color = generate_random_color()
+            pending[next_id] = color
+            await websocket.send(json.dumps({"id": next_id, "color": color}))
+            next_id += 1
+
+    async def receiver():
+        async for response in websocket:
+            response_data = json.loads(response)
+            response_type = response_data.get("type")
+
+            if response_type == "batch_ack":
+                ids = response_data["ids"]
+            elif response_type in ("ack", "nack"):
+                ids = [response_data["id"]]
+            else:
+                logger.info("Server says: %s", response_data.get('message'))
+                continue
+
+            for frame_id in ids:
+                if pending.pop(frame_id, None) is not None:
+                    window.release()
+
+            if response_type == "nack":
+                stats["failed"] += 1
+                logger.error(f"Color id {ids[0]} failed: {response_data['message']}")
+                continue
+
+            previous = stats["acked"]
+            stats["acked"] += len(ids)
+            # Nagyjából minden 1000. nyugtánál naplózunk
+            if stats["acked"] // 1000 != previous // 1000:
+                elapsed = time.time() - start_time
+                rate = stats["acked"] / elapsed
+                logger.info(f"Acked {stats['acked']} colors in {elapsed:.2f} seconds ({rate:.2f} colors/sec), "
+                            f"{stats['failed']} failed, {len(pending)} in flight")
+
+    sender_task = asyncio.create_task(sender())
+    try:
+        await receiver()
+    finally:
+        sender_task.cancel()
+
+
 async def connect_websocket():
     """
     Kapcsolódás a WebSocket szerverhez és színek küldése
@@ -32,7 +98,15 @@ async def connect_websocket():
 
             # Üdvözlő üzenet fogadása
             response = await websocket.recv()
-            logger.info(f"Server says: {response}")
+            logger.info("Server says: %s", response)
+
+            if PIPELINE_WINDOW > 0:
+                # A szerver által hirdetett ablaknál többet nem érdemes úton tartani
+                server_window = json.loads(response).get("pipeline_window", PIPELINE_WINDOW)
+                window_size = min(PIPELINE_WINDOW, server_window)
+                logger.info(f"Pipelined mode, window size: {window_size}")
+                await run_pipelined(websocket, window_size)
+                raise ConnectionError("WebSocket connection closed by server")
 
             send_count = 0
             start_time = time.time()
@@ -1,12 +1,21 @@
+import os
+import sys
 import asyncio
 import websockets
 import json
 import logging
-import pika
-import concurrent.futures
+
+# A közös modulok (common/) a projekt gyökeréből érhetők el
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.async_publisher import AsyncPublisher
+from common.color_codec import ColorCodec
+from common.confirm_publisher import CONFIRMS_OFF, CONFIRMS_WAIT, validate_confirms
+from common.log_config import configure_logging
+from common.metrics import serve_metrics
+from common.tracing import now_us
 
 # Beállítjuk a naplózást
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+configure_logging()
 logger = logging.getLogger("new_websocket_service")
 
 # RabbitMQ kapcsolati adatok
@@ -16,41 +25,44 @@ RABBITMQ_USER = 'guest'
 RABBITMQ_PASSWORD = 'guest'
 COLOR_QUEUE = 'colorQueue'  # Visszaállítottuk az eredeti névformátumot
 
-# Létrehozunk egy thread pool executort a blokkoló műveletek számára
-executor = concurrent.futures.ThreadPoolExecutor(max_workers=10)
+PUBLISHER_CHANNELS = int(os.environ.get('PUBLISHER_CHANNELS', 4))
+# Broker-visszaigazolás: off | async | wait (frame-enként felülírható: {"color": "RED", "confirm": true})
+PUBLISHER_CONFIRMS = validate_confirms(os.environ.get('PUBLISHER_CONFIRMS', CONFIRMS_OFF))
+MAX_IN_FLIGHT = int(os.environ.get('MAX_IN_FLIGHT', 1000))
+CONFIRM_TIMEOUT = float(os.environ.get('CONFIRM_TIMEOUT', 30))
+SUPPORTED_COLORS = frozenset(["RED", "GREEN", "BLUE"])
+# Üzenetformátum: text (a régi "RED" törzs, alapértelmezés) vagy binary (1 bájtos színkód, ha már minden
+# fogyasztó a common.color_codec dekódolóját használja)
+COLOR_CODEC = os.environ.get('COLOR_CODEC', 'text')
+codec = ColorCodec(COLOR_CODEC, color_header=False)
+
+# Pipeline mód: a kliens "id"-vel jelölt frame-eket küld, a szerver ennyit publikál egyszerre kapcsolatonként
+PIPELINE_WINDOW = int(os.environ.get('PIPELINE_WINDOW', 256))
+# Egy batch_ack frame-be legfeljebb ennyi nyugta kerül
+ACK_BATCH_MAX = int(os.environ.get('ACK_BATCH_MAX', 512))
+
+# Egyetlen, hosszú életű asyncio-natív kapcsolat több csatornával; a main() hozza létre
+publisher = None
 
 
-def send_to_rabbitmq(color):
+async def declare_color_queue(channel):
     """
-    Üzenet küldése a RabbitMQ-ba (ez egy blokkoló művelet, külön szálban kell futtatni)
+    Üzenetsor létrehozása, ha még nem létezik (kapcsolódáskor egyszer).
     """
-    try:
-        # Létrehozzuk a RabbitMQ kapcsolati paramétereket
-        parameters = pika.ConnectionParameters(
-            host=RABBITMQ_HOST,
-            port=RABBITMQ_PORT,
-            credentials=pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASSWORD),
-            connection_attempts=3,
-            retry_delay=1
-        )
-
-        # Kapcsolódás a RabbitMQ-hoz
-        connection = pika.BlockingConnection(parameters)
-        channel = connection.channel()
-
-        # Üzenetsor létrehozása, ha még nem létezik
-        channel.queue_declare(queue=COLOR_QUEUE)
-
-        # Üzenet küldése az üzenetsorba
-        channel.basic_publish(
-            exchange='',
-            routing_key=COLOR_QUEUE,
-            body=color
-        )
-
-        # Kapcsolat lezárása
-        connection.close()
+    await channel.declare_queue(COLOR_QUEUE)
+
 
+async def send_to_rabbitmq(color, wait_confirm=None, ingress_us=None):
+    """
+    Üzenet küldése a RabbitMQ-ba a közös async publisheren keresztül (nem blokkol, nincs szálváltás)
+
+    :param wait_confirm: confirm módban megvárjuk-e a broker visszaigazolását (None = PUBLISHER_CONFIRMS szerint)
+    :param ingress_us: a frame beérkezésének ideje (common.tracing), a késleltetés-méréshez
+    """
+    try:
+        headers, message_id = codec.message_headers(color, ingress_us)
+        await publisher.publish(routing_key=COLOR_QUEUE, body=codec.body(color), headers=headers,
+                                content_type=codec.content_type, wait=wait_confirm, message_id=message_id)
         return {"success": True, "message": f"Color {color} successfully sent to the message queue"}
 
     except Exception as e:
@@ -58,38 +70,114 @@ def send_to_rabbitmq(color):
         return {"success": False, "message": f"Error: {str(e)}"}
 
 
+async def publish_pipelined(frame_id, color, wait_confirm, window, acks, ingress_us=None):
+    """
+    Pipeline módban egy szín publikálása; az eredmény az ack sorba kerül, a sorrend nem garantált.
+    """
+    try:
+        result = await send_to_rabbitmq(color, wait_confirm, ingress_us)
+        await acks.put((frame_id, None if result["success"] else result["message"]))
+    finally:
+        window.release()
+
+
+async def write_acks(websocket, acks):
+    """
+    Kiírja a nyugtákat a kliensnek. Ami egyszerre rendelkezésre áll, azt egyetlen batch_ack frame-be vonja össze;
+    a hibák külön nack frame-ben mennek. A None jelzi, hogy nincs több nyugta.
+
+    Frame-ek:
+        {"type": "ack", "id": 17}
+        {"type": "batch_ack", "ids": [17, 18, 20]}
+        {"type": "nack", "id": 19, "message": "..."}
+    """
+    done = False
+    while not done:
+        batch = [await acks.get()]
+        while len(batch) < ACK_BATCH_MAX and not acks.empty():
+            batch.append(acks.get_nowait())
+
+        ids = []
+        for item in batch:
+            if item is None:
+                done = True
+                continue
+            frame_id, error = item
+            if error is None:
+                ids.append(frame_id)
+            else:
+                await websocket.send(json.dumps({"type": "nack", "id": frame_id, "message": error}))
+
+        if len(ids) == 1:
+            await websocket.send(json.dumps({"type": "ack", "id": ids[0]}))
+        elif ids:
+            await websocket.send(json.dumps({"type": "batch_ack", "ids": ids}))
+
+
 async def handle_websocket(websocket):
     """
     WebSocket kapcsolat kezelése
+
+    Két protokollmódot támogat ugyanazon a kapcsolaton:
+    - egyszerű mód: {"color": "RED"} -> minden frame-re sorrendben egy success/error válasz
+    - pipeline mód: {"id": 17, "color": "RED"} -> a szerver legfeljebb PIPELINE_WINDOW színt publikál
+      párhuzamosan, a nyugták (ack / batch_ack / nack) az id alapján, tetszőleges sorrendben érkeznek vissza
     """
+    window = asyncio.Semaphore(PIPELINE_WINDOW)
+    acks = asyncio.Queue()
+    in_flight = set()
+    ack_writer = None
+
     try:
         # Üdvözlő üzenet küldése
         await websocket.send(json.dumps({
             "type": "info",
-            "message": "Connected to WebSocket Color Service"
+            "message": "Connected to WebSocket Color Service",
+            "pipeline_window": PIPELINE_WINDOW
         }))
 
         # Üzenetek fogadása és kezelése
         async for message in websocket:
+            ingress_us = now_us()
             try:
                 # Üzenet feldolgozása
                 data = json.loads(message)
 
-                if 'color' in data:
+                if isinstance(data, dict) and 'id' in data:
+                    # Pipeline mód
+                    if ack_writer is None:
+                        ack_writer = asyncio.create_task(write_acks(websocket, acks))
+
+                    frame_id = data['id']
+                    color = data.get('color')
+                    if not isinstance(color, str) or color not in SUPPORTED_COLORS:
+                        error = "Missing color parameter" if color is None else \
+                            f"Invalid color: {color}. Only RED, GREEN, or BLUE are supported."
+                        await acks.put((frame_id, error))
+                        continue
+
+                    # Ha tele az ablak, nem olvasunk tovább a socketről (backpressure a kliens felé)
+                    await window.acquire()
+                    task = asyncio.create_task(
+                        publish_pipelined(frame_id, color, data.get('confirm'), window, acks, ingress_us)
+                    )
+                    in_flight.add(task)
+                    task.add_done_callback(in_flight.discard)
+
+                elif 'color' in data:
                     color = data['color']
-                    logger.info(f"Received color: {color}")
+                    logger.info("Received color: %s", color)
 
                     # Ellenőrizzük, hogy a szín megfelelő-e
-                    if color not in ["RED", "GREEN", "BLUE"]:
+                    if color not in SUPPORTED_COLORS:
                         await websocket.send(json.dumps({
                             "type": "error",
                             "message": f"Invalid color: {color}. Only RED, GREEN, or BLUE are supported."
                         }))
                         continue
 
-                    # Küldés a RabbitMQ-ba külön szálban
-                    loop = asyncio.get_running_loop()
-                    result = await loop.run_in_executor(executor, lambda: send_to_rabbitmq(color))
+                    # Küldés a RabbitMQ-ba közvetlenül az event loopon
+                    result = await send_to_rabbitmq(color, data.get('confirm'), ingress_us)
 
                     if result["success"]:
                         await websocket.send(json.dumps({
@@ -124,23 +212,48 @@ async def handle_websocket(websocket):
         logger.info(f"Connection closed: {e}")
     except Exception as e:
         logger.error(f"WebSocket handling error: {e}")
+    finally:
+        # A már elfogadott színek publikálását befejezzük, majd a maradék nyugtákat még megpróbáljuk kiírni
+        if in_flight:
+            await asyncio.gather(*in_flight, return_exceptions=True)
+        if ack_writer is not None:
+            await acks.put(None)
+            try:
+                await ack_writer
+            except websockets.exceptions.ConnectionClosed:
+                pass
 
 
 async def main():
+    global publisher
+    # Prometheus metrikák: http://127.0.0.1:9103/metrics (METRICS_PORT=0 kikapcsolja)
+    serve_metrics(9103)
+    # RabbitMQ kapcsolat egyszer, induláskor
+    publisher = await AsyncPublisher(
+        RABBITMQ_HOST, RABBITMQ_PORT, RABBITMQ_USER, RABBITMQ_PASSWORD,
+        channels=PUBLISHER_CHANNELS,
+        setup=declare_color_queue,
+        confirms=PUBLISHER_CONFIRMS != CONFIRMS_OFF,
+        wait_by_default=PUBLISHER_CONFIRMS == CONFIRMS_WAIT,
+        max_in_flight=MAX_IN_FLIGHT,
+        confirm_timeout=CONFIRM_TIMEOUT
+    ).connect()
+
     # WebSocket szerver indítása
     host = '0.0.0.0'
     port = 8765
 
-    async with websockets.serve(handle_websocket, host, port):
-        logger.info(f"WebSocket server is running at ws://{host}:{port}")
-        # Várunk addig, amíg leállítják a szervert
-        await asyncio.Future()  # Ez egy soha nem teljesülő jövő, hacsak nem szakítják meg
+    try:
+        async with websockets.serve(handle_websocket, host, port):
+            logger.info(f"WebSocket server is running at ws://{host}:{port}")
+            # Várunk addig, amíg leállítják a szervert
+            await asyncio.Future()  # Ez egy soha nem teljesülő jövő, hacsak nem szakítják meg
+    finally:
+        await publisher.close()
 
 
 if __name__ == "__main__":
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
-        logger.info("Server stopped by user")
-    finally:
-        executor.shutdown(wait=False)
\ No newline at end of file
+        logger.info("Server stopped by user")
\ No newline at end of file